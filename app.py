@@ -1,13 +1,24 @@
-from flask import Flask, render_template, request, redirect, session, jsonify, Response
+from flask import Flask, render_template, request, redirect, session, jsonify, Response, make_response, stream_with_context
 import os
 import datetime
+import json
+import time
+import logging
 import sqlite3
 import db
-from werkzeug.utils import secure_filename
+import attendance
+import config
 
+import face_detection
 import photo_capture
-import photo_compare
 import face_recognition_module
+import checkin
+import bulk_enroll
+import checkin_jobs
+import stream_checkin
+import face_templates
+import gallery_cache
+import metrics
 
 app = Flask(__name__)
 app.secret_key = "secret"
@@ -15,6 +26,9 @@ app.secret_key = "secret"
 TMP_DIR = "tmp"
 os.makedirs(TMP_DIR, exist_ok=True)
 
+# Каскад Хаара проверяется и загружается один раз при старте
+face_detection.get_cascade_pool()
+
 
 def require_admin():
     return session.get("is_admin") is True
@@ -23,7 +37,7 @@ def require_admin():
 # ---------- Главная: пользовательская страница ----------
 @app.route("/")
 def home():
-    events = db.query("SELECT id, title FROM events ORDER BY id DESC", fetch=True)
+    events = db.read("SELECT id, title FROM events ORDER BY id DESC")
     return render_template("user.html", events=events, error=None, success=None)
 
 
@@ -38,10 +52,9 @@ def login_admin():
     username = request.form["username"]
     password = request.form["password"]
 
-    row = db.query(
+    row = db.read_one(
         "SELECT 1 FROM admin WHERE username=? AND password=?",
-        (username, password),
-        fetch=True
+        (username, password)
     )
     if not row:
         return "Ошибка авторизации"
@@ -59,14 +72,13 @@ def logout():
 # ---------- Отдать фото участника из БД (для миниатюр) ----------
 @app.route("/participant_photo/<int:pid>")
 def participant_photo(pid: int):
-    row = db.query(
+    row = db.read_one(
         "SELECT photo_blob, photo_mime FROM participants WHERE id=?",
-        (pid,),
-        fetch=True
+        (pid,)
     )
     if not row:
         return "Not found", 404
-    return Response(row[0]["photo_blob"], mimetype=row[0]["photo_mime"])
+    return Response(row["photo_blob"], mimetype=row["photo_mime"])
 
 
 # ---------- ADMIN ----------
@@ -75,8 +87,8 @@ def admin():
     if not require_admin():
         return redirect("/login")
 
-    events = db.query("SELECT id, title FROM events ORDER BY id DESC", fetch=True)
-    participants = db.query("SELECT id, login, name FROM participants ORDER BY id DESC", fetch=True)
+    events = db.read("SELECT id, title FROM events ORDER BY id DESC")
+    participants = db.read("SELECT id, login, name FROM participants ORDER BY id DESC")
     return render_template("admin.html", events=events, participants=participants)
 
 
@@ -89,7 +101,7 @@ def add_event():
     if not title:
         return jsonify({"status": "error", "msg": "empty title"}), 400
 
-    db.query("INSERT INTO events(title) VALUES (?)", (title,))
+    db.execute("INSERT INTO events(title) VALUES (?)", (title,))
     return jsonify({"status": "ok"})
 
 
@@ -98,6 +110,8 @@ def add_participant():
     """
     Создать участника: login + (name) + photo (обязательно)
     Фото хранится В БАЗЕ (BLOB).
+    Если такое же лицо уже есть у другого участника — 409 DUPLICATE_FACE
+    со списком совпадений; force=1 — добавить всё равно.
     """
     if not require_admin():
         return jsonify({"status": "forbidden"}), 403
@@ -125,29 +139,19 @@ def add_participant():
 
     mime = "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png"
 
-    # --- проверка лица через временный файл ---
-    tmp_path = os.path.join(TMP_DIR, f"admin_check_{login}{ext}")
-    with open(tmp_path, "wb") as out:
-        out.write(raw)
-
+    # --- проверка лица: фото декодируется прямо из памяти ---
+    # детекция выполняется один раз: и для проверки, и для шаблона
+    recognizer = face_recognition_module.get_recognizer()
     try:
-        ok = photo_capture.validate_face(tmp_path)
+        detection = recognizer.detect(raw)
+        ok = photo_capture.validate_detection(detection)
     except Exception as e:
-        try:
-            os.remove(tmp_path)
-        except:
-            pass
         return jsonify({
             "status": "error",
             "code": "FACE_CHECK_FAILED",
             "msg": f"Не удалось проверить фото: {str(e)}"
         }), 400
 
-    try:
-        os.remove(tmp_path)
-    except:
-        pass
-
     if not ok:
         return jsonify({
             "status": "error",
@@ -155,138 +159,245 @@ def add_participant():
             "msg": "На фото не обнаружено лицо человека (или лиц больше одного)."
         }), 400
 
-    # --- сохраняем в БД ---
+    # --- шаблон признаков считается один раз, при добавлении ---
+    template = recognizer.build_template(detection.face_roi())
+
+    # --- то же лицо уже зарегистрировано под другим логином? ---
+    force = request.form.get("force", "").lower() in ("1", "true", "yes")
+    if config.DUPLICATE_PHASH_RADIUS > 0 and not force:
+        duplicates = face_templates.find_duplicates(template, config.DUPLICATE_PHASH_RADIUS)
+        if duplicates:
+            return jsonify({
+                "status": "error",
+                "code": "DUPLICATE_FACE",
+                "msg": "Похожее лицо уже зарегистрировано. Отправьте с force=1, чтобы всё равно добавить.",
+                "matches": duplicates
+            }), 409
+
+    # --- сохраняем в БД: участник, шаблон и версия галереи — одной транзакцией ---
     try:
-        db.query(
-            "INSERT INTO participants(login,name,photo_blob,photo_ext,photo_mime) VALUES (?,?,?,?,?)",
-            (login, name, sqlite3.Binary(raw), ext, mime)
-        )
-        return jsonify({"status": "ok"})
-    except:
+        with db.transaction():
+            participant_id = db.insert(
+                "INSERT INTO participants(login,name,photo_blob,photo_ext,photo_mime) VALUES (?,?,?,?,?)",
+                (login, name, sqlite3.Binary(raw), ext, mime)
+            )
+            face_templates.save_template(participant_id, template)
+            version = face_templates.bump_version()
+    except sqlite3.IntegrityError:
         return jsonify({"status": "error", "msg": "login exists"}), 400
 
+    # --- обновляем кэш галереи (другие процессы заметят новую версию) ---
+    gallery_cache.get_gallery_cache().add(participant_id, login, name, template, version)
+    return jsonify({"status": "ok"})
+
+
+@app.route("/admin/bulk_enroll", methods=["POST"])
+def bulk_enroll_participants():
+    """
+    Массовое добавление участников: csv (login, name, photo) + archive (ZIP с фото).
+    force=1 — не проверять повторную регистрацию лица, dry_run=1 — только проверить.
+    Ответ — отчёт по каждой строке CSV (см. bulk_enroll.enroll).
+    """
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    f_csv = request.files.get("csv")
+    f_zip = request.files.get("archive")
+    if not f_csv or f_csv.filename == "":
+        return jsonify({"status": "error", "msg": "no csv"}), 400
+    if not f_zip or f_zip.filename == "":
+        return jsonify({"status": "error", "msg": "no archive"}), 400
+
+    force = request.form.get("force", "").lower() in ("1", "true", "yes")
+    dry_run = request.form.get("dry_run", "").lower() in ("1", "true", "yes")
+
+    try:
+        rows = bulk_enroll.read_manifest(f_csv.read().decode("utf-8-sig"))
+        source = bulk_enroll.PhotoSource(f_zip.stream)
+    except UnicodeDecodeError:
+        return jsonify({"status": "error", "msg": "csv must be utf-8"}), 400
+    except bulk_enroll.BulkError as e:
+        return jsonify({"status": "error", "msg": str(e)}), 400
+
+    try:
+        with metrics.timer("bulk_enroll"):
+            report = bulk_enroll.enroll(rows, source, force=force, dry_run=dry_run)
+    finally:
+        source.close()
+    return jsonify(report)
+
+
+@app.route("/admin/gallery_stats")
+def gallery_stats():
+    """Состояние кэша галереи: попадания/промахи, размер, память."""
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    return jsonify(gallery_cache.get_gallery_cache().stats())
+
+
+@app.route("/admin/detector_stats")
+def detector_stats():
+    """Пул каскадов Хаара: время загрузки и время детекции."""
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    return jsonify(face_detection.get_cascade_pool().stats())
+
+
+@app.route("/admin/match_stats")
+def match_stats():
+    """Отсечение при 1:N сравнении (MATCH_PRUNE): сколько SSIM/ORB пропущено."""
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    return jsonify(face_recognition_module.get_recognizer().prune_stats())
+
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    """Метрики в текстовом формате Prometheus: этапы /register, исходы, кэш, детектор."""
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    text = metrics.get_registry().render({
+        "gallery": gallery_cache.get_gallery_cache().stats(),
+        "detector": face_detection.get_cascade_pool().stats(),
+        "prune": face_recognition_module.get_recognizer().prune_stats(),
+        "checkin": checkin_jobs.get_job_queue().stats(),
+        "db": db.stats(),
+    })
+    return Response(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/admin/metrics.json")
+def admin_metrics_json():
+    """Сводка по этапам: число замеров и p50/p90/p99, мс."""
+    if not require_admin():
+        return jsonify({"status": "forbidden"}), 403
+
+    return jsonify(metrics.get_registry().stages())
+
 
 @app.route("/admin/get_attendance")
 def get_attendance():
+    """
+    Страница журнала, новые отметки первыми.
+    Параметры (опционально): after_id — next_after_id из предыдущего ответа,
+    limit — строк на странице (по умолчанию attendance.PAGE_SIZE).
+    """
     if not require_admin():
         return jsonify({"status": "forbidden"}), 403
 
-    data = db.query("""
-        SELECT p.login, COALESCE(p.name,''), e.title, a.timestamp, a.match_score
-        FROM attendance a
-        JOIN participants p ON p.id = a.participant_id
-        JOIN events e ON e.id = a.event_id
-        ORDER BY a.id DESC
-    """, fetch=True)
+    try:
+        data, next_after_id = attendance.page(
+            after_id=request.args.get("after_id", type=int),
+            limit=request.args.get("limit", attendance.PAGE_SIZE, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "msg": str(e)}), 400
 
-    return jsonify([list(x) for x in data])
+    return jsonify({
+        "status": "ok",
+        "records": [[x["login"], x["name"] or "", x["event_title"], x["timestamp"], x["match_score"]] for x in data],
+        "next_after_id": next_after_id,
+    })
 
 
 @app.route("/admin/export_attendance")
 def export_attendance():
     """
-    Выгрузка журнала посещаемости в JSON-файл с фильтрами.
+    Выгрузка журнала посещаемости с фильтрами.
     Параметры (опционально):
       - participant_id: ID участника
       - event_id: ID мероприятия
       - date_from: дата начала (YYYY-MM-DD)
       - date_to: дата окончания (YYYY-MM-DD)
+      - after_id: начать после этой записи (продолжить прерванную выгрузку)
+      - format: json (по умолчанию) — файл в tmp/, ответ с путём;
+        ndjson или csv — файл отдаётся клиенту потоком (chunked), по мере чтения журнала
+      - gzip=1: для ndjson/csv — сжимать поток на лету (.gz)
+      - limit: для json — выгрузить одну страницу (см. /admin/get_attendance);
+        без limit выгружаются все подходящие записи
     """
     if not require_admin():
         return jsonify({"status": "forbidden"}), 403
 
     # Получаем параметры фильтров
-    participant_id = request.args.get("participant_id", type=int)
-    event_id = request.args.get("event_id", type=int)
-    date_from = request.args.get("date_from")
-    date_to = request.args.get("date_to")
-
-    # Строим SQL-запрос с учётом фильтров
-    sql = """
-        SELECT 
-            a.id,
-            p.id as participant_id,
-            p.login,
-            p.name,
-            e.id as event_id,
-            e.title as event_title,
-            a.timestamp,
-            a.match_score
-        FROM attendance a
-        JOIN participants p ON p.id = a.participant_id
-        JOIN events e ON e.id = a.event_id
-        WHERE 1=1
-    """
-    params = []
-
-    if participant_id:
-        sql += " AND p.id = ?"
-        params.append(participant_id)
-    
-    if event_id:
-        sql += " AND e.id = ?"
-        params.append(event_id)
-    
-    if date_from:
-        sql += " AND DATE(a.timestamp) >= ?"
-        params.append(date_from)
-    
-    if date_to:
-        sql += " AND DATE(a.timestamp) <= ?"
-        params.append(date_to)
-
-    sql += " ORDER BY a.timestamp DESC"
-
-    data = db.query(sql, params, fetch=True)
-
-    # Формируем JSON-структуру
-    result = {
+    filters = {
+        "participant_id": request.args.get("participant_id", type=int),
+        "event_id": request.args.get("event_id", type=int),
+        "date_from": request.args.get("date_from"),
+        "date_to": request.args.get("date_to"),
+    }
+    after_id = request.args.get("after_id", type=int)
+    limit = request.args.get("limit", type=int)
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "ndjson", "csv"):
+        return jsonify({"status": "error", "msg": "format must be json, ndjson or csv"}), 400
+
+    # Страницы журнала: одна (limit) или все подходящие записи
+    try:
+        if limit is not None and fmt == "json":
+            data, next_after_id = attendance.page(**filters, after_id=after_id, limit=limit)
+            pages = [data]
+        else:
+            pages, next_after_id = attendance.batches(**filters, after_id=after_id), None
+    except ValueError as e:
+        return jsonify({"status": "error", "msg": str(e)}), 400
+
+    export_filename = f"attendance_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+    if fmt != "json":
+        chunks = attendance.ndjson_chunks(pages) if fmt == "ndjson" else attendance.csv_chunks(pages)
+        mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+        if request.args.get("gzip", 0, type=int):
+            chunks = attendance.gzip_chunks(chunks)
+            export_filename += ".gz"
+            mimetype = "application/gzip"
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{export_filename}"'},
+        )
+
+    meta = {
         "export_date": str(datetime.datetime.now()),
-        "filters": {
-            "participant_id": participant_id,
-            "event_id": event_id,
-            "date_from": date_from,
-            "date_to": date_to
-        },
-        "total_records": len(data),
-        "records": [
-            {
-                "id": row["id"],
-                "participant": {
-                    "id": row["participant_id"],
-                    "login": row["login"],
-                    "name": row["name"]
-                },
-                "event": {
-                    "id": row["event_id"],
-                    "title": row["event_title"]
-                },
-                "timestamp": row["timestamp"],
-                "match_score": row["match_score"]
-            }
-            for row in data
-        ]
+        "filters": filters,
+        "next_after_id": next_after_id,
     }
 
-    # Сохраняем в файл
-    export_filename = f"attendance_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    # Сохраняем в файл по страницам (в памяти — одна страница)
     export_path = os.path.join("tmp", export_filename)
-    
-    import json
-    with open(export_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    with open(export_path + ".part", "w", encoding="utf-8") as f:
+        total = attendance.write_json(f, meta, pages)
+    os.replace(export_path + ".part", export_path)
 
     return jsonify({
         "status": "ok",
         "filename": export_filename,
         "path": export_path,
-        "total_records": len(data)
+        "total_records": total,
+        "next_after_id": next_after_id
     })
 
 
 # ---------- USER: регистрация на событие ----------
 @app.route("/register", methods=["POST"])
 def register():
+    """
+    Регистрация по фото: время запроса и исход — в метрики (/admin/metrics).
+    При CHECKIN_ASYNC исход поставленной задачи считает исполнитель (checkin_jobs).
+    """
+    with metrics.timer("register"):
+        response = make_response(_register())
+    payload = response.get_json(silent=True) or {}
+    if payload.get("status") != "queued":
+        metrics.inc("register_requests", status=payload.get("status", "unknown"))
+    return response
+
+
+def _register():
     # form-data (обычная HTML-форма)
     event_id = request.form.get("event_id", type=int)
     name = (request.form.get("name") or "").strip()
@@ -311,100 +422,112 @@ def register():
     if not raw:
         return jsonify({"status": "error", "msg": "empty file"}), 400
 
-    # сохраняем во временный файл
-    tmp_path = os.path.join(TMP_DIR, f"user_upload_{secure_filename(name)}{ext}")
-    with open(tmp_path, "wb") as out:
-        out.write(raw)
+    if config.CHECKIN_ASYNC:
+        # Фото проверяется сразу (bad_photo — без очереди), сравнение — в фоновом
+        # пуле; клиент опрашивает статус или подписывается на SSE
+        template, rejected = checkin.prepare(raw)
+        if rejected is not None:
+            payload, code = rejected
+            return jsonify(payload), code
+        try:
+            job = checkin_jobs.get_job_queue().submit(event_id, template)
+        except checkin_jobs.QueueFull:
+            response = jsonify({"status": "busy", "msg": "too many requests, try again"})
+            response.headers["Retry-After"] = str(config.CHECKIN_RETRY_AFTER)
+            return response, 429
+        return jsonify({
+            "status": "queued",
+            "job_id": job.id,
+            "status_url": f"/register/jobs/{job.id}",
+            "events_url": f"/register/jobs/{job.id}/events",
+        }), 202
 
-    # 1) проверка лица
-    try:
-        ok = photo_capture.validate_face(tmp_path)
-    except Exception as e:
-        try: os.remove(tmp_path)
-        except: pass
-        return jsonify({"status": "error", "msg": f"face check failed: {str(e)}"}), 400
+    payload, code = checkin.check_in(event_id, raw)
+    return jsonify(payload), code
 
-    if not ok:
-        try: os.remove(tmp_path)
-        except: pass
-        return jsonify({"status": "bad_photo", "msg": "no face / bad quality"}), 200
 
-    # 2) сверяем со ВСЕМИ эталонными фото из БД и находим лучшее совпадение
-    participants = db.query("SELECT id, login, name, photo_blob, photo_ext FROM participants", fetch=True)
+@app.route("/register/group", methods=["POST"])
+def register_group():
+    """Групповая регистрация: все лица на одном фото (см. checkin.check_in_group)."""
+    event_id = request.form.get("event_id", type=int)
+    if not event_id:
+        return jsonify({"status": "error", "msg": "no event_id"}), 400
 
-    if not participants:
-        try: os.remove(tmp_path)
-        except: pass
-        return jsonify({"status": "not_found", "msg": "no participants in db"})
+    f = request.files.get("photo")
+    if not f or f.filename == "":
+        return jsonify({"status": "error", "msg": "no photo"}), 400
 
-    # Проходим по ВСЕМ участникам и собираем результаты
-    all_scores = []
-    for p in participants:
-        ref_path = os.path.join(TMP_DIR, f"ref_{p['id']}{p['photo_ext']}")
-        with open(ref_path, "wb") as out:
-            out.write(p["photo_blob"])
+    ext = os.path.splitext(f.filename)[1].lower()
+    if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
+        return jsonify({"status": "error", "msg": "bad ext"}), 400
 
-        try:
-            # Используем улучшенный алгоритм распознавания лиц
-            score = face_recognition_module.compare_faces_advanced(tmp_path, ref_path)
-            all_scores.append({
-                "participant_id": p["id"],
-                "login": p["login"],
-                "name": p["name"],
-                "score": score
-            })
-            print(f"✓ {p['login']}: {score:.1f}%")
-        except Exception as e:
-            print(f"✗ Ошибка сравнения с {p['login']}: {e}")
-            # Добавляем с нулевым score чтобы не пропустить участника
-            all_scores.append({
-                "participant_id": p["id"],
-                "login": p["login"],
-                "name": p["name"],
-                "score": 0.0
-            })
-        finally:
-            try: os.remove(ref_path)
-            except: pass
-
-    try: os.remove(tmp_path)
-    except: pass
-
-    # Находим участника с максимальным score
-    best_match = max(all_scores, key=lambda x: x["score"])
-    
-    # Порог совпадения: 70%
-    THRESHOLD = 70.0
-    
-    if best_match["score"] >= THRESHOLD:
-        # Пытаемся зарегистрировать
-        try:
-            db.query(
-                "INSERT INTO attendance(participant_id,event_id,timestamp,match_score) VALUES (?,?,?,?)",
-                (best_match["participant_id"], event_id, str(datetime.datetime.now()), best_match["score"])
-            )
-            return jsonify({
-                "status": "registered",
-                "login": best_match["login"],
-                "name": best_match["name"],
-                "score": best_match["score"]
-            })
-        except:
-            # Уже зарегистрирован
-            return jsonify({
-                "status": "already_registered",
-                "login": best_match["login"],
-                "score": best_match["score"]
-            })
-    else:
-        # Не найдено достаточного совпадения
-        return jsonify({
-            "status": "not_found",
-            "best_candidate": best_match["login"],
-            "best_score": best_match["score"]
-        })
+    raw = f.read()
+    if not raw:
+        return jsonify({"status": "error", "msg": "empty file"}), 400
+
+    with metrics.timer("register_group"):
+        payload, code = checkin.check_in_group(event_id, raw)
+    return jsonify(payload), code
+
+
+@app.route("/register/stream", methods=["POST"])
+def register_stream():
+    """
+    Регистрация по видеопотоку камеры: тело запроса — JPEG-кадры (MJPEG,
+    multipart или подряд), event_id — в строке запроса. Ответ — NDJSON:
+    строка на каждое узнанное (или не узнанное) лицо по мере готовности,
+    последняя — {"status": "done", ...} со счётчиками потока.
+    """
+    event_id = request.args.get("event_id", type=int)
+    if not event_id:
+        return jsonify({"status": "error", "msg": "no event_id"}), 400
+
+    def stream():
+        for result in stream_checkin.run_stream(event_id, request.stream.read):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+
+@app.route("/register/jobs/<job_id>")
+def register_job(job_id):
+    """Состояние задачи регистрации: queued / running или итоговый ответ /register."""
+    job = checkin_jobs.get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "msg": "unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/register/jobs/<job_id>/events")
+def register_job_events(job_id):
+    """
+    Server-sent events по задаче: событие status при каждой смене состояния,
+    последнее — result с итоговым ответом. Поток закрывается после result
+    или через CHECKIN_SSE_TIMEOUT секунд.
+    """
+    job = checkin_jobs.get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "msg": "unknown job"}), 404
+
+    def stream():
+        deadline = time.time() + config.CHECKIN_SSE_TIMEOUT
+        state = None
+        while time.time() < deadline:
+            current = job.wait_change(state, timeout=min(15.0, max(0.0, deadline - time.time())))
+            if current == state:
+                yield ": keep-alive\n\n"
+                continue
+            state = current
+            data = json.dumps(job.to_dict(), ensure_ascii=False)
+            if state == "done":
+                yield f"event: result\ndata: {data}\n\n"
+                return
+            yield f"event: status\ndata: {data}\n\n"
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     db.init_db()
     app.run(debug=True)
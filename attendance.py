@@ -0,0 +1,227 @@
+"""
+Журнал посещений: время отметки и постраничная выборка.
+
+Время отметки хранится дважды: timestamp — локальное время текстом (как
+раньше, для отображения), ts — секунды Unix. Фильтры по датам и сортировка
+идут по ts, под них есть индексы (event_id, ts), (participant_id, ts) и (ts).
+
+Страницы выбираются по ключу (keyset): строки упорядочены по (ts, id) по
+убыванию, следующая страница начинается после строки after_id —
+WHERE (ts, id) < (ts строки after_id, after_id). Каждая страница читается
+из индекса с нужного места, без сортировки журнала и без OFFSET, поэтому
+время не зависит ни от размера журнала, ни от номера страницы.
+
+Выгрузка (batches и *_chunks) идёт теми же страницами: в памяти одна
+страница, первые байты уходят клиенту сразу, а каждая страница — свой
+короткий запрос, так что долгая выгрузка не держит снимок БД (WAL не
+растёт, пока клиент читает ответ).
+"""
+
+import csv
+import datetime
+import io
+import json
+import sqlite3
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import db
+
+# Строк на странице по умолчанию и максимум
+PAGE_SIZE = 100
+MAX_PAGE = 1000
+
+COLUMNS = """
+    a.id,
+    a.participant_id,
+    p.login,
+    p.name,
+    a.event_id,
+    e.title AS event_title,
+    a.timestamp,
+    a.ts,
+    a.match_score
+"""
+
+# Кодировщик строк NDJSON (json.dumps с параметрами создаёт новый на каждый вызов)
+_ndjson = json.JSONEncoder(ensure_ascii=False)
+
+# Колонки CSV-выгрузки
+CSV_COLUMNS = ("id", "participant_id", "login", "name", "event_id", "event_title", "timestamp", "match_score")
+
+
+def stamp(now: Optional[datetime.datetime] = None) -> Tuple[str, int]:
+    """Время отметки для записи в журнал: (timestamp, ts)."""
+    now = now or datetime.datetime.now()
+    return str(now), int(now.timestamp())
+
+
+def day_start(date: str) -> int:
+    """Начало дня YYYY-MM-DD (локальное время) в секундах Unix. ValueError — неверная дата."""
+    try:
+        return int(datetime.datetime.strptime(date, "%Y-%m-%d").timestamp())
+    except ValueError:
+        raise ValueError(f"bad date: {date}, expected YYYY-MM-DD") from None
+
+
+def _where(participant_id: Optional[int], event_id: Optional[int],
+           date_from: Optional[str], date_to: Optional[str]) -> Tuple[List[str], list]:
+    conditions, params = [], []
+    if participant_id:
+        conditions.append("a.participant_id = ?")
+        params.append(participant_id)
+    if event_id:
+        conditions.append("a.event_id = ?")
+        params.append(event_id)
+    if date_from:
+        conditions.append("a.ts >= ?")
+        params.append(day_start(date_from))
+    if date_to:
+        # date_to включительно: до начала следующего дня
+        conditions.append("a.ts < ?")
+        params.append(day_start(date_to) + 86400)
+    return conditions, params
+
+
+def page(participant_id: Optional[int] = None, event_id: Optional[int] = None,
+         date_from: Optional[str] = None, date_to: Optional[str] = None,
+         after_id: Optional[int] = None,
+         limit: Optional[int] = PAGE_SIZE) -> Tuple[List[sqlite3.Row], Optional[int]]:
+    """
+    Страница журнала, новые отметки первыми.
+
+    Args:
+        participant_id, event_id, date_from, date_to: фильтры (date_* — YYYY-MM-DD, включительно)
+        after_id: id последней строки предыдущей страницы (None — с начала)
+        limit: строк на странице (не больше MAX_PAGE); None — все строки после after_id
+
+    Returns:
+        (строки, after_id следующей страницы или None, если строк больше нет)
+
+    Raises:
+        ValueError: неверная дата, limit или after_id
+    """
+    if limit is not None and not 1 <= limit <= MAX_PAGE:
+        raise ValueError(f"limit must be 1..{MAX_PAGE}")
+
+    conditions, params = _where(participant_id, event_id, date_from, date_to)
+    if after_id is not None:
+        row = db.read_one("SELECT ts FROM attendance WHERE id = ?", (after_id,))
+        if row is None:
+            raise ValueError("unknown after_id")
+        conditions.append("(a.ts, a.id) < (?, ?)")
+        params.extend([row["ts"], after_id])
+
+    sql = f"""
+        SELECT {COLUMNS}
+        FROM attendance a
+        JOIN participants p ON p.id = a.participant_id
+        JOIN events e ON e.id = a.event_id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY a.ts DESC, a.id DESC
+    """
+    if limit is None:
+        return db.read(sql, params), None
+
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = db.read(sql + " LIMIT ?", [*params, limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+
+def batches(participant_id: Optional[int] = None, event_id: Optional[int] = None,
+            date_from: Optional[str] = None, date_to: Optional[str] = None,
+            after_id: Optional[int] = None, size: int = MAX_PAGE) -> Iterator[List[sqlite3.Row]]:
+    """
+    Все подходящие строки журнала (после after_id) страницами по size строк.
+
+    Первая страница читается сразу, поэтому неверные фильтры дают ValueError
+    при вызове, а не посреди выгрузки.
+    """
+    filters = dict(participant_id=participant_id, event_id=event_id, date_from=date_from, date_to=date_to)
+    rows, after_id = page(**filters, after_id=after_id, limit=size)
+
+    def generate(rows, after_id):
+        while rows:
+            yield rows
+            if after_id is None:
+                return
+            rows, after_id = page(**filters, after_id=after_id, limit=size)
+
+    return generate(rows, after_id)
+
+
+def record(row: sqlite3.Row) -> dict:
+    """Строка журнала в виде записи JSON-выгрузки."""
+    return {
+        "id": row["id"],
+        "participant": {
+            "id": row["participant_id"],
+            "login": row["login"],
+            "name": row["name"]
+        },
+        "event": {
+            "id": row["event_id"],
+            "title": row["event_title"]
+        },
+        "timestamp": row["timestamp"],
+        "match_score": row["match_score"]
+    }
+
+
+def ndjson_chunks(pages: Iterable[List[sqlite3.Row]]) -> Iterator[str]:
+    """NDJSON: запись на строку, кусок на страницу."""
+    for rows in pages:
+        yield "".join(_ndjson.encode(record(row)) + "\n" for row in rows)
+
+
+def csv_chunks(pages: Iterable[List[sqlite3.Row]]) -> Iterator[str]:
+    """CSV с заголовком CSV_COLUMNS, кусок на страницу."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for rows in pages:
+        writer.writerows([row[column] for column in CSV_COLUMNS] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # пустая выгрузка — только заголовок
+
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """
+    Сжатие gzip на лету. Каждый кусок сбрасывается (Z_SYNC_FLUSH), чтобы
+    клиент получал данные по мере чтения журнала, а не в конце.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_json(f, meta: dict, pages: Iterable[List[sqlite3.Row]]) -> int:
+    """
+    Пишет JSON-выгрузку {**meta, "records": [...], "total_records": n} в
+    текстовый файл f по страницам (формат как у json.dump(indent=2)).
+
+    Returns:
+        число записей
+    """
+    head = json.dumps(meta, ensure_ascii=False, indent=2)
+    # Заголовок — meta без закрывающей скобки
+    f.write((head[:-2] + ",\n") if meta else "{\n")
+    f.write('  "records": [')
+    total = 0
+    for rows in pages:
+        for row in rows:
+            item = json.dumps(record(row), ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            f.write(("," if total else "") + "\n    " + item)
+            total += 1
+    f.write("\n  ]" if total else "]")
+    f.write(f',\n  "total_records": {total}\n}}')
+    return total
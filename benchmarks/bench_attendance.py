@@ -0,0 +1,174 @@
+"""
+Бенчмарк выборок из журнала посещений на большом журнале (временная БД):
+прежний запрос выгрузки (DATE(timestamp), ORDER BY timestamp — полный проход
+и сортировка) против страниц attendance.page (индексы по ts, keyset).
+
+Сценарии (страница --limit строк):
+  first        — первая страница без фильтров;
+  deep         — страница из середины журнала (after_id);
+  event        — одно мероприятие;
+  participant  — один участник;
+  dates        — диапазон дат в одну неделю;
+  event_dates  — мероприятие и диапазон дат.
+
+Выгрузка всего журнала (--export): прежняя (fetchall, словари, json.dump
+в файл) против потоковых ndjson/csv/gzip (attendance.batches) — время до
+первого куска, полное время и пик памяти Python (tracemalloc).
+
+Запуск:
+    python -m benchmarks.bench_attendance [--rows 2000000] [--limit 100] [--export]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import attendance
+import db
+
+PARTICIPANTS = 5000
+EVENTS = 2000
+DAYS = 365
+
+LEGACY_SQL = """
+    SELECT a.id, p.id as participant_id, p.login, p.name, e.id as event_id,
+           e.title as event_title, a.timestamp, a.match_score
+    FROM attendance a
+    JOIN participants p ON p.id = a.participant_id
+    JOIN events e ON e.id = a.event_id
+    WHERE 1=1 {where}
+    ORDER BY a.timestamp DESC
+    LIMIT ?
+"""
+
+
+def _fill(rows: int):
+    """Участники, мероприятия и rows отметок за DAYS дней (не больше PARTICIPANTS на мероприятие)."""
+    rng = random.Random(0)
+    start = datetime.datetime.now() - datetime.timedelta(days=DAYS)
+    db.init_db()
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO participants(id, login, name, photo_blob, photo_ext, photo_mime) "
+            "VALUES (?,?,?, x'00', '.jpg', 'image/jpeg')",
+            [(i, f"p{i}", f"Участник {i}") for i in range(1, PARTICIPANTS + 1)]
+        )
+        conn.executemany("INSERT INTO events(id, title) VALUES (?,?)",
+                         [(i, f"Мероприятие {i}") for i in range(1, EVENTS + 1)])
+
+        def generate():
+            per_event = -(-rows // EVENTS)
+            n = 0
+            for event_id in range(1, EVENTS + 1):
+                day = start + datetime.timedelta(days=DAYS * (event_id - 1) / EVENTS)
+                for participant_id in rng.sample(range(1, PARTICIPANTS + 1), min(per_event, PARTICIPANTS)):
+                    if n == rows:
+                        return
+                    n += 1
+                    yield (participant_id, event_id,
+                           *attendance.stamp(day + datetime.timedelta(seconds=rng.randrange(4 * 3600))),
+                           rng.uniform(70, 100))
+
+        conn.executemany(
+            "INSERT INTO attendance(participant_id,event_id,timestamp,ts,match_score) VALUES (?,?,?,?,?)",
+            generate()
+        )
+    db.execute("ANALYZE")
+
+
+def _legacy_export(path: str):
+    """Прежняя выгрузка: все строки и записи в памяти, затем json.dump."""
+    data = db.read(LEGACY_SQL.format(where="").replace("LIMIT ?", ""))
+    result = {"total_records": len(data), "records": [attendance.record(row) for row in data]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    yield os.path.getsize(path)  # один «кусок» — размер файла
+
+
+def _export(name: str, chunks) -> str:
+    """Полный проход по выгрузке: время до первого куска, всё время, пик памяти."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in chunks():
+        if first is None:
+            first = time.perf_counter() - t0
+        size += chunk if isinstance(chunk, int) else len(chunk)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return f"{name:<13}{first * 1000:>12.1f}{elapsed:>10.2f}{peak / 2**20:>12.1f}{size / 2**20:>10.1f}"
+
+
+def _ms(fn, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--legacy-repeat", type=int, default=1)
+    parser.add_argument("--export", action="store_true", help="замерить и выгрузку всего журнала")
+    args = parser.parse_args()
+
+    db.DB = os.path.join(tempfile.mkdtemp(prefix="bench_"), "attendance.db")
+    t0 = time.perf_counter()
+    _fill(args.rows)
+    print(f"Журнал: {args.rows} строк, заполнение {time.perf_counter() - t0:.1f} с")
+
+    total = db.read_one("SELECT COUNT(*) FROM attendance")[0]
+    middle = db.read_one("SELECT id FROM attendance ORDER BY ts DESC, id DESC LIMIT 1 OFFSET ?", (total // 2,))[0]
+    event_id = EVENTS // 2
+    participant_id = PARTICIPANTS // 2
+    week_to = datetime.date.today() - datetime.timedelta(days=DAYS // 2)
+    week_from = week_to - datetime.timedelta(days=6)
+    dates = {"date_from": week_from.isoformat(), "date_to": week_to.isoformat()}
+
+    scenarios = {
+        "first": ({}, "", []),
+        "deep": ({"after_id": middle}, None, None),
+        "event": ({"event_id": event_id}, "AND e.id = ?", [event_id]),
+        "participant": ({"participant_id": participant_id}, "AND p.id = ?", [participant_id]),
+        "dates": (dates, "AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?",
+                  [dates["date_from"], dates["date_to"]]),
+        "event_dates": ({"event_id": event_id, **dates},
+                        "AND e.id = ? AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?",
+                        [event_id, dates["date_from"], dates["date_to"]]),
+    }
+
+    print(f"{'сценарий':<13}{'строк':>7}{'прежний, мс':>14}{'page, мс':>11}")
+    for name, (filters, where, params) in scenarios.items():
+        rows, _ = attendance.page(limit=args.limit, **filters)
+        after = _ms(lambda: attendance.page(limit=args.limit, **filters), args.repeat)
+        if where is None:
+            before = "—"  # прежний запрос не умел продолжать с места
+        else:
+            sql = LEGACY_SQL.format(where=where)
+            before = f"{_ms(lambda: db.read(sql, [*params, args.limit]), args.legacy_repeat):.1f}"
+        print(f"{name:<13}{len(rows):>7}{before:>14}{after:>11.2f}")
+
+    if not args.export:
+        return
+
+    legacy_path = os.path.join(os.path.dirname(db.DB), "legacy.json")
+    print(f"\n{'выгрузка':<13}{'1-й кусок, мс':>12}{'всего, с':>10}{'пик, МБ':>12}{'объём, МБ':>10}")
+    print(_export("legacy_json", lambda: _legacy_export(legacy_path)))
+    print(_export("ndjson", lambda: attendance.ndjson_chunks(attendance.batches())))
+    print(_export("csv", lambda: attendance.csv_chunks(attendance.batches())))
+    print(_export("ndjson.gz", lambda: attendance.gzip_chunks(attendance.ndjson_chunks(attendance.batches()))))
+
+
+if __name__ == "__main__":
+    main()
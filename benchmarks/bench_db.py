@@ -0,0 +1,139 @@
+"""
+Бенчмарк слоя БД: стоимость одного запроса при прежней схеме (новое
+соединение на каждый запрос, журнал отката, synchronous=FULL) и при
+постоянных соединениях потоков db (WAL, synchronous=NORMAL, кэш операторов).
+
+Этапы (временные БД с одинаковыми данными):
+  read_point   — SELECT фото участника по id (как /participant_photo);
+  read_version — SELECT версии галереи (перед каждой выдачей кэша галереи);
+  insert       — INSERT в журнал посещений одним оператором (как /register);
+  writers      — --threads потоков одновременно пишут в журнал, мкс на запись.
+
+Запуск:
+    python -m benchmarks.bench_db [--participants 1000] [--repeat 2000] [--threads 4]
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db
+
+_ids = itertools.count(1)
+
+
+def _legacy_query(path: str, sql: str, params=(), fetch: bool = False):
+    """Прежний db.query: соединение на запрос, commit, close."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        c = conn.cursor()
+        c.execute(sql, tuple(params))
+        data = c.fetchall() if fetch else None
+        conn.commit()
+    finally:
+        conn.close()
+    return data
+
+
+def _fill(participants: int):
+    """Схема и данные в текущей db.DB."""
+    db.init_db()
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO events(title) VALUES ('benchmark')")
+        conn.executemany(
+            "INSERT INTO participants(id, login, name, photo_blob, photo_ext, photo_mime) "
+            "VALUES (?,?,?,?, '.jpg', 'image/jpeg')",
+            [(i, f"bench{i}", f"Участник {i}", os.urandom(20000)) for i in range(1, participants + 1)]
+        )
+
+
+def _per_call_us(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def _writers_us(write, threads: int, per_thread: int) -> float:
+    """Мкс на одну запись при threads одновременных писателях."""
+    def work():
+        for _ in range(per_thread):
+            write()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - t0) / (threads * per_thread) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_db_")
+    legacy_path = os.path.join(tmp, "legacy.db")
+    tuned_path = os.path.join(tmp, "tuned.db")
+
+    for path in (legacy_path, tuned_path):
+        db.DB = path
+        _fill(args.participants)
+    # Прежняя схема — журнал отката (режим WAL сохраняется в файле)
+    db.DB = None
+    conn = sqlite3.connect(legacy_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    db.DB = tuned_path
+
+    insert_sql = "INSERT INTO attendance(participant_id,event_id,timestamp,match_score) VALUES (?,?,?,?)"
+    # Каждая запись — в своё мероприятие: UNIQUE(participant_id, event_id) не мешает
+    pid = lambda: (next(_ids) % args.participants) + 1  # noqa: E731
+
+    def legacy_insert():
+        _legacy_query(legacy_path, insert_sql, (pid(), next(_ids), "t", 1.0))
+
+    def tuned_insert():
+        db.execute(insert_sql, (pid(), next(_ids), "t", 1.0))
+
+    stages = {
+        "read_point": (
+            lambda: _legacy_query(legacy_path, "SELECT photo_blob, photo_mime FROM participants WHERE id=?",
+                                  (pid(),), fetch=True),
+            lambda: db.read_one("SELECT photo_blob, photo_mime FROM participants WHERE id=?", (pid(),)),
+            args.repeat,
+        ),
+        "read_version": (
+            lambda: _legacy_query(legacy_path, "SELECT version FROM gallery_version WHERE id = 1", fetch=True),
+            lambda: db.read_one("SELECT version FROM gallery_version WHERE id = 1"),
+            args.repeat,
+        ),
+        "insert": (legacy_insert, tuned_insert, max(1, args.repeat // 4)),
+    }
+
+    print(f"{'этап':<14}{'прежний, мкс':>14}{'db, мкс':>12}{'ускорение':>12}")
+    for name, (legacy, tuned, repeat) in stages.items():
+        legacy()
+        tuned()
+        before = _per_call_us(legacy, repeat)
+        after = _per_call_us(tuned, repeat)
+        print(f"{name:<14}{before:>14.1f}{after:>12.1f}{before / after:>11.1f}x")
+
+    per_thread = max(1, args.repeat // (4 * args.threads))
+    before = _writers_us(legacy_insert, args.threads, per_thread)
+    after = _writers_us(tuned_insert, args.threads, per_thread)
+    print(f"{'writers x' + str(args.threads):<14}{before:>14.1f}{after:>12.1f}{before / after:>11.1f}x")
+    print(f"Соединений открыто слоем db: {db.stats()['connections_opened']}")
+
+
+if __name__ == "__main__":
+    main()
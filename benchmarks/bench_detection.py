@@ -0,0 +1,80 @@
+"""
+Бенчмарк детекции на больших фото: полный размер против уменьшенной копии
+(config.DETECT_MAX_SIDE) с уточнением боксов.
+
+Фото из uploads/ увеличиваются до разных разрешений (имитация снимков
+с телефона); для каждого печатается время обоих режимов, число лиц и
+совпадение самого большого бокса: IoU с полным размером и IoU с боксом,
+найденным на исходном фото и увеличенным в scale раз (на сильно увеличенном,
+размытом фото полный размер сам может найти только ложные мелкие лица).
+
+Запуск:
+    python -m benchmarks.bench_detection [--scales 1 4 8 16] [--max-side 1280]
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+
+from benchmarks.synthetic import UPLOADS_DIR
+import config
+from face_detection import get_cascade_pool
+
+
+def iou(a, b) -> float:
+    """Intersection over Union двух боксов (x, y, w, h)."""
+    if a is None or b is None:
+        return float(a is None and b is None)
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    iw = max(0, min(ax2, bx2) - max(a[0], b[0]))
+    ih = max(0, min(ay2, by2) - max(a[1], b[1]))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - t0) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--max-side", type=int, default=config.DETECT_MAX_SIDE)
+    parser.add_argument("--no-refine", action="store_true")
+    args = parser.parse_args()
+
+    pool = get_cascade_pool()
+    paths = sorted(glob.glob(os.path.join(UPLOADS_DIR, "*.jpg")))
+
+    print(f"{'фото':<22}{'размер':>12}{'Мп':>7}{'полный, мс':>12}{'пирамида, мс':>14}{'лиц':>8}"
+          f"{'IoU':>7}{'IoU исх.':>10}")
+    for path in paths:
+        original = cv2.imread(path)
+        reference = pool.detect(original, max_side=0).largest()
+        for scale in args.scales:
+            image = cv2.resize(original, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            h, w = image.shape[:2]
+            expected = tuple(int(round(v * scale)) for v in reference) if reference is not None else None
+
+            # minSize — из config (как в сервисе), в пикселях исходного фото
+            full_ms, full = timed(lambda: pool.detect(image, max_side=0))
+            fast_ms, fast = timed(lambda: pool.detect(
+                image, max_side=args.max_side, refine=not args.no_refine))
+
+            print(
+                f"{os.path.basename(path):<22}{f'{w}x{h}':>12}{w * h / 1e6:>7.1f}"
+                f"{full_ms:>12.1f}{fast_ms:>14.1f}{f'{full.count}/{fast.count}':>8}"
+                f"{iou(full.largest(), fast.largest()):>7.2f}"
+                f"{iou(expected, fast.largest()):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
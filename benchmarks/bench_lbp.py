@@ -0,0 +1,95 @@
+"""
+Бенчмарк LBP: старая реализация на циклах Python против векторизованной.
+
+Запуск:
+    python -m benchmarks.bench_lbp [--image uploads/participant_1.jpg] [--repeat 20]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import lbp
+from face_recognition_module import FaceRecognizer
+
+
+def lbp_histogram_loop(gray: np.ndarray) -> np.ndarray:
+    """Эталон: прежняя реализация FaceRecognizer.compute_lbp_histogram."""
+    height, width = gray.shape
+    codes = np.zeros_like(gray)
+
+    for i in range(1, height - 1):
+        for j in range(1, width - 1):
+            center = gray[i, j]
+            code = 0
+            code |= (gray[i-1, j-1] >= center) << 7
+            code |= (gray[i-1, j] >= center) << 6
+            code |= (gray[i-1, j+1] >= center) << 5
+            code |= (gray[i, j+1] >= center) << 4
+            code |= (gray[i+1, j+1] >= center) << 3
+            code |= (gray[i+1, j] >= center) << 2
+            code |= (gray[i+1, j-1] >= center) << 1
+            code |= (gray[i, j-1] >= center) << 0
+            codes[i, j] = code
+
+    hist = cv2.calcHist([codes], [0], None, [256], [0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def _load_gray(path: str) -> np.ndarray:
+    recognizer = FaceRecognizer()
+    img = cv2.imread(path)
+    if img is None:
+        raise SystemExit(f"Не удалось загрузить изображение: {path}")
+    face = recognizer.extract_face(path)
+    face = recognizer.preprocess_face(face if face is not None else img)
+    return cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+
+
+def _timeit(fn, repeat: int) -> float:
+    """Медианное время вызова в миллисекундах."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", default="uploads/participant_1.jpg")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    gray = _load_gray(args.image)
+    print(f"Лицо: {gray.shape[1]}x{gray.shape[0]}")
+
+    reference = lbp_histogram_loop(gray)
+    vectorized = lbp.lbp_histogram(gray, mode="classic")
+    if not np.array_equal(reference, vectorized):
+        raise SystemExit("❌ Векторизованный classic LBP расходится с эталоном")
+    print("✅ classic LBP совпадает с эталоном побитово")
+
+    loop_ms = _timeit(lambda: lbp_histogram_loop(gray), max(1, args.repeat // 10))
+    print(f"\n{'вариант':<28}{'мс':>10}{'ускорение':>12}")
+    print(f"{'циклы Python (classic)':<28}{loop_ms:>10.2f}{'1.0x':>12}")
+
+    variants = [
+        ("classic", None),
+        ("classic", (8, 8)),
+        ("uniform", None),
+        ("uniform", (8, 8)),
+        ("ri", (8, 8)),
+        ("riu2", (8, 8)),
+    ]
+    for mode, grid in variants:
+        ms = _timeit(lambda: lbp.lbp_histogram(gray, mode=mode, grid=grid), args.repeat)
+        label = f"{mode}" + (f" {grid[0]}x{grid[1]}" if grid else "")
+        print(f"{label:<28}{ms:>10.3f}{loop_ms / ms:>11.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Бенчмарк ORB-этапа 1:N: попарный BFMatcher(crossCheck) против поиска
+по индексу дескрипторов галереи (orb_index).
+
+Проверяет, что feature_score совпадает для каждого участника, и печатает время.
+
+Запуск:
+    python -m benchmarks.bench_orb [--gallery 100 1000] [--queries 5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import face_recognition_module
+import orb_index
+from benchmarks import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--queries", type=int, default=5)
+    args = parser.parse_args()
+
+    recognizer = face_recognition_module.get_recognizer()
+    size = max(args.gallery)
+    templates = [recognizer.build_template(f) for f in synthetic.make_faces(size + args.queries)]
+    queries = templates[size:]
+
+    print(f"{'галерея':>8}{'дескрипторов':>14}{'попарно, мс':>13}{'индекс, мс':>12}{'ускорение':>11}{'совпадает':>11}")
+    for n in args.gallery:
+        gallery = recognizer.stack_gallery(templates[:n])
+        pair_ms = index_ms = 0.0
+        same = True
+        for query in queries:
+            t0 = time.perf_counter()
+            pairwise = np.array([recognizer.compute_feature_score(query["orb"], t["orb"]) for t in templates[:n]])
+            t1 = time.perf_counter()
+            indexed = orb_index.feature_scores(query["orb"], gallery["orb_desc"], gallery["orb_count"])
+            t2 = time.perf_counter()
+            pair_ms += (t1 - t0) * 1000 / len(queries)
+            index_ms += (t2 - t1) * 1000 / len(queries)
+            same &= np.array_equal(pairwise, indexed)
+
+        print(
+            f"{n:>8}{len(gallery['orb_desc']):>14}{pair_ms:>13.1f}{index_ms:>12.1f}"
+            f"{pair_ms / index_ms:>10.2f}x{'да' if same else 'НЕТ':>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
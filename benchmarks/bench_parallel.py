@@ -0,0 +1,59 @@
+"""
+Бенчмарк параллельного 1:N сравнения (ParallelMatcher) против последовательного.
+
+Проверяет, что оценки совпадают побитово, и печатает задержку для
+разного числа исполнителей.
+
+Запуск:
+    python -m benchmarks.bench_parallel [--gallery 1000] [--workers 1 2 4 8 16] [--executor process]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import face_recognition_module
+from benchmarks import synthetic
+from parallel_match import ParallelMatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    recognizer = face_recognition_module.get_recognizer()
+    faces = synthetic.make_faces(args.gallery + 1)
+    query = recognizer.build_template(faces[-1])
+    gallery = recognizer.stack_gallery([recognizer.build_template(f) for f in faces[:-1]])
+
+    def best_of(fn):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        return min(times), result
+
+    serial_ms, (serial_order, serial_scores) = best_of(lambda: recognizer.match_gallery(query, gallery))
+    print(f"Галерея: {args.gallery}, ядер: {os.cpu_count()}, исполнитель: {args.executor}")
+    print(f"{'workers':>8}{'мс':>10}{'ускорение':>12}{'совпадает':>12}")
+    print(f"{'serial':>8}{serial_ms:>10.1f}{'1.00x':>12}{'—':>12}")
+
+    for workers in args.workers:
+        matcher = ParallelMatcher(workers, chunk_size=args.chunk_size, executor=args.executor)
+        matcher.match(query, gallery)  # создание и прогрев пула не входят в замер
+        ms, (order, scores) = best_of(lambda: matcher.match(query, gallery))
+        same = np.array_equal(scores, serial_scores) and np.array_equal(order, serial_order)
+        print(f"{workers:>8}{ms:>10.1f}{serial_ms / ms:>11.2f}x{'да' if same else 'НЕТ':>12}")
+        matcher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
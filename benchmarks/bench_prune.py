@@ -0,0 +1,67 @@
+"""
+Бенчмарк отсечения при 1:N сравнении: match_gallery полностью против
+match_gallery(prune_below=70) — метрики от дешёвых к дорогим с отсечением
+по верхней границе оценки.
+
+Проверяет, что победитель и его оценка совпадают (если она проходит порог),
+и печатает время и долю пропущенных SSIM/ORB.
+
+Запуск:
+    python -m benchmarks.bench_prune [--gallery 100 1000] [--queries 10] [--threshold 70]
+"""
+
+import argparse
+import time
+
+import face_recognition_module
+from benchmarks import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=70.0)
+    args = parser.parse_args()
+
+    recognizer = face_recognition_module.get_recognizer()
+    size = max(args.gallery)
+    templates = [recognizer.build_template(f) for f in synthetic.make_faces(size)]
+    # Половина запросов — лица из галереи (есть совпадение), половина — новые
+    extra = [recognizer.build_template(f) for f in synthetic.make_faces(args.queries, seed=1)]
+
+    print(
+        f"{'галерея':>8}{'полностью, мс':>15}{'отсечение, мс':>15}{'ускорение':>11}"
+        f"{'без SSIM':>10}{'без ORB':>10}{'совпадает':>11}"
+    )
+    for n in args.gallery:
+        gallery = recognizer.stack_gallery(templates[:n])
+        known = args.queries - args.queries // 2
+        queries = templates[:n:max(1, n // known)][:known] + extra[:args.queries // 2]
+
+        full_ms = pruned_ms = 0.0
+        same = True
+        before = recognizer.prune_stats()
+        for query in queries:
+            t0 = time.perf_counter()
+            order, scores = recognizer.match_gallery(query, gallery)
+            t1 = time.perf_counter()
+            pruned_order, pruned_scores = recognizer.match_gallery(query, gallery, prune_below=args.threshold)
+            t2 = time.perf_counter()
+            full_ms += (t1 - t0) * 1000 / len(queries)
+            pruned_ms += (t2 - t1) * 1000 / len(queries)
+            if scores[order[0]] >= args.threshold:
+                same &= order[0] == pruned_order[0] and scores[order[0]] == pruned_scores[pruned_order[0]]
+
+        after = recognizer.prune_stats()
+        total = after["candidates"] - before["candidates"]
+        ssim_rate = (after["ssim_skipped"] - before["ssim_skipped"]) / total
+        orb_rate = (after["orb_skipped"] - before["orb_skipped"]) / total
+        print(
+            f"{n:>8}{full_ms:>15.1f}{pruned_ms:>15.1f}{full_ms / pruned_ms:>10.2f}x"
+            f"{ssim_rate:>10.0%}{orb_rate:>10.0%}{'да' if same else 'НЕТ':>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк SSIM лиц: skimage против fast_ssim.
+
+Сравниваются:
+  - skimage.metrics.structural_similarity для каждой пары (эталон);
+  - fast_ssim.ssim для пары с готовыми статистиками из шаблонов;
+  - пакетный scipy uniform_filter (прежняя реализация match_gallery);
+  - fast_ssim.ssim_batch без статистик галереи и с ними.
+Для каждого варианта печатается время на галерею и максимальное отклонение от skimage.
+
+Запуск:
+    python -m benchmarks.bench_ssim [--gallery 1000] [--repeat 3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.ndimage import uniform_filter
+from skimage.metrics import structural_similarity
+
+import fast_ssim
+import face_recognition_module
+from benchmarks import synthetic
+
+
+def ssim_batch_scipy(query: np.ndarray, faces: np.ndarray, batch: int = 256) -> np.ndarray:
+    """Эталон: прежний пакетный SSIM через scipy.ndimage.uniform_filter."""
+    win = 7
+    pad = (win - 1) // 2
+    cov_norm = win * win / (win * win - 1)
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    x = query.astype(np.float64)
+    ux = uniform_filter(x, size=win)
+    vx = cov_norm * (uniform_filter(x * x, size=win) - ux * ux)
+
+    result = np.empty(len(faces), dtype=np.float64)
+    size = (1, win, win)
+    for start in range(0, len(faces), batch):
+        y = faces[start:start + batch].astype(np.float64)
+        uy = uniform_filter(y, size=size)
+        vy = cov_norm * (uniform_filter(y * y, size=size) - uy * uy)
+        vxy = cov_norm * (uniform_filter(x * y, size=size) - ux * uy)
+        s = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2))
+        result[start:start + len(y)] = s[:, pad:-pad, pad:-pad].mean(axis=(1, 2))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    recognizer = face_recognition_module.get_recognizer()
+    templates = [recognizer.build_template(f) for f in synthetic.make_faces(args.gallery + 1)]
+    query, gallery = templates[-1], templates[:-1]
+
+    faces = np.stack([t["face"] for t in gallery])
+    mu = np.stack([t["ssim_mu"] for t in gallery])
+    var = np.stack([t["ssim_var"] for t in gallery])
+    query_stats = (query["ssim_mu"], query["ssim_var"])
+
+    def best_of(fn):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        return min(times), np.asarray(result)
+
+    ref_ms, reference = best_of(lambda: [structural_similarity(query["face"], f) for f in faces])
+
+    variants = [
+        ("fast_ssim.ssim (пары, статистики)", lambda: [
+            fast_ssim.ssim(query["face"], t["face"], query_stats, (t["ssim_mu"], t["ssim_var"])) for t in gallery
+        ]),
+        ("scipy uniform_filter (пакет)", lambda: ssim_batch_scipy(query["face"], faces)),
+        ("fast_ssim.ssim_batch", lambda: fast_ssim.ssim_batch(query["face"], faces, query_stats)),
+        ("fast_ssim.ssim_batch + mu/var", lambda: fast_ssim.ssim_batch(query["face"], faces, query_stats, mu, var)),
+    ]
+
+    print(f"Галерея: {args.gallery} лиц 128x128")
+    print(f"{'вариант':<36}{'мс':>10}{'ускорение':>11}{'макс. откл.':>14}")
+    print(f"{'skimage (пары)':<36}{ref_ms:>10.1f}{'1.00x':>11}{'—':>14}")
+    for name, fn in variants:
+        ms, result = best_of(fn)
+        print(f"{name:<36}{ms:>10.1f}{ref_ms / ms:>10.2f}x{np.abs(result - reference).max():>14.2e}")
+
+
+if __name__ == "__main__":
+    main()
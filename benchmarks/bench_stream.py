@@ -0,0 +1,110 @@
+"""
+Бенчмарк регистрации по видеопотоку (stream_checkin): синтетическое видео
+640x480, в котором люди по очереди проходят через кадр, и галерея из
+--gallery участников (временная БД).
+
+Печатает скорость обработки кадров (вместе с фоновыми 1:N сравнениями —
+они делят с кадрами процессор), число детекций и сравнений: сравнений
+должно быть по одному на человека, а не на кадр.
+
+Запуск:
+    python -m benchmarks.bench_stream [--gallery 1000] [--people 4] [--frames-per-person 60]
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+import db
+import face_recognition_module
+import metrics
+from benchmarks import synthetic
+
+FRAME_SIZE = (640, 480)
+
+# Сторона фрагмента с лицом в кадре, px
+PERSON_SIDE = 220
+
+
+def _person(image: np.ndarray) -> Optional[np.ndarray]:
+    """Фрагмент фото с лицом и окружением, PERSON_SIDE x PERSON_SIDE (None — лица нет)."""
+    detection = face_recognition_module.get_recognizer().detect_image(image)
+    if detection.largest() is None:
+        return None
+    x, y, w, h = detection.largest()
+    margin = int(0.8 * w)
+    crop = image[max(0, y - margin):y + h + margin, max(0, x - margin):x + w + margin]
+    return cv2.resize(crop, (PERSON_SIDE, PERSON_SIDE))
+
+
+def make_video(people, frames_per_person: int, quality: int = 80):
+    """JPEG-кадры: каждый человек проходит через кадр слева направо."""
+    width, height = FRAME_SIZE
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    step = (width - PERSON_SIDE) / max(1, frames_per_person - 1)
+    frames = []
+    for person in people:
+        for t in range(frames_per_person):
+            frame = background.copy()
+            x = int(t * step)
+            y = (height - PERSON_SIDE) // 2
+            frame[y:y + PERSON_SIDE, x:x + PERSON_SIDE] = person
+            frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, default=1000)
+    parser.add_argument("--people", type=int, default=4)
+    parser.add_argument("--frames-per-person", type=int, default=60)
+    args = parser.parse_args()
+
+    # Временная БД до импорта модулей, которые читают галерею
+    db.DB = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+    db.init_db()
+    event_id = db.insert("INSERT INTO events(title) VALUES (?)", ("benchmark",))
+
+    import gallery_cache
+    import stream_checkin
+
+    # Люди в кадре — с исходных фото, в галерее — их лица и синтетические участники
+    base = synthetic.load_base_faces()
+    paths = sorted(glob.glob(os.path.join(synthetic.UPLOADS_DIR, "*.jpg")))
+    people = [p for p in (_person(cv2.imread(path)) for path in paths) if p is not None][:args.people]
+    synthetic.fill_gallery(base, start=1)
+    synthetic.fill_gallery(synthetic.make_faces(max(0, args.gallery - len(base)), base=base), start=len(base) + 1)
+    gallery_cache.get_gallery_cache().get()
+
+    frames = make_video(people, args.frames_per_person)
+    metrics.get_registry().reset()
+
+    session = stream_checkin.StreamSession(event_id)
+    results = []
+    t0 = time.perf_counter()
+    for jpeg in frames:
+        results.extend(session.process(jpeg))
+    results.extend(session.close())
+    elapsed = time.perf_counter() - t0
+
+    stats = session.stats()
+    stages = metrics.get_registry().stages()
+    print(f"Галерея: {args.gallery}, людей: {len(people)}, кадров: {len(frames)}")
+    print(f"  всего {elapsed:.2f} с, {len(frames) / elapsed:.1f} кадр/с (с учётом сравнений)")
+    print(f"  детекций: {stats['detections']}, треков: {stats['tracks']}, сравнений: {stats['matches']}")
+    for stage in ("stream_frame", "decode", "detect", "match"):
+        if stage in stages:
+            s = stages[stage]
+            print(f"  {stage:<14} n={s['count']:<5} p50={s.get('p50_ms', 0):>8.2f} мс  p90={s.get('p90_ms', 0):>8.2f} мс")
+    for result in results:
+        print("  ", {k: result[k] for k in ("track", "frame", "status", "login", "score") if k in result})
+
+
+if __name__ == "__main__":
+    main()
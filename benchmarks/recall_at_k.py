@@ -0,0 +1,57 @@
+"""
+Recall@K грубого отбора по pHash/dHash против полного перебора.
+
+Для каждого запроса (новая аугментация лица из галереи) считается:
+  - recall@K (winner) — доля запросов, у которых победитель полного перебора
+    попал в top-K кандидатов (т.е. отбор не изменил бы результат);
+  - recall@K (source) — доля запросов, у которых в top-K попало исходное лицо.
+
+Запуск:
+    python -m benchmarks.recall_at_k [--gallery 1000] [--queries 100] [--k 10 25 50 100]
+"""
+
+import argparse
+
+import numpy as np
+
+import face_recognition_module
+from benchmarks import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    recognizer = face_recognition_module.get_recognizer()
+    rng = np.random.default_rng(args.seed)
+
+    faces = synthetic.make_faces(args.gallery, seed=args.seed)
+    gallery = recognizer.stack_gallery([recognizer.build_template(f) for f in faces])
+
+    sources = rng.choice(len(faces), size=min(args.queries, len(faces)), replace=False)
+    winner_hits = {k: 0 for k in args.k}
+    source_hits = {k: 0 for k in args.k}
+
+    for src in sources:
+        query = recognizer.build_template(synthetic.augment(faces[src], rng))
+        order, _ = recognizer.match_gallery(query, gallery)
+        winner = order[0]
+        ranked = recognizer.select_candidates(query, gallery, len(faces))
+        for k in args.k:
+            top = ranked[:k]
+            winner_hits[k] += int(winner in top)
+            source_hits[k] += int(src in top)
+
+    n = len(sources)
+    print(f"Галерея: {len(faces)}, запросов: {n}")
+    print(f"{'K':>6}{'recall (winner)':>18}{'recall (source)':>18}{'доля галереи':>15}")
+    for k in args.k:
+        print(f"{k:>6}{winner_hits[k] / n:>18.3f}{source_hits[k] / n:>18.3f}{min(k, len(faces)) / len(faces):>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
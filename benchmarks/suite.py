@@ -0,0 +1,298 @@
+"""
+Набор бенчмарков конвейера распознавания: время каждого этапа отдельно
+и сквозной /register, результаты — в JSON, сравнение с базовым прогоном.
+
+Этапы на фото из uploads/ (micro.*):
+  decode, validate_face, extract_face, preprocess_face, build_template,
+  метрики compare_templates по отдельности (ssim, hist, lbp, template, orb)
+  и compare_templates целиком.
+
+Этапы на синтетических галереях (gallery.<N>.*; лица из uploads/ с аугментациями):
+  load — загрузка галереи из БД в кэш, match — 1:N сравнение,
+  match_pruned — 1:N с отсечением, register — POST /register через
+  тестовый клиент Flask (временная БД, запрос — реальное фото; всегда
+  синхронно, независимо от CHECKIN_ASYNC).
+
+Для каждого этапа — медиана, минимум и p90 по повторам, мс.
+
+Запуск:
+    python -m benchmarks.suite --out before.json
+    python -m benchmarks.suite --out after.json --baseline before.json
+    python -m benchmarks.suite --compare before.json after.json
+    python -m benchmarks.suite --sizes 10 100 1000 10000 --repeat 20
+
+С --baseline / --compare этапы, медиана которых выросла больше чем на
+--tolerance (по умолчанию 15%) и больше чем на --min-delta-ms, помечаются
+как регрессии, код выхода — 1.
+"""
+
+import argparse
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+import config
+import db
+import face_recognition_module
+import fast_ssim
+import photo_capture
+from benchmarks import synthetic
+from image_io import load_image
+
+Results = Dict[str, dict]
+
+
+# Минимальная длительность одного замера: быстрые этапы повторяются в цикле,
+# пока замер не станет дольше (иначе шум таймера и планировщика больше самого этапа)
+MIN_SAMPLE_MS = 20.0
+
+
+def measure(fn: Callable, repeat: int, warmup: int = 1) -> dict:
+    """
+    Время одного вызова fn: медиана, минимум и p90 по repeat замерам, мс.
+    Каждый замер — number вызовов подряд (number подбирается по MIN_SAMPLE_MS).
+    """
+    for _ in range(warmup):
+        fn()
+
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = (time.perf_counter() - t0) * 1000
+        if elapsed >= MIN_SAMPLE_MS:
+            break
+        number *= 2 if elapsed * 4 >= MIN_SAMPLE_MS else 10
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) * 1000 / number)
+    return {
+        "median_ms": round(float(np.median(times)), 4),
+        "min_ms": round(float(np.min(times)), 4),
+        "p90_ms": round(float(np.percentile(times, 90)), 4),
+        "runs": repeat,
+        "number": number,
+    }
+
+
+def _photos() -> List[bytes]:
+    """Содержимое фото из uploads/, на которых есть лицо."""
+    recognizer = face_recognition_module.get_recognizer()
+    photos = []
+    for path in sorted(glob.glob(os.path.join(synthetic.UPLOADS_DIR, "*.jpg"))):
+        with open(path, "rb") as f:
+            raw = f.read()
+        if recognizer.extract_face(raw) is not None:
+            photos.append(raw)
+    if len(photos) < 2:
+        raise RuntimeError(f"В {synthetic.UPLOADS_DIR} нужно хотя бы два фото с лицами")
+    return photos
+
+
+def bench_stages(photos: List[bytes], repeat: int) -> Results:
+    """Отдельные этапы на реальных фото (каждый замер — проход по всем фото)."""
+    recognizer = face_recognition_module.get_recognizer()
+    images = [load_image(raw) for raw in photos]
+    faces = [recognizer.extract_face(img) for img in images]
+    templates = [recognizer.build_template(face) for face in faces]
+    pairs = list(zip(templates, templates[1:] + templates[:1]))
+    per_photo = len(photos)
+
+    stages = {
+        "decode": lambda: [load_image(raw) for raw in photos],
+        "validate_face": lambda: [photo_capture.validate_face(raw) for raw in photos],
+        "extract_face": lambda: [recognizer.extract_face(img) for img in images],
+        "preprocess_face": lambda: [recognizer.preprocess_face(face) for face in faces],
+        "build_template": lambda: [recognizer.build_template(face) for face in faces],
+        "metric.ssim": lambda: [
+            fast_ssim.ssim(a["face"], b["face"], (a["ssim_mu"], a["ssim_var"]), (b["ssim_mu"], b["ssim_var"]))
+            for a, b in pairs
+        ],
+        "metric.hist": lambda: [
+            cv2.compareHist(a["hist"].reshape(-1, 1), b["hist"].reshape(-1, 1), cv2.HISTCMP_CORREL)
+            for a, b in pairs
+        ],
+        "metric.lbp": lambda: [
+            cv2.compareHist(a["lbp"].reshape(-1, 1), b["lbp"].reshape(-1, 1), cv2.HISTCMP_CORREL)
+            for a, b in pairs
+        ],
+        "metric.template": lambda: [
+            cv2.matchTemplate(a["face"], b["face"], cv2.TM_CCORR_NORMED) for a, b in pairs
+        ],
+        "metric.orb": lambda: [recognizer.compute_feature_score(a["orb"], b["orb"]) for a, b in pairs],
+        "compare_templates": lambda: [recognizer.compare_templates(a, b) for a, b in pairs],
+    }
+
+    results = {}
+    for name, fn in stages.items():
+        result = measure(fn, repeat)
+        # Время на одно фото (пару), а не на проход по всем
+        for key in ("median_ms", "min_ms", "p90_ms"):
+            result[key] = round(result[key] / per_photo, 4)
+        results[f"micro.{name}"] = result
+        print(f"  micro.{name:<28}{result['median_ms']:>10.3f} мс")
+    return results
+
+
+def bench_galleries(photos: List[bytes], sizes: List[int], repeat: int, seed: int) -> Results:
+    """1:N сравнение и сквозной /register на галереях растущего размера."""
+    # Временная БД до импорта app: приложение не трогает database.db
+    db.DB = os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+    db.init_db()
+
+    import app as app_module
+    import gallery_cache
+
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/admin/add_event", json={"title": "benchmark"})
+    event_id = db.read_one("SELECT id FROM events ORDER BY id DESC LIMIT 1")["id"]
+
+    recognizer = face_recognition_module.get_recognizer()
+    query = recognizer.build_template(recognizer.extract_face(photos[0]))
+    cache = gallery_cache.get_gallery_cache()
+
+    base = synthetic.load_base_faces()
+    faces = synthetic.make_faces(max(sizes), seed=seed, base=base)
+
+    # Замеряется полный запрос: с CHECKIN_ASYNC /register ответил бы 202
+    # до сравнения с галереей
+    config.CHECKIN_ASYNC = False
+
+    def register():
+        response = client.post("/register", data={
+            "event_id": str(event_id), "name": "bench",
+            "photo": (io.BytesIO(photos[0]), "query.jpg"),
+        })
+        assert response.status_code == 200, response.data
+
+    results = {}
+    filled = 0
+    for n in sorted(sizes):
+        t0 = time.perf_counter()
+        synthetic.fill_gallery(faces[filled:n], start=filled + 1)
+        filled = n
+        print(f"  галерея {n}: подготовка {time.perf_counter() - t0:.1f} с")
+
+        def load():
+            cache.invalidate()
+            cache.get()
+
+        _, gallery = cache.get()
+        stages = {
+            "load": (load, max(1, repeat // 5)),
+            "match": (lambda: recognizer.match_gallery(query, gallery), repeat),
+            "match_pruned": (lambda: recognizer.match_gallery(query, gallery, prune_below=70.0), repeat),
+            "register": (register, repeat),
+        }
+        for name, (fn, runs) in stages.items():
+            result = measure(fn, runs)
+            results[f"gallery.{n}.{name}"] = result
+            print(f"  gallery.{n}.{name:<22}{result['median_ms']:>10.3f} мс")
+    return results
+
+
+def environment() -> dict:
+    """Окружение прогона (для сравнения результатов с разных машин)."""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def compare(baseline: Results, current: Results, tolerance: float, min_delta_ms: float = 0.01) -> List[str]:
+    """
+    Печатает таблицу "было/стало" по медианам.
+
+    Returns:
+        имена этапов с регрессией: медиана выросла больше чем на tolerance
+        и больше чем на min_delta_ms
+    """
+    regressions = []
+    print(f"\n{'этап':<36}{'было, мс':>12}{'стало, мс':>12}{'изменение':>11}")
+    for name in sorted(set(baseline) & set(current)):
+        before = baseline[name]["median_ms"]
+        after = current[name]["median_ms"]
+        ratio = after / before if before > 0 else 1.0
+        mark = ""
+        if ratio > 1 + tolerance and after - before > min_delta_ms:
+            mark = "  РЕГРЕССИЯ"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            mark = "  быстрее"
+        print(f"{name:<36}{before:>12.3f}{after:>12.3f}{ratio - 1:>+10.0%}{mark}")
+
+    for name in sorted(set(baseline) - set(current)):
+        print(f"{name:<36}  нет в текущем прогоне")
+    for name in sorted(set(current) - set(baseline)):
+        print(f"{name:<36}  нет в базовом прогоне")
+
+    print(f"\nРегрессий: {len(regressions)} (порог {tolerance:.0%})")
+    return regressions
+
+
+def _load_results(path: str) -> Results:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="размеры синтетических галерей")
+    parser.add_argument("--repeat", type=int, default=10, help="повторов на этап")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-gallery", action="store_true", help="только этапы на отдельных фото")
+    parser.add_argument("--out", help="куда записать результаты (JSON)")
+    parser.add_argument("--baseline", help="базовый прогон (JSON) для сравнения")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="только сравнить два готовых прогона")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="допустимый рост медианы (доля), больше — регрессия")
+    parser.add_argument("--min-delta-ms", type=float, default=0.01,
+                        help="рост медианы меньше этого (мс) не считается регрессией")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(_load_results(args.compare[0]), _load_results(args.compare[1]),
+                              args.tolerance, args.min_delta_ms)
+        sys.exit(1 if regressions else 0)
+
+    photos = _photos()
+    print(f"Фото: {len(photos)}, повторов: {args.repeat}")
+    results = bench_stages(photos, args.repeat)
+    if not args.skip_gallery:
+        results.update(bench_galleries(photos, args.sizes, args.repeat, args.seed))
+
+    report = {"environment": environment(), "args": vars(args), "results": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты: {os.path.abspath(args.out)}")
+
+    if args.baseline:
+        regressions = compare(_load_results(args.baseline), results, args.tolerance, args.min_delta_ms)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
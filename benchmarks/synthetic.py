@@ -0,0 +1,83 @@
+"""
+Синтетические галереи лиц для бенчмарков.
+
+Лица берутся с фото из uploads/ и размножаются аугментациями
+(отражение, яркость/контраст, поворот, масштаб, шум), так что можно
+получить галерею любого размера без реальных персональных данных.
+fill_gallery записывает такую галерею в (временную) БД.
+"""
+
+import glob
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+import db
+import duplicate_index
+import face_recognition_module
+import face_templates
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
+
+
+def load_base_faces(directory: str = UPLOADS_DIR) -> List[np.ndarray]:
+    """Области лиц (BGR) со всех фото каталога, на которых нашлось лицо."""
+    recognizer = face_recognition_module.get_recognizer()
+    faces = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.png"))):
+        face = recognizer.extract_face(path)
+        if face is not None:
+            faces.append(face)
+    if not faces:
+        raise RuntimeError(f"В {directory} нет фото с лицами")
+    return faces
+
+
+def augment(face: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Случайная аугментация области лица (BGR)."""
+    out = face.copy()
+    if rng.random() < 0.5:
+        out = cv2.flip(out, 1)
+
+    out = cv2.convertScaleAbs(out, alpha=rng.uniform(0.6, 1.4), beta=rng.uniform(-30, 30))
+
+    h, w = out.shape[:2]
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-20, 20), rng.uniform(0.85, 1.15))
+    out = cv2.warpAffine(out, m, (w, h), borderMode=cv2.BORDER_REFLECT)
+
+    noise = rng.normal(0, rng.uniform(0, 20), out.shape)
+    return np.clip(out + noise, 0, 255).astype(np.uint8)
+
+
+def make_faces(size: int, seed: int = 0, base: List[np.ndarray] = None) -> List[np.ndarray]:
+    """Галерея из size аугментированных лиц."""
+    rng = np.random.default_rng(seed)
+    base = base if base is not None else load_base_faces()
+    return [augment(base[i % len(base)], rng) for i in range(size)]
+
+
+def fill_gallery(faces: List[np.ndarray], start: int):
+    """Добавляет в БД участников с синтетическими лицами (одна транзакция)."""
+    recognizer = face_recognition_module.get_recognizer()
+    rows = []
+    for i, face in enumerate(faces, start=start):
+        _, buf = cv2.imencode(".jpg", face)
+        template = recognizer.build_template(face)
+        rows.append((i, f"bench{i}", f"Участник {i}", buf.tobytes(), template))
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO participants(id, login, name, photo_blob, photo_ext, photo_mime) "
+            "VALUES (?,?,?,?, '.jpg', 'image/jpeg')",
+            [(i, login, name, blob) for i, login, name, blob, _ in rows]
+        )
+        conn.executemany(
+            "INSERT INTO face_templates(participant_id, version, template) VALUES (?,?,?)",
+            [(i, face_recognition_module.TEMPLATE_VERSION, face_templates.serialize_template(t))
+             for i, _, _, _, t in rows]
+        )
+        conn.executemany(duplicate_index.INSERT_SQL, [duplicate_index.index_row(i, t) for i, _, _, _, t in rows])
+        face_templates.bump_version()
@@ -0,0 +1,408 @@
+"""
+Массовое добавление участников: CSV (login, name, photo) + фото в ZIP-архиве
+или каталоге.
+
+    python bulk_enroll.py people.csv photos.zip
+    python bulk_enroll.py people.csv photos/ --dry-run --report report.json
+
+То же через веб — POST /admin/bulk_enroll (файлы csv и archive).
+
+Порядок:
+  1. строки CSV проверяются без фото: пустой логин, повтор логина в CSV,
+     логин уже есть в БД, нет файла фото, неподдерживаемое расширение;
+  2. проверка лица и шаблон признаков (самая дорогая часть) — в пуле
+     процессов BULK_WORKERS, фото подаются ограниченным окном;
+  3. повторная регистрация того же лица (DUPLICATE_PHASH_RADIUS) — по индексу
+     pHash в БД и среди уже принятых строк этого же CSV; force — пропустить;
+  4. все принятые строки записываются одной транзакцией: participants
+     (id — AUTOINCREMENT, по строке), face_templates, face_hash_index
+     (executemany) и версия галереи.
+
+Результат — отчёт по каждой строке (status ok/error, code, msg) и сводка.
+В памяти до записи держатся только сериализованные шаблоны (~150 КБ на
+участника), сами фото перечитываются из архива при записи.
+
+Формат CSV: первая строка — заголовок с колонкой login (name и photo —
+необязательные), разделитель , ; или табуляция. Без колонки photo файл
+ищется по логину: <login>.jpg / .jpeg / .png. Имена файлов сравниваются
+без учёта регистра и каталогов внутри архива.
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+import config
+import db
+import duplicate_index
+import face_recognition_module
+import face_templates
+import metrics
+import perceptual_hash
+import photo_capture
+from face_recognition_module import TEMPLATE_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Расширения и MIME-типы фото (как у /admin/add_participant)
+PHOTO_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+# Фото больше этого размера не читаются (защита от «ZIP-бомб»)
+MAX_PHOTO_BYTES = 20 * 1024 * 1024
+
+# Сколько фото на исполнителя одновременно в работе (остальные ещё не прочитаны)
+WINDOW_PER_WORKER = 4
+
+# Сколько логинов проверяется одним запросом IN (...)
+LOGIN_CHUNK = 500
+
+
+class BulkError(Exception):
+    """Входные данные нельзя обработать целиком (нет колонки login, битый архив)."""
+
+
+class PhotoSource:
+    """Фото из ZIP-архива или каталога; поиск по имени файла без учёта регистра."""
+
+    def __init__(self, source: Union[str, BinaryIO]):
+        self._zip = None
+        self._dir = None
+        if isinstance(source, str) and os.path.isdir(source):
+            self._dir = source
+            names = [
+                os.path.relpath(os.path.join(root, f), source)
+                for root, _, files in os.walk(source) for f in files
+            ]
+        else:
+            try:
+                self._zip = zipfile.ZipFile(source)
+            except (zipfile.BadZipFile, OSError) as e:
+                raise BulkError(f"bad archive: {e}") from e
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+
+        self._names: Dict[str, str] = {}
+        for name in sorted(names):
+            self._names.setdefault(os.path.basename(name).lower(), name)
+
+    def find(self, login: str, photo: Optional[str]) -> Optional[str]:
+        """Имя файла фото в источнике (photo из CSV или <login>.<ext>) или None."""
+        if photo:
+            return self._names.get(os.path.basename(photo.replace("\\", "/")).lower())
+        for ext in PHOTO_TYPES:
+            name = self._names.get(f"{login}{ext}".lower())
+            if name is not None:
+                return name
+        return None
+
+    def size(self, name: str) -> int:
+        if self._zip is not None:
+            return self._zip.getinfo(name).file_size
+        return os.path.getsize(os.path.join(self._dir, name))
+
+    def read(self, name: str) -> bytes:
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self._dir, name), "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def read_manifest(text: str) -> List[dict]:
+    """
+    Строки CSV: row (номер строки файла), login, name, photo.
+
+    Raises:
+        BulkError: нет заголовка с колонкой login
+    """
+    text = text.lstrip("\ufeff")
+    try:
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    fields = [(f or "").strip().lower() for f in (reader.fieldnames or [])]
+    if "login" not in fields:
+        raise BulkError("csv header must contain login")
+    reader.fieldnames = fields
+
+    rows = []
+    for record in reader:
+        values = {k: (v or "").strip() for k, v in record.items() if k}
+        if not any(values.values()):
+            continue
+        rows.append({
+            "row": reader.line_num,
+            "login": values.get("login", ""),
+            "name": values.get("name") or None,
+            "photo": values.get("photo") or None,
+        })
+    return rows
+
+
+def _process_photo(raw: bytes) -> Tuple[Optional[str], Optional[bytes], str]:
+    """
+    Проверка лица и шаблон признаков (выполняется в процессе пула).
+
+    Returns:
+        (code ошибки или None, сериализованный шаблон, сообщение)
+    """
+    recognizer = face_recognition_module.get_recognizer()
+    try:
+        detection = recognizer.detect(raw)
+    except Exception as e:
+        return "FACE_CHECK_FAILED", None, f"Не удалось проверить фото: {e}"
+
+    if not photo_capture.validate_detection(detection):
+        return "NO_FACE", None, "На фото не обнаружено лицо человека (или лиц больше одного)."
+
+    template = recognizer.build_template(detection.face_roi())
+    return None, face_templates.serialize_template(template), ""
+
+
+def _warmup(_=None) -> bool:
+    """Пустая задача: процесс пула загружает каскад до первого фото."""
+    face_recognition_module.get_recognizer()
+    return True
+
+
+def _process_all(source: PhotoSource, entries: List[dict], workers: int) -> Iterator[Tuple[dict, tuple]]:
+    """(строка, результат _process_photo) для каждой строки, в порядке entries."""
+    if workers <= 1:
+        for entry in entries:
+            yield entry, _process_photo(source.read(entry["file"]))
+        return
+
+    window = workers * WINDOW_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_warmup, range(workers)))
+        pending = []
+        for entry in entries:
+            pending.append((entry, pool.submit(_process_photo, source.read(entry["file"]))))
+            if len(pending) >= window:
+                entry, future = pending.pop(0)
+                yield entry, future.result()
+        for entry, future in pending:
+            yield entry, future.result()
+
+
+def _existing_logins(conn: sqlite3.Connection, logins: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(logins), LOGIN_CHUNK):
+        chunk = logins[start:start + LOGIN_CHUNK]
+        existing.update(
+            row[0] for row in conn.execute(
+                f"SELECT login FROM participants WHERE login IN ({','.join('?' * len(chunk))})", chunk
+            )
+        )
+    return existing
+
+
+def _fail(entry: dict, code: str, msg: str, **extra):
+    entry.update({"status": "error", "code": code, "msg": msg, **extra})
+
+
+def enroll(
+    rows: List[dict],
+    source: PhotoSource,
+    force: bool = False,
+    dry_run: bool = False,
+    workers: Optional[int] = None,
+) -> dict:
+    """
+    Добавляет участников из строк read_manifest с фото из source.
+
+    Args:
+        force: не проверять повторную регистрацию того же лица
+        dry_run: только проверить (status valid), ничего не записывать
+        workers: процессов для проверки фото; None — config.BULK_WORKERS (0 — по числу ядер)
+
+    Returns:
+        {"status": "ok", "rows": [...], "total", "added", "failed", "elapsed_s", "photos_per_min"}
+    """
+    t0 = time.perf_counter()
+    workers = config.BULK_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+
+    entries = [{"row": r["row"], "login": r["login"], "name": r["name"], "photo": r["photo"]} for r in rows]
+
+    # 1) проверки без фото
+    existing = _existing_logins(db.connection(), [e["login"] for e in entries if e["login"]])
+
+    seen = set()
+    todo = []
+    for entry in entries:
+        login = entry["login"]
+        if not login:
+            _fail(entry, "EMPTY_LOGIN", "empty login")
+            continue
+        if login in seen:
+            _fail(entry, "DUPLICATE_LOGIN", "login repeated in csv")
+            continue
+        seen.add(login)
+        if login in existing:
+            _fail(entry, "LOGIN_EXISTS", "login exists")
+            continue
+
+        name = source.find(login, entry["photo"])
+        if name is None:
+            _fail(entry, "NO_PHOTO", f"photo not found: {entry['photo'] or login}")
+            continue
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in PHOTO_TYPES:
+            _fail(entry, "BAD_EXT", f"bad ext: {ext}")
+            continue
+        if source.size(name) > MAX_PHOTO_BYTES:
+            _fail(entry, "TOO_LARGE", f"photo larger than {MAX_PHOTO_BYTES} bytes")
+            continue
+        entry["file"] = name
+        todo.append(entry)
+
+    # 2) проверка лица и шаблоны — в пуле процессов
+    # 3) повторная регистрация того же лица: индекс в БД + уже принятые строки
+    radius = 0 if force else config.DUPLICATE_PHASH_RADIUS
+    accepted: List[Tuple[dict, bytes, dict]] = []
+    batch_hashes: List[int] = []
+    with metrics.timer("bulk_process"):
+        for entry, (code, blob, msg) in _process_all(source, todo, workers):
+            if code is not None:
+                _fail(entry, code, msg)
+                continue
+
+            template = face_templates.deserialize_template(blob)
+            if radius > 0:
+                matches = duplicate_index.lookup(template["phash"], template["dhash"], radius)
+                if matches:
+                    _fail(entry, "DUPLICATE_FACE", "similar face already registered",
+                          matches=[m["login"] for m in matches])
+                    continue
+                if batch_hashes:
+                    distance = perceptual_hash.hamming(template["phash"], np.array(batch_hashes, dtype=np.uint64))
+                    close = np.flatnonzero(distance <= radius)
+                    if len(close):
+                        _fail(entry, "DUPLICATE_FACE", "similar face earlier in this csv",
+                              matches=[accepted[i][0]["login"] for i in close])
+                        continue
+
+            accepted.append((entry, blob, template))
+            batch_hashes.append(int(template["phash"]))
+
+    # 4) одна транзакция на все принятые строки
+    if dry_run:
+        for entry, _, _ in accepted:
+            entry["status"] = "valid"
+    elif accepted:
+        with metrics.timer("bulk_write"):
+            _insert(source, accepted)
+
+    for entry in entries:
+        entry.pop("file", None)
+
+    elapsed = time.perf_counter() - t0
+    added = sum(e.get("status") == "ok" for e in entries)
+    failed = sum(e.get("status") == "error" for e in entries)
+    return {
+        "status": "ok",
+        "total": len(entries),
+        "added": added,
+        "failed": failed,
+        "dry_run": dry_run,
+        "elapsed_s": round(elapsed, 3),
+        "photos_per_min": round(len(todo) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        "rows": entries,
+    }
+
+
+def _insert(source: PhotoSource, accepted: List[Tuple[dict, bytes, dict]]):
+    """
+    Записывает принятых участников одной транзакцией. Логины, которые успели
+    появиться в БД после проверки, помечаются LOGIN_EXISTS и не записываются.
+    """
+    with db.transaction() as conn:
+        taken = _existing_logins(conn, [entry["login"] for entry, _, _ in accepted])
+        for entry, _, _ in accepted:
+            if entry["login"] in taken:
+                _fail(entry, "LOGIN_EXISTS", "login exists")
+        accepted = [item for item in accepted if item[0]["login"] not in taken]
+
+        # id выдаёт AUTOINCREMENT (как при добавлении через /admin): id удалённых
+        # участников не переиспользуются и не подхватывают их отметки в журнале.
+        # Фото перечитываются из источника по одному — не держим все в памяти
+        for entry, _, _ in accepted:
+            ext = os.path.splitext(entry["file"])[1].lower()
+            entry["participant_id"] = conn.execute(
+                "INSERT INTO participants(login,name,photo_blob,photo_ext,photo_mime) VALUES (?,?,?,?,?)",
+                (entry["login"], entry["name"], sqlite3.Binary(source.read(entry["file"])), ext, PHOTO_TYPES[ext])
+            ).lastrowid
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO face_templates(participant_id, version, template) VALUES (?,?,?)",
+            ((entry["participant_id"], TEMPLATE_VERSION, blob) for entry, blob, _ in accepted)
+        )
+        conn.executemany(
+            duplicate_index.INSERT_SQL,
+            (duplicate_index.index_row(entry["participant_id"], template) for entry, _, template in accepted)
+        )
+        # Кэши галереи (во всех процессах) заметят новую версию и перезагрузятся
+        conn.execute("UPDATE gallery_version SET version = version + 1 WHERE id = 1")
+
+    for entry, _, _ in accepted:
+        entry["status"] = "ok"
+    logger.info("bulk enroll: добавлено %d участников", len(accepted))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовое добавление участников (CSV + фото)")
+    parser.add_argument("csv", help="CSV с колонками login, name, photo")
+    parser.add_argument("photos", help="ZIP-архив или каталог с фото")
+    parser.add_argument("--force", action="store_true", help="не проверять повторную регистрацию лица")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить, ничего не записывать")
+    parser.add_argument("--workers", type=int, default=None, help="процессов (по умолчанию BULK_WORKERS)")
+    parser.add_argument("--report", help="сохранить отчёт по строкам в JSON")
+    args = parser.parse_args()
+
+    db.init_db(clear_events=False, clear_participants=False)
+    with open(args.csv, encoding="utf-8-sig") as f:
+        text = f.read()
+
+    try:
+        rows = read_manifest(text)
+        source = PhotoSource(args.photos)
+    except BulkError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+
+    try:
+        report = enroll(rows, source, force=args.force, dry_run=args.dry_run, workers=args.workers)
+    finally:
+        source.close()
+
+    for entry in report["rows"]:
+        if entry["status"] == "error":
+            print(f"  строка {entry['row']}: {entry['login'] or '-'}: {entry['code']} — {entry['msg']}")
+    verb = "Проверено" if args.dry_run else "Добавлено"
+    count = report["total"] - report["failed"] if args.dry_run else report["added"]
+    print(f"{verb}: {count} из {report['total']}, ошибок: {report['failed']}, "
+          f"{report['elapsed_s']} с ({report['photos_per_min']} фото/мин)")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Регистрация участника на мероприятии по фото (check-in): проверка фото,
+1:N сравнение с галереей и запись в журнал.
+
+Общая часть синхронного /register и фоновых задач (checkin_jobs): работает
+без контекста запроса Flask и возвращает (ответ, HTTP-код). Асинхронный
+/register вызывает prepare (декодирование, проверка лица, шаблон) в запросе,
+а в очередь ставит только шаблон — плохое фото отклоняется сразу.
+"""
+
+import logging
+import random
+import sqlite3
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+import attendance
+import config
+import db
+import face_recognition_module
+import gallery_cache
+import metrics
+import parallel_match
+import photo_capture
+
+logger = logging.getLogger(__name__)
+
+# Порог совпадения: 70%
+THRESHOLD = 70.0
+
+
+def prepare(raw: bytes) -> Tuple[Optional[dict], Optional[Tuple[dict, int]]]:
+    """
+    Проверка фото и шаблон лица для check_in_template.
+
+    Args:
+        raw: содержимое загруженного файла
+
+    Returns:
+        (шаблон, None) или (None, (ответ, HTTP-код)) — bad_photo или error
+    """
+    # 1) проверка лица: одна детекция на запрос (декодирование из памяти),
+    #    её же используем для извлечения
+    recognizer = face_recognition_module.get_recognizer()
+    try:
+        detection = recognizer.detect(raw)
+        ok = photo_capture.validate_detection(detection)
+    except Exception as e:
+        return None, ({"status": "error", "msg": f"face check failed: {str(e)}"}, 400)
+
+    if not ok:
+        return None, ({"status": "bad_photo", "msg": "no face / bad quality"}, 200)
+
+    # 2) признаки загруженного фото считаем один раз
+    with metrics.timer("template"):
+        return recognizer.build_template(detection.face_roi()), None
+
+
+def check_in(event_id: int, raw: bytes) -> Tuple[dict, int]:
+    """
+    Регистрирует владельца лица на фото на мероприятии event_id
+    (prepare + check_in_template).
+
+    Args:
+        event_id: id мероприятия
+        raw: содержимое загруженного файла
+
+    Returns:
+        (ответ, HTTP-код); ответ["status"]: registered, already_registered,
+        not_found, bad_photo или error. В not_found best_candidate и
+        best_score — лучший из полностью посчитанных участников (с отсечением
+        это не обязательно лучший по всей галерее); null, если таких нет
+    """
+    query_template, rejected = prepare(raw)
+    if rejected is not None:
+        return rejected
+    return check_in_template(event_id, query_template)
+
+
+def check_in_template(event_id: int, query_template: dict) -> Tuple[dict, int]:
+    """Регистрация по готовому шаблону лица (результат prepare); ответ — как у check_in."""
+    # 3) сверяем со ВСЕМИ шаблонами (кэш галереи) и находим лучшее совпадение
+    with metrics.timer("gallery"):
+        participants, gallery = gallery_cache.get_gallery_cache().get()
+
+    if not participants:
+        return {"status": "not_found", "msg": "no participants in db"}, 200
+
+    # Сравниваем со ВСЕМИ участниками за один векторизованный проход
+    if query_template is not None:
+        order, scores = match_template(query_template, participants, gallery)
+    else:
+        # Если лица нет, у всех минимальный score
+        scores = np.zeros(len(participants))
+        order = np.arange(len(participants))
+
+    # Оценки в лог — только для доли запросов и только на уровне DEBUG:
+    # построчный вывод по всей галерее сам по себе дорог
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < config.REGISTER_LOG_SAMPLE:
+        top = [i for i in order[:config.REGISTER_LOG_TOP] if not np.isnan(scores[i])]
+        logger.debug("register: лучшие из %d: %s", len(participants),
+                     ", ".join(f"{participants[i]['login']}={scores[i]:.1f}%" for i in top))
+
+    # Находим участника с максимальным score
+    found = best_candidate(participants, order, scores)
+    if found is None:
+        return {"status": "not_found", "best_candidate": None, "best_score": None}, 200
+    best, score = found
+    best_match = {
+        "participant_id": best["participant_id"],
+        "login": best["login"],
+        "name": best["name"],
+        "score": score
+    }
+    
+    if best_match["score"] >= THRESHOLD:
+        # Пытаемся зарегистрировать
+        try:
+            with metrics.timer("db_write"):
+                db.execute(
+                    "INSERT INTO attendance(participant_id,event_id,timestamp,ts,match_score) VALUES (?,?,?,?,?)",
+                    (best_match["participant_id"], event_id, *attendance.stamp(), best_match["score"])
+                )
+            return {
+                "status": "registered",
+                "login": best_match["login"],
+                "name": best_match["name"],
+                "score": best_match["score"]
+            }, 200
+        except sqlite3.IntegrityError:
+            # Уже зарегистрирован (UNIQUE(participant_id, event_id))
+            return {
+                "status": "already_registered",
+                "login": best_match["login"],
+                "score": best_match["score"]
+            }, 200
+    else:
+        # Не найдено достаточного совпадения
+        return {
+            "status": "not_found",
+            "best_candidate": best_match["login"],
+            "best_score": best_match["score"]
+        }, 200
+
+
+def best_candidate(participants: List[dict], order: np.ndarray,
+                   scores: np.ndarray) -> Optional[Tuple[dict, float]]:
+    """
+    Лучший участник по результату match_template и его оценка; порог
+    (THRESHOLD) проверяет вызывающий.
+
+    Returns:
+        (участник, score) или None, если полностью не посчитан никто
+        (отсечённые — NaN — в конце order; например, пустой список кандидатов)
+    """
+    score = float(scores[order[0]])
+    if not np.isfinite(score):
+        return None
+    return participants[order[0]], score
+
+
+def match_template(query_template: dict, participants: List[dict], gallery: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    1:N сравнение шаблона с галереей по настройкам config (отсечение,
+    грубый отбор по хешам, параллельный пул) под таймером match.
+
+    Returns:
+        (order, scores) — как у FaceRecognizer.match_gallery
+    """
+    recognizer = face_recognition_module.get_recognizer()
+
+    # Отсечение: участники, которые не могут пройти порог или победить,
+    # не досчитываются (SSIM/ORB)
+    prune_below = THRESHOLD if config.MATCH_PRUNE else None
+
+    # Грубый отбор по перцептуальным хешам для больших галерей
+    candidates = None
+    if config.PREFILTER_TOP_K and len(participants) > config.PREFILTER_TOP_K:
+        candidates = recognizer.select_candidates(query_template, gallery, config.PREFILTER_TOP_K)
+
+    matcher = parallel_match.get_matcher()
+    with metrics.timer("match"):
+        if matcher is not None and len(participants) >= config.MATCH_PARALLEL_MIN_GALLERY:
+            return matcher.match(query_template, gallery, candidates, prune_below)
+        return recognizer.match_gallery(query_template, gallery, candidates, prune_below)
+
+
+def check_in_group(event_id: int, raw: bytes) -> Tuple[dict, int]:
+    """
+    Групповая регистрация: все лица на одном фото.
+
+    Детекция — один проход по изображению, сравнение — одна матрица
+    лица x галерея (FaceRecognizer.match_gallery_many), записи в журнал —
+    одна транзакция. Если несколько лиц совпали с одним участником,
+    он достаётся лицу с большей оценкой, остальным — следующий участник
+    выше порога или not_found.
+
+    Returns:
+        (ответ, HTTP-код); ответ: status ("ok", "bad_photo" или "error"),
+        faces — по лицу слева направо: box [x, y, w, h], status
+        (registered / already_registered / not_found), login, name, score;
+        для not_found — best_candidate, best_score (как в check_in)
+    """
+    recognizer = face_recognition_module.get_recognizer()
+    try:
+        detection = recognizer.detect(raw)
+    except Exception as e:
+        return {"status": "error", "msg": f"face check failed: {str(e)}"}, 400
+
+    if not detection.is_valid(require_single_face=False):
+        return {"status": "bad_photo", "msg": "no faces found"}, 200
+    if detection.count > config.GROUP_MAX_FACES:
+        return {
+            "status": "bad_photo",
+            "msg": f"too many faces: {detection.count} (max {config.GROUP_MAX_FACES})",
+        }, 200
+
+    boxes = sorted(detection.faces, key=lambda box: (box[0], box[1]))
+    with metrics.timer("template"):
+        templates = [recognizer.build_template(detection.face_roi(box)) for box in boxes]
+
+    with metrics.timer("gallery"):
+        participants, gallery = gallery_cache.get_gallery_cache().get()
+
+    faces = [{"box": [int(v) for v in box], "status": "not_found"} for box in boxes]
+    if not participants:
+        for face in faces:
+            face["msg"] = "no participants in db"
+        return {"status": "ok", "faces": faces, "registered": 0}, 200
+
+    # Отсечение по порогу — как в check_in; для лица, проигравшего конфликт,
+    # следующий кандидат ищется только среди досчитанных
+    prune_below = THRESHOLD if config.MATCH_PRUNE else None
+    with metrics.timer("match_group"):
+        scores = recognizer.match_gallery_many(templates, gallery, prune_below)
+
+    # Назначение: пары (лицо, участник) по убыванию оценки, каждому лицу
+    # и каждому участнику — не больше одной пары
+    # Отсечённые (NaN) не проходят порог
+    pairs = np.argwhere(scores >= THRESHOLD)
+    order = np.argsort(-scores[pairs[:, 0], pairs[:, 1]], kind="stable")
+    assigned = {}
+    taken = set()
+    for f, p in pairs[order]:
+        if f in assigned or p in taken:
+            continue
+        assigned[f] = p
+        taken.add(p)
+
+    for f, face in enumerate(faces):
+        if f in assigned:
+            p = assigned[f]
+            face.update({
+                "login": participants[p]["login"],
+                "name": participants[p]["name"],
+                "score": float(scores[f, p]),
+            })
+        elif np.isnan(scores[f]).all():
+            face.update({"best_candidate": None, "best_score": None})
+        else:
+            # Лучший среди полностью посчитанных
+            best = int(np.nanargmax(scores[f]))
+            face.update({"best_candidate": participants[best]["login"], "best_score": float(scores[f, best])})
+
+    # Все записи — одной транзакцией; уже отмеченные участники остаются как есть
+    now = attendance.stamp()
+    rows = [(participants[p]["participant_id"], event_id, *now, float(scores[f, p])) for f, p in assigned.items()]
+    with metrics.timer("db_write"):
+        existing = record_attendance(event_id, rows)
+
+    for f, face in enumerate(faces):
+        if f in assigned:
+            participant_id = participants[assigned[f]]["participant_id"]
+            face["status"] = "already_registered" if participant_id in existing else "registered"
+        metrics.inc("group_faces", status=face["status"])
+
+    registered = sum(face["status"] == "registered" for face in faces)
+    return {"status": "ok", "faces": faces, "registered": registered}, 200
+
+
+def record_attendance(event_id: int, rows: List[tuple]) -> Set[int]:
+    """
+    Записывает строки журнала (participant_id, event_id, timestamp, ts, match_score)
+    одной транзакцией (timestamp, ts — attendance.stamp()).
+
+    Returns:
+        participant_id, которые уже были отмечены на мероприятии (их строки не меняются)
+    """
+    if not rows:
+        return set()
+
+    ids = [row[0] for row in rows]
+    with db.transaction() as conn:
+        existing = {
+            row[0] for row in conn.execute(
+                f"SELECT participant_id FROM attendance "
+                f"WHERE event_id=? AND participant_id IN ({','.join('?' * len(ids))})",
+                [event_id, *ids]
+            )
+        }
+        conn.executemany(
+            "INSERT OR IGNORE INTO attendance(participant_id,event_id,timestamp,ts,match_score) VALUES (?,?,?,?,?)",
+            rows
+        )
+    return existing
@@ -0,0 +1,191 @@
+"""
+Асинхронная регистрация (check-in): /register проверяет запрос и фото
+(checkin.prepare: декодирование, ровно одно лицо, шаблон) и ставит шаблон
+в ограниченную очередь, 1:N сравнение и запись в журнал выполняет пул
+фоновых потоков (checkin.check_in_template).
+
+Жизненный цикл задачи: queued -> running -> done.
+Задача, простоявшая в очереди дольше CHECKIN_MAX_WAIT, не выполняется:
+её результат — {"status": "expired"} (клиент может отправить фото заново).
+Если очередь заполнена, новая задача отклоняется (QueueFull -> HTTP 429).
+Завершённые задачи хранятся CHECKIN_JOB_TTL секунд.
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+import checkin
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Очередь задач заполнена — клиенту стоит повторить позже."""
+
+
+class Job:
+    """Задача регистрации по одному фото (шаблону лица из checkin.prepare)."""
+
+    def __init__(self, event_id: int, template: dict):
+        self.id = uuid.uuid4().hex
+        self.event_id = event_id
+        self.template = template
+        self.state = "queued"
+        self.result: Optional[dict] = None
+        self.code = 200
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        # Срабатывает при каждой смене состояния (для SSE)
+        self.changed = threading.Condition()
+
+    def set_state(self, state: str, result: Optional[dict] = None, code: int = 200):
+        with self.changed:
+            self.state = state
+            if state == "running":
+                self.started = time.time()
+            if state == "done":
+                self.finished = time.time()
+                self.result = result
+                self.code = code
+                self.template = None  # шаблон больше не нужен
+            self.changed.notify_all()
+
+    def wait_change(self, state: str, timeout: float) -> str:
+        """Ждёт, пока состояние станет отличным от state (или timeout), и возвращает текущее."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.state != state, timeout)
+            return self.state
+
+    def to_dict(self) -> dict:
+        """Состояние для клиента: результат check_in, когда задача выполнена."""
+        with self.changed:
+            if self.state == "done":
+                return {**self.result, "job_id": self.id}
+            return {"status": self.state, "job_id": self.id}
+
+
+class JobQueue:
+    """Ограниченная очередь задач и пул потоков-исполнителей."""
+
+    def __init__(self, workers: int, max_size: int, max_wait: float, ttl: float):
+        self.workers = max(1, workers)
+        self.max_wait = max_wait
+        self.ttl = ttl
+
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max(1, max_size))
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self._submitted = 0
+        self._rejected = 0
+        self._expired = 0
+        self._completed = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"checkin-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, event_id: int, template: dict) -> Job:
+        """Ставит шаблон лица (checkin.prepare) в очередь. QueueFull — очередь заполнена."""
+        self.start()
+        job = Job(event_id, template)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFull()
+
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+            self._submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        """Удаляет задачи, завершённые больше ttl секунд назад (под блокировкой)."""
+        now = time.time()
+        stale = [job_id for job_id, job in self._jobs.items()
+                 if job.finished is not None and now - job.finished > self.ttl]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.exception("check-in задача %s упала", job.id)
+                job.set_state("done", {"status": "error", "msg": f"internal error: {e}"}, 500)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        waited = time.time() - job.created
+        metrics.observe("queue_wait", waited)
+
+        if waited > self.max_wait:
+            with self._lock:
+                self._expired += 1
+            metrics.inc("register_requests", status="expired")
+            job.set_state("done", {"status": "expired", "msg": "queue wait timeout, try again"}, 200)
+            return
+
+        job.set_state("running")
+        with metrics.timer("job"):
+            result, code = checkin.check_in_template(job.event_id, job.template)
+        metrics.inc("register_requests", status=result.get("status", "unknown"))
+        with self._lock:
+            self._completed += 1
+        job.set_state("done", result, code)
+
+    def stats(self) -> dict:
+        """Глубина очереди и счётчики задач."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "jobs_tracked": len(self._jobs),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "completed": self._completed,
+            }
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Глобальная очередь check-in задач по настройкам config (singleton на процесс)."""
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = JobQueue(
+                    workers=config.CHECKIN_WORKERS,
+                    max_size=config.CHECKIN_QUEUE_SIZE,
+                    max_wait=config.CHECKIN_MAX_WAIT,
+                    ttl=config.CHECKIN_JOB_TTL,
+                )
+    return _jobs
@@ -0,0 +1,99 @@
+"""
+Настройки сервиса.
+Каждое значение можно переопределить одноимённой переменной окружения.
+"""
+
+import os
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+# Детекция лиц (каскад Хаара). Одни и те же параметры для проверки фото
+# (photo_capture.validate_face) и извлечения лица (FaceRecognizer.extract_face):
+# детекция выполняется один раз на изображение.
+DETECT_SCALE_FACTOR = _float("DETECT_SCALE_FACTOR", 1.1)
+DETECT_MIN_NEIGHBORS = _int("DETECT_MIN_NEIGHBORS", 5)
+DETECT_MIN_SIZE = _int("DETECT_MIN_SIZE", 50)
+
+# Большие фото (12-48 Мп с телефонов) детектируются на уменьшенной копии:
+# максимальная сторона копии, px (0 — всегда полный размер), и уточнение
+# найденных боксов в окрестности лица на исходном разрешении.
+DETECT_MAX_SIDE = _int("DETECT_MAX_SIDE", 960)
+DETECT_REFINE = bool(_int("DETECT_REFINE", 1))
+
+
+# Двухэтапный поиск: сколько кандидатов после грубого отбора по pHash/dHash
+# идут на полное сравнение (SSIM/LBP/ORB). 0 — отбор выключен, сравниваются все.
+# Подбирайте K по отчёту: python -m benchmarks.recall_at_k
+PREFILTER_TOP_K = _int("PREFILTER_TOP_K", 0)
+
+# Параллельное 1:N сравнение: число исполнителей (0 — последовательно),
+# размер блока галереи и тип пула ("process" или "thread").
+MATCH_WORKERS = _int("MATCH_WORKERS", 0)
+MATCH_CHUNK_SIZE = _int("MATCH_CHUNK_SIZE", 256)
+MATCH_EXECUTOR = os.environ.get("MATCH_EXECUTOR", "process")
+
+# Меньшие галереи всегда считаются последовательно: накладные расходы пула больше выигрыша
+MATCH_PARALLEL_MIN_GALLERY = _int("MATCH_PARALLEL_MIN_GALLERY", 512)
+
+# Отсечение при 1:N сравнении: метрики считаются от дешёвых к дорогим
+# (гистограммы и template matching -> SSIM -> ORB), участники, чья верхняя
+# граница оценки ниже порога 70% или лучшей уже посчитанной, не досчитываются.
+# Победитель и его оценка не меняются; в ответе not_found — лучший из досчитанных.
+MATCH_PRUNE = _int("MATCH_PRUNE", 0)
+
+# Хранить в кэше галереи статистики SSIM (mu, var) каждого лица: при сравнении
+# фильтруется только перекрёстный член. +128 КБ памяти на участника;
+# 0 — статистики считаются на лету (меньше памяти, медленнее).
+SSIM_GALLERY_STATS = _int("SSIM_GALLERY_STATS", 1)
+
+# Проверка повторной регистрации при добавлении участника: максимальное
+# расстояние Хэмминга pHash лица до уже зарегистрированного (0 — проверка выключена).
+# Поиск идёт по индексу блоков хеша (duplicate_index), до 7 бит — один блок с 1 битом.
+DUPLICATE_PHASH_RADIUS = _int("DUPLICATE_PHASH_RADIUS", 6)
+
+# Логирование оценок /register (уровень DEBUG): доля запросов, для которых
+# пишутся лучшие REGISTER_LOG_TOP участников (построчный вывод всей галереи дорог).
+REGISTER_LOG_SAMPLE = _float("REGISTER_LOG_SAMPLE", 0.05)
+REGISTER_LOG_TOP = _int("REGISTER_LOG_TOP", 5)
+
+# Асинхронная регистрация: /register ставит задачу в очередь и сразу отвечает
+# 202 с job_id, 1:N сравнение выполняют CHECKIN_WORKERS фоновых потоков.
+# Очередь ограничена CHECKIN_QUEUE_SIZE (переполнение — 429 с Retry-After);
+# задача, прождавшая дольше CHECKIN_MAX_WAIT секунд, не выполняется (expired).
+CHECKIN_ASYNC = bool(_int("CHECKIN_ASYNC", 0))
+CHECKIN_WORKERS = _int("CHECKIN_WORKERS", 2)
+CHECKIN_QUEUE_SIZE = _int("CHECKIN_QUEUE_SIZE", 64)
+CHECKIN_MAX_WAIT = _float("CHECKIN_MAX_WAIT", 30.0)
+CHECKIN_RETRY_AFTER = _int("CHECKIN_RETRY_AFTER", 2)
+CHECKIN_JOB_TTL = _float("CHECKIN_JOB_TTL", 300.0)
+CHECKIN_SSE_TIMEOUT = _float("CHECKIN_SSE_TIMEOUT", 60.0)
+
+# Групповая регистрация (/register/group): максимум лиц на одном фото
+GROUP_MAX_FACES = _int("GROUP_MAX_FACES", 20)
+
+# Регистрация по видеопотоку (/register/stream, см. stream_checkin):
+# детекция Хаара — каждый N-й кадр (между ними лицо ведётся слежением)
+STREAM_DETECT_EVERY = _int("STREAM_DETECT_EVERY", 5)
+# Сколько детекций должно подтвердить лицо, прежде чем сравнивать его с галереей
+STREAM_MIN_HITS = _int("STREAM_MIN_HITS", 2)
+# Трек удаляется после стольких детекций подряд без этого лица
+STREAM_MAX_MISSES = _int("STREAM_MAX_MISSES", 2)
+# Минимальное перекрытие (IoU) детекции с треком
+STREAM_MIN_IOU = _float("STREAM_MIN_IOU", 0.3)
+
+# Массовое добавление участников (bulk_enroll): процессов для проверки фото
+# и построения шаблонов (0 — по числу ядер, 1 — без пула)
+BULK_WORKERS = _int("BULK_WORKERS", 0)
+
+# SQLite (см. db): ожидание блокировки (с), кэш страниц на соединение (КБ)
+# и размер отображения файла БД в память (МБ, 0 — выкл.)
+DB_BUSY_TIMEOUT = _float("DB_BUSY_TIMEOUT", 5.0)
+DB_CACHE_KB = _int("DB_CACHE_KB", 16384)
+DB_MMAP_MB = _int("DB_MMAP_MB", 256)
@@ -1,17 +1,146 @@
+"""
+Работа с БД (SQLite).
+
+У каждого потока каждого процесса — своё постоянное соединение (открывается
+при первом обращении): не нужно открывать файл и разбирать схему на каждый
+запрос, а подготовленные операторы остаются в кэше соединения.
+Соединение, унаследованное через fork, в дочернем процессе не используется.
+
+Настройки соединения:
+  - journal_mode=WAL — читатели не блокируют писателя и наоборот;
+  - synchronous=NORMAL — в режиме WAL безопасно при сбое процесса,
+    fsync только на контрольных точках;
+  - cache_size / mmap_size — DB_CACHE_KB / DB_MMAP_MB;
+  - ожидание блокировки — DB_BUSY_TIMEOUT секунд.
+
+Соединения работают в режиме autocommit: одиночный оператор — своя
+транзакция. Помощники:
+    db.read(sql, params)        — SELECT, список строк (sqlite3.Row)
+    db.read_one(sql, params)    — первая строка или None
+    db.execute(sql, params)     — один изменяющий оператор (курсор: lastrowid, rowcount)
+    with db.transaction() as conn: ...  — несколько операторов атомарно
+                                          (BEGIN IMMEDIATE, COMMIT / ROLLBACK при исключении)
+db.query и db.insert оставлены для совместимости.
+
+Схему создаёт init_db; старые БД он же переносит на текущую версию
+(SCHEMA_VERSION, хранится в PRAGMA user_version).
+"""
+
+import os
 import sqlite3
-from typing import Any, Iterable
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional
+
+import config
 
 DB = "database.db"
 
-def get_conn():
-    conn = sqlite3.connect(DB)
+# Версия схемы (PRAGMA user_version), см. _migrate
+SCHEMA_VERSION = 1
+
+# Сколько подготовленных операторов кэширует каждое соединение
+STATEMENT_CACHE = 256
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_opened = 0
+# Соединения, унаследованные через fork: не используются и не закрываются
+# (закрытие тоже обращается к файлу, который держит родитель)
+_inherited: List[sqlite3.Connection] = []
+
+
+def _open(path: str) -> sqlite3.Connection:
+    global _opened
+    conn = sqlite3.connect(
+        path,
+        timeout=config.DB_BUSY_TIMEOUT,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_KB)}")
+    conn.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_MB) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    with _stats_lock:
+        _opened += 1
+    return conn
+
+
+def connection() -> sqlite3.Connection:
+    """Постоянное соединение текущего потока (новое — после fork или смены DB)."""
+    pid = os.getpid()
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key == (pid, DB):
+        return conn
+
+    if conn is not None:
+        if _local.key[0] != pid:
+            _inherited.append(conn)
+        else:
+            conn.close()
+    conn = _open(DB)
+    _local.conn = conn
+    _local.key = (pid, DB)
     return conn
 
+
+def get_conn() -> sqlite3.Connection:
+    """Отдельное соединение с теми же настройками (закрывает вызывающий)."""
+    return _open(DB)
+
+
+@contextmanager
+def transaction():
+    """
+    Транзакция на соединении потока: BEGIN IMMEDIATE (блокировка записи берётся
+    сразу, а не при первом изменении — писатели не упираются в SQLITE_BUSY
+    посреди транзакции), COMMIT в конце, ROLLBACK при исключении.
+    Вложенный вызов работает внутри внешней транзакции.
+    """
+    conn = connection()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def read(sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+    """SELECT: все строки результата."""
+    return connection().execute(sql, tuple(params)).fetchall()
+
+
+def read_one(sql: str, params: Iterable[Any] = ()) -> Optional[sqlite3.Row]:
+    """SELECT: первая строка или None."""
+    return connection().execute(sql, tuple(params)).fetchone()
+
+
+def execute(sql: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
+    """Один изменяющий оператор (своя транзакция или текущая transaction())."""
+    return connection().execute(sql, tuple(params))
+
+
+def stats() -> dict:
+    """Сколько соединений открыто за время жизни процесса."""
+    with _stats_lock:
+        return {"connections_opened": _opened}
+
+
 def init_db(clear_events: bool = True, clear_attendance: bool = False, clear_participants: bool = True):
-    conn = get_conn()
-    c = conn.cursor()
+    with transaction() as conn:
+        _create_schema(conn.cursor(), clear_events, clear_attendance, clear_participants)
 
+
+def _create_schema(c: sqlite3.Cursor, clear_events: bool, clear_attendance: bool, clear_participants: bool):
     # админ только для входа в /admin
     c.execute("""
     CREATE TABLE IF NOT EXISTS admin(
@@ -34,6 +163,44 @@ CREATE TABLE IF NOT EXISTS participants(
 """)
 
 
+    # шаблоны признаков лиц (считаются один раз при добавлении участника)
+    # template = NULL: на эталонном фото не найдено лицо для этой версии
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS face_templates(
+        participant_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        template BLOB,
+        FOREIGN KEY(participant_id) REFERENCES participants(id)
+    )
+    """)
+
+    # индекс перцептуальных хешей лиц (поиск повторной регистрации, см. duplicate_index):
+    # phash/dhash — 64-битные хеши (как int64), c0..c3 — 16-битные блоки pHash
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS face_hash_index(
+        participant_id INTEGER PRIMARY KEY,
+        phash INTEGER NOT NULL,
+        dhash INTEGER NOT NULL,
+        c0 INTEGER NOT NULL,
+        c1 INTEGER NOT NULL,
+        c2 INTEGER NOT NULL,
+        c3 INTEGER NOT NULL,
+        FOREIGN KEY(participant_id) REFERENCES participants(id)
+    )
+    """)
+    for i in range(4):
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_face_hash_c{i} ON face_hash_index(c{i})")
+
+    # счётчик версий галереи: увеличивается при каждом изменении участников/шаблонов,
+    # чтобы все процессы замечали изменения, сделанные другими
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS gallery_version(
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    c.execute("INSERT OR IGNORE INTO gallery_version(id, version) VALUES (1, 0)")
+
     # мероприятия
     c.execute("""
     CREATE TABLE IF NOT EXISTS events(
@@ -42,7 +209,8 @@ CREATE TABLE IF NOT EXISTS participants(
     )
     """)
 
-    # журнал
+    # журнал: timestamp — локальное время текстом (для отображения),
+    # ts — то же время в секундах Unix (фильтры, сортировка, индексы; см. attendance)
     c.execute("""
     CREATE TABLE IF NOT EXISTS attendance(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -50,12 +218,18 @@ CREATE TABLE IF NOT EXISTS participants(
         event_id INTEGER NOT NULL,
         timestamp TEXT NOT NULL,
         match_score REAL,
+        ts INTEGER NOT NULL DEFAULT 0,
         FOREIGN KEY(participant_id) REFERENCES participants(id),
         FOREIGN KEY(event_id) REFERENCES events(id),
         UNIQUE(participant_id, event_id)
     )
     """)
 
+    _migrate(c)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_event_ts ON attendance(event_id, ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_participant_ts ON attendance(participant_id, ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance(ts)")
+
     # seed admin
     c.execute("SELECT 1 FROM admin WHERE username='admin'")
     if not c.fetchone():
@@ -64,18 +238,36 @@ CREATE TABLE IF NOT EXISTS participants(
     if clear_events:
         c.execute("DELETE FROM events")    
     if clear_participants:
+        c.execute("DELETE FROM face_templates")
+        c.execute("DELETE FROM face_hash_index")
         c.execute("DELETE FROM participants")
+        c.execute("UPDATE gallery_version SET version = version + 1 WHERE id = 1")
     if clear_attendance:
         c.execute("DELETE FROM attendance")
 
-    conn.commit()
-    conn.close()
+
+def _migrate(c: sqlite3.Cursor):
+    """Доводит схему старой БД до SCHEMA_VERSION (в транзакции init_db)."""
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+
+    if version < 1:
+        # 1: attendance.ts — время отметки в секундах Unix, из текстового timestamp
+        # (локальное время, как его пишет str(datetime.now()))
+        columns = {row[1] for row in c.execute("PRAGMA table_info(attendance)")}
+        if "ts" not in columns:
+            c.execute("ALTER TABLE attendance ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+            c.execute("UPDATE attendance SET ts = COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0)")
+
+    if version < SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
 
 def query(sql: str, params: Iterable[Any] = (), fetch: bool = False):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute(sql, tuple(params))
-    data = c.fetchall() if fetch else None
-    conn.commit()
-    conn.close()
-    return data
+    """Совместимость: read (fetch=True) или execute."""
+    cursor = execute(sql, params)
+    return cursor.fetchall() if fetch else None
+
+
+def insert(sql: str, params: Iterable[Any] = ()) -> int:
+    """Выполняет INSERT и возвращает id новой строки."""
+    return execute(sql, params).lastrowid
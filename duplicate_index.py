@@ -0,0 +1,125 @@
+"""
+Индекс перцептуальных хешей лиц для поиска повторной регистрации.
+
+Multi-index hashing прямо в SQLite: 64-битный pHash нормализованного лица
+делится на 4 блока по 16 бит, по каждому блоку — свой индекс.
+Если расстояние Хэмминга двух хешей не больше radius, то хотя бы один
+блок отличается не больше чем на radius // 4 бит (принцип Дирихле).
+Поэтому кандидаты — строки, у которых какой-то блок совпадает с блоком
+запроса с точностью до radius // 4 бит; точное расстояние проверяется
+уже по небольшому списку кандидатов.
+
+Поиск — несколько десятков обращений к индексам вместо перебора всей
+галереи: время почти не растёт с числом участников.
+"""
+
+from itertools import combinations
+from typing import List, Optional
+
+import db
+
+CHUNKS = 4
+CHUNK_BITS = 16
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+# Запрос добавления строки индекса (параметры — index_row)
+INSERT_SQL = (
+    "INSERT OR REPLACE INTO face_hash_index(participant_id, phash, dhash, c0, c1, c2, c3) "
+    "VALUES (?,?,?,?,?,?,?)"
+)
+
+
+def _to_signed(value: int) -> int:
+    """uint64 -> int64 (SQLite хранит только знаковые целые)."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def split_hash(value: int) -> List[int]:
+    """64-битный хеш -> 4 блока по 16 бит (от старших к младшим)."""
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & _CHUNK_MASK for i in range(CHUNKS)]
+
+
+def _neighbours(chunk: int, radius: int) -> List[int]:
+    """Все 16-битные значения на расстоянии Хэмминга <= radius от chunk."""
+    values = [chunk]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def add(participant_id: int, template: Optional[dict]):
+    """Добавляет (обновляет) хеши участника; None — лица нет, строка удаляется."""
+    if template is None:
+        remove(participant_id)
+        return
+
+    db.execute(INSERT_SQL, index_row(participant_id, template))
+
+
+def index_row(participant_id: int, template: dict) -> tuple:
+    """Параметры INSERT_SQL для шаблона участника (для executemany в общей транзакции)."""
+    phash = int(template["phash"])
+    return (participant_id, _to_signed(phash), _to_signed(int(template["dhash"])), *split_hash(phash))
+
+
+def remove(participant_id: int):
+    db.execute("DELETE FROM face_hash_index WHERE participant_id=?", (participant_id,))
+
+
+def lookup(phash: int, dhash: int, radius: int) -> List[dict]:
+    """
+    Участники с pHash на расстоянии <= radius.
+
+    Returns:
+        список dict: participant_id, login, name, phash_distance, dhash_distance —
+        по возрастанию расстояния pHash
+    """
+    chunk_radius = radius // CHUNKS
+    conditions = []
+    params = []
+    for i, chunk in enumerate(split_hash(phash)):
+        values = _neighbours(chunk, chunk_radius)
+        conditions.append(f"h.c{i} IN ({','.join('?' * len(values))})")
+        params.extend(values)
+
+    rows = db.read(f"""
+        SELECT h.participant_id, h.phash, h.dhash, p.login, p.name
+        FROM face_hash_index h
+        JOIN participants p ON p.id = h.participant_id
+        WHERE {' OR '.join(conditions)}
+    """, params)
+
+    matches = []
+    for row in rows:
+        phash_distance = bin(phash ^ _to_unsigned(row["phash"])).count("1")
+        if phash_distance > radius:
+            continue
+        matches.append({
+            "participant_id": row["participant_id"],
+            "login": row["login"],
+            "name": row["name"],
+            "phash_distance": phash_distance,
+            "dhash_distance": bin(dhash ^ _to_unsigned(row["dhash"])).count("1"),
+        })
+
+    matches.sort(key=lambda m: (m["phash_distance"], m["dhash_distance"], m["participant_id"]))
+    return matches
+
+
+def missing() -> List[int]:
+    """Участники с шаблоном (лицом), но без строки в индексе."""
+    rows = db.read("""
+        SELECT t.participant_id FROM face_templates t
+        LEFT JOIN face_hash_index h ON h.participant_id = t.participant_id
+        WHERE t.template IS NOT NULL AND h.participant_id IS NULL
+    """)
+    return [row["participant_id"] for row in rows]
@@ -0,0 +1,361 @@
+"""
+Детекция лиц: пул каскадов Хаара и единый результат детекции.
+
+Файл каскада проверяется и загружается один раз (CascadePool); классификаторы
+переиспользуются между запросами — каждый поток на время детекции берёт
+свой экземпляр из пула, поэтому один CascadeClassifier никогда не
+используется двумя потоками одновременно.
+
+Изображение декодируется и прогоняется через каскад ОДИН раз;
+дальше один и тот же объект FaceDetection используется и для проверки
+(ровно одно лицо?), и для вырезания области лица, и для сравнения.
+Параметры детекции общие для проверки и извлечения (см. config.DETECT_*).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CASCADE_PATH = os.path.join(BASE_DIR, "cascades", "haarcascade_frontalface_default.xml")
+
+
+# --- Windows short-path fix (для кириллицы в путях) ---
+def _to_short_path(path: str) -> str:
+    """Возвращает DOS 8.3 short path на Windows. На других ОС — как есть."""
+    if os.name != "nt":
+        return path
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        GetShortPathNameW = ctypes.windll.kernel32.GetShortPathNameW
+        GetShortPathNameW.argtypes = [wintypes.LPCWSTR, wintypes.LPWSTR, wintypes.DWORD]
+        GetShortPathNameW.restype = wintypes.DWORD
+
+        buf = ctypes.create_unicode_buffer(4096)
+        res = GetShortPathNameW(path, buf, 4096)
+        return buf.value if res else path
+    except Exception:
+        return path
+
+
+# Поля вокруг найденного лица для захвата контекста (доля от стороны)
+FACE_PADDING = 0.2
+
+# Окрестность грубого бокса для уточняющей детекции (доля от стороны)
+REFINE_MARGIN = 0.5
+
+# Сторона окрестности при уточнении, px: окрестность любого размера
+# уменьшается до неё (лицо ~120 px), поэтому уточнение стоит одинаково
+# для любого разрешения, а сильно увеличенное (размытое) лицо не теряется
+REFINE_SIDE = 240
+
+# Насколько ослабляется min_neighbors грубого прохода при уточнении
+COARSE_NEIGHBORS_SLACK = 2
+
+# Запасные проходы, если на уменьшенной копии лиц не нашлось: копии со
+# стороной max_side * k (или исходник, если он не больше), по очереди до
+# первого найденного лица
+FALLBACK_SCALES = (1.5, 2.0)
+
+Box = Tuple[int, int, int, int]
+
+
+class FaceDetection:
+    """Изображение, его grayscale-версия и найденные лица."""
+
+    def __init__(self, image: np.ndarray, gray: np.ndarray, faces: List[Box]):
+        self.image = image
+        self.gray = gray
+        self.faces = faces
+
+    @property
+    def count(self) -> int:
+        """Количество найденных лиц."""
+        return len(self.faces)
+
+    def is_valid(self, require_single_face: bool = True) -> bool:
+        """Проходит ли фото проверку: ровно одно лицо (или хотя бы одно)."""
+        return self.count == 1 if require_single_face else self.count > 0
+
+    def largest(self) -> Optional[Box]:
+        """Самое большое лицо (x, y, w, h) или None."""
+        if not self.faces:
+            return None
+        return max(self.faces, key=lambda face: face[2] * face[3])
+
+    def roi_box(self, box: Optional[Box] = None) -> Optional[Box]:
+        """Границы области лица с полями FACE_PADDING: (x1, y1, x2, y2)."""
+        box = box if box is not None else self.largest()
+        if box is None:
+            return None
+
+        x, y, w, h = box
+        padding = int(FACE_PADDING * max(w, h))
+        x1 = max(0, x - padding)
+        y1 = max(0, y - padding)
+        x2 = min(self.image.shape[1], x + w + padding)
+        y2 = min(self.image.shape[0], y + h + padding)
+        return x1, y1, x2, y2
+
+    def face_roi(self, box: Optional[Box] = None) -> Optional[np.ndarray]:
+        """
+        Область лица (BGR) для сравнения.
+
+        Args:
+            box: лицо из self.faces; None — самое большое
+        """
+        bounds = self.roi_box(box)
+        if bounds is None:
+            return None
+        x1, y1, x2, y2 = bounds
+        return self.image[y1:y2, x1:x2]
+
+
+def _run_cascade(cascade, gray, scale_factor, min_neighbors, min_size, max_size=(0, 0)) -> List[Box]:
+    faces = cascade.detectMultiScale(
+        gray,
+        scaleFactor=scale_factor,
+        minNeighbors=min_neighbors,
+        minSize=min_size,
+        maxSize=max_size,
+    )
+    return [tuple(int(v) for v in face) for face in faces]
+
+
+def _shrink(gray: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """
+    Уменьшенная копия со стороной не больше max_side и её масштаб.
+
+    Сначала уменьшение в целое число раз k (край обрезается до кратного k,
+    не больше k - 1 px) — у INTER_AREA для целого k быстрый путь; остаток
+    досчитывается на уже маленькой копии.
+    """
+    k = max(1, max(gray.shape) // max_side)
+    if k > 1:
+        h, w = gray.shape[:2]
+        gray = cv2.resize(gray[:h // k * k, :w // k * k], (w // k, h // k), interpolation=cv2.INTER_AREA)
+    scale = min(1.0, max_side / max(gray.shape))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale / k
+
+
+def _refine_box(cascade, gray, box: Box, scale_factor, min_neighbors) -> Optional[Box]:
+    """
+    Проверяет и уточняет грубый бокс (найденный на уменьшенной копии)
+    повторной детекцией в окрестности лица на исходном изображении.
+    Окрестность уменьшается до REFINE_SIDE.
+
+    Returns:
+        уточнённый бокс или None, если лицо в окрестности не подтвердилось
+    """
+    x, y, w, h = box
+    margin = int(REFINE_MARGIN * max(w, h))
+    x1, y1 = max(0, x - margin), max(0, y - margin)
+    x2, y2 = min(gray.shape[1], x + w + margin), min(gray.shape[0], y + h + margin)
+    crop, scale = _shrink(gray[y1:y2, x1:x2], REFINE_SIDE)
+
+    side = max(w, h) * scale
+    faces = _run_cascade(
+        cascade, crop, scale_factor, min_neighbors,
+        min_size=(int(side * 0.7), int(side * 0.7)),
+        max_size=(int(side * 1.4) + 1, int(side * 1.4) + 1),
+    )
+    if not faces:
+        return None
+
+    fx, fy, fw, fh = max(faces, key=lambda face: face[2] * face[3])
+    return (
+        x1 + int(round(fx / scale)),
+        y1 + int(round(fy / scale)),
+        int(round(fw / scale)),
+        int(round(fh / scale)),
+    )
+
+
+def _detect_scaled(cascade, gray, max_side, scale_factor, min_neighbors, min_size, refine) -> List[Box]:
+    """Детекция на копии со стороной max_side; боксы — в координатах gray."""
+    small, scale = _shrink(gray, max_side)
+    small_min = (max(1, int(min_size[0] * scale)), max(1, int(min_size[1] * scale)))
+    coarse_neighbors = max(1, min_neighbors - COARSE_NEIGHBORS_SLACK) if refine else min_neighbors
+    coarse = _run_cascade(cascade, small, scale_factor, coarse_neighbors, small_min)
+
+    boxes = []
+    for x, y, w, h in coarse:
+        box = (int(round(x / scale)), int(round(y / scale)), int(round(w / scale)), int(round(h / scale)))
+        if refine:
+            box = _refine_box(cascade, gray, box, scale_factor, min_neighbors)
+        if box is not None:
+            boxes.append(box)
+    return boxes
+
+
+def detect_faces(
+    image: np.ndarray,
+    cascade: cv2.CascadeClassifier,
+    scale_factor: Optional[float] = None,
+    min_neighbors: Optional[int] = None,
+    min_size: Optional[Tuple[int, int]] = None,
+    max_side: Optional[int] = None,
+    refine: Optional[bool] = None,
+) -> FaceDetection:
+    """
+    Детекция лиц на декодированном изображении (BGR).
+    Параметры по умолчанию — config.DETECT_*.
+
+    Большие фото (сторона больше max_side) прогоняются через каскад в уменьшенной
+    копии, боксы переводятся обратно в координаты исходника. С refine грубый
+    проход идёт с ослабленным min_neighbors (уменьшение размывает лицо), а каждый
+    кандидат подтверждается и уточняется в своей окрестности (REFINE_SIDE) с
+    полным min_neighbors. Если так не найдено ни одного лица, фото проверяется
+    на копиях крупнее (FALLBACK_SCALES) с полным min_neighbors — лицо, потерянное
+    при уменьшении, находится ценой лишних проходов только для таких фото.
+    Размер лица min_size задаётся в пикселях исходного изображения.
+    """
+    scale_factor = scale_factor or config.DETECT_SCALE_FACTOR
+    min_neighbors = min_neighbors or config.DETECT_MIN_NEIGHBORS
+    min_size = min_size or (config.DETECT_MIN_SIZE, config.DETECT_MIN_SIZE)
+    max_side = config.DETECT_MAX_SIDE if max_side is None else max_side
+    refine = config.DETECT_REFINE if refine is None else refine
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    longest = max(gray.shape)
+    if max_side <= 0 or longest <= max_side:
+        boxes = _run_cascade(cascade, gray, scale_factor, min_neighbors, tuple(min_size))
+        return FaceDetection(image, gray, boxes)
+
+    boxes = _detect_scaled(cascade, gray, max_side, scale_factor, min_neighbors, min_size, refine)
+    for factor in FALLBACK_SCALES:
+        if boxes:
+            break
+        side = int(max_side * factor)
+        if side >= longest:
+            boxes = _run_cascade(cascade, gray, scale_factor, min_neighbors, tuple(min_size))
+            break
+        boxes = _detect_scaled(cascade, gray, side, scale_factor, min_neighbors, min_size, False)
+
+    return FaceDetection(image, gray, boxes)
+
+
+def _check_cascade_file(path: str) -> str:
+    """Проверяет файл каскада и возвращает путь, пригодный для OpenCV."""
+    if not os.path.isfile(path):
+        raise RuntimeError(f"Не найден файл каскада: {path}")
+
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        raise RuntimeError(f"Не удалось получить размер файла каскада: {path}. {e}") from e
+
+    if size < 1000:  # на всякий случай: xml должен быть существенно больше
+        raise RuntimeError(f"Файл каскада подозрительно маленький ({size} байт): {path}")
+
+    return _to_short_path(path)
+
+
+class CascadePool:
+    """
+    Пул классификаторов CascadeClassifier.
+
+    Файл проверяется один раз в конструкторе, первый классификатор
+    загружается сразу. Новые экземпляры создаются только если все
+    существующие заняты (пул растёт до числа одновременных детекций).
+    """
+
+    def __init__(self, path: str = CASCADE_PATH):
+        self.path = _check_cascade_file(path)
+
+        self._lock = threading.Lock()
+        self._free: List[cv2.CascadeClassifier] = []
+
+        self._loaded = 0
+        self._load_ms_total = 0.0
+        self._detect_calls = 0
+        self._detect_ms_total = 0.0
+        self._detect_ms_max = 0.0
+
+        self._free.append(self._load())
+
+    def _load(self) -> cv2.CascadeClassifier:
+        t0 = time.perf_counter()
+        cascade = cv2.CascadeClassifier(self.path)
+        if cascade.empty():
+            raise RuntimeError(f"Не удалось загрузить каскад: {self.path}")
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        with self._lock:
+            self._loaded += 1
+            self._load_ms_total += elapsed
+        return cascade
+
+    @contextmanager
+    def acquire(self):
+        """Берёт классификатор из пула на время блока with."""
+        with self._lock:
+            cascade = self._free.pop() if self._free else None
+        if cascade is None:
+            cascade = self._load()
+        try:
+            yield cascade
+        finally:
+            with self._lock:
+                self._free.append(cascade)
+
+    def detect(
+        self,
+        image: np.ndarray,
+        scale_factor: Optional[float] = None,
+        min_neighbors: Optional[int] = None,
+        min_size: Optional[Tuple[int, int]] = None,
+        max_side: Optional[int] = None,
+        refine: Optional[bool] = None,
+    ) -> FaceDetection:
+        """detect_faces на классификаторе из пула (с замером времени)."""
+        with self.acquire() as cascade:
+            t0 = time.perf_counter()
+            detection = detect_faces(image, cascade, scale_factor, min_neighbors, min_size, max_side, refine)
+            elapsed = (time.perf_counter() - t0) * 1000
+
+        with self._lock:
+            self._detect_calls += 1
+            self._detect_ms_total += elapsed
+            self._detect_ms_max = max(self._detect_ms_max, elapsed)
+        return detection
+
+    def stats(self) -> dict:
+        """Метрики: загрузки каскада и время детекции."""
+        with self._lock:
+            return {
+                "classifiers_loaded": self._loaded,
+                "classifiers_free": len(self._free),
+                "load_ms_total": round(self._load_ms_total, 2),
+                "load_ms_avg": round(self._load_ms_total / self._loaded, 2) if self._loaded else 0.0,
+                "detect_calls": self._detect_calls,
+                "detect_ms_total": round(self._detect_ms_total, 2),
+                "detect_ms_avg": round(self._detect_ms_total / self._detect_calls, 2) if self._detect_calls else 0.0,
+                "detect_ms_max": round(self._detect_ms_max, 2),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_cascade_pool() -> CascadePool:
+    """Получить глобальный пул каскадов (singleton на процесс)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = CascadePool()
+    return _pool
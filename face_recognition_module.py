@@ -4,71 +4,108 @@
 """
 
 import cv2
+import logging
 import numpy as np
-from typing import Optional, Tuple
+import threading
+from typing import List, Optional, Tuple
 import os
 
-# Путь к каскаду Хаара
+import config
+import fast_ssim
+import lbp
+import metrics
+import orb_index
+import perceptual_hash
+from image_io import ImageSource, describe, load_image
+from face_detection import FaceDetection, get_cascade_pool
+
+# Путь к каскаду Хаара (сам каскад загружается в face_detection.CascadePool)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CASCADE_PATH = os.path.join(BASE_DIR, "cascades", "haarcascade_frontalface_default.xml")
+
+# Версия алгоритма построения шаблонов. Увеличивайте при любом изменении
+# build_template, затем пересоберите шаблоны: python face_templates.py rebuild
+TEMPLATE_VERSION = 2
+
+# Длина HSV гистограммы: 50 бинов H + 60 бинов S
+HSV_BINS = 110
+
+logger = logging.getLogger(__name__)
+
+# Запас при отсечении по верхней границе (доля итоговой оценки): покрывает
+# ошибки округления (SSIM считается во float32)
+PRUNE_MARGIN = 1e-6
+
+# Оптимизированные веса для распознавания лиц
+WEIGHTS = {
+    'ssim': 0.30,           # Структурное сходство - самое важное
+    'hist': 0.15,           # Цветовое распределение
+    'lbp': 0.30,            # LBP - очень эффективен для лиц!
+    'template': 0.15,       # Template matching
+    'features': 0.10        # Feature matching
+}
 
 
 class FaceRecognizer:
     """Класс для распознавания и сравнения лиц."""
     
     def __init__(self):
-        """Инициализация детектора лиц."""
-        self.face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-        if self.face_cascade.empty():
-            raise RuntimeError(f"Не удалось загрузить каскад: {CASCADE_PATH}")
+        """Инициализация детектора лиц (общий пул каскадов)."""
+        self.detector = get_cascade_pool()
         
         # Стандартный размер для нормализации
         self.target_size = (128, 128)
+        
+        # Счётчики отсечения в match_gallery (см. prune_stats)
+        self._prune_lock = threading.Lock()
+        self._prune_queries = 0
+        self._prune_candidates = 0
+        self._prune_ssim_skipped = 0
+        self._prune_orb_skipped = 0
     
-    def extract_face(self, image_path: str) -> Optional[np.ndarray]:
+    def detect(self, image: ImageSource) -> FaceDetection:
+        """
+        Загружает изображение и один раз находит на нём лица.
+        Результат используется и для проверки фото, и для извлечения лица.
+        
+        Args:
+            image: путь, содержимое файла (bytes/буфер) или массив numpy
+        """
+        with metrics.timer("decode"):
+            img = load_image(image)
+        if img is None:
+            raise ValueError(f"Не удалось загрузить изображение: {describe(image)}")
+        
+        return self.detect_image(img)
+    
+    def detect_image(self, img: np.ndarray) -> FaceDetection:
+        """Находит лица на уже декодированном изображении (BGR)."""
+        with metrics.timer("detect"):
+            return self.detector.detect(img)
+    
+    def extract_face(self, image: ImageSource) -> Optional[np.ndarray]:
         """
         Извлекает область лица из изображения.
         
         Args:
-            image_path: путь к изображению
+            image: путь, содержимое файла (bytes/буфер) или массив numpy
             
         Returns:
             numpy array с областью лица или None если лицо не найдено
         """
-        # Загрузка изображения
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Не удалось загрузить изображение: {image_path}")
-        
-        # Конвертация в grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Детекция лиц
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(50, 50)
-        )
-        
-        if len(faces) == 0:
-            return None
-        
-        # Берем самое большое лицо (если несколько)
-        largest_face = max(faces, key=lambda face: face[2] * face[3])
-        x, y, w, h = largest_face
-        
-        # Добавляем padding 20% для захвата контекста
-        padding = int(0.2 * max(w, h))
-        x1 = max(0, x - padding)
-        y1 = max(0, y - padding)
-        x2 = min(img.shape[1], x + w + padding)
-        y2 = min(img.shape[0], y + h + padding)
-        
-        # Извлекаем область лица
-        face_roi = img[y1:y2, x1:x2]
+        return self.detect(image).face_roi()
+    
+    def extract_face_from_image(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Извлекает область лица из уже декодированного изображения.
         
-        return face_roi
+        Args:
+            img: изображение (BGR)
+            
+        Returns:
+            numpy array с областью лица (самое большое, с полями 20%)
+            или None если лицо не найдено
+        """
+        return self.detect_image(img).face_roi()
     
     def preprocess_face(self, face: np.ndarray) -> np.ndarray:
         """
@@ -112,77 +149,113 @@ class FaceRecognizer:
         
         return hist_combined
     
-    def compute_lbp_histogram(self, face: np.ndarray) -> np.ndarray:
+    def compute_lbp_histogram(
+        self,
+        face: np.ndarray,
+        mode: str = "classic",
+        grid: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
         """
         Вычисляет LBP (Local Binary Pattern) гистограмму.
         LBP очень эффективен для распознавания лиц.
+
+        Args:
+            face: лицо (BGR)
+            mode: режим LBP ("classic", "uniform", "ri", "riu2")
+            grid: сетка ячеек, например (8, 8); None — одна гистограмма
         """
         gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        return lbp.lbp_histogram(gray, mode=mode, grid=grid)
+    
+    def compute_ssim_stats(self, gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Локальные статистики SSIM для одного изображения: среднее и дисперсия
+        в окне 7x7 (см. fast_ssim.ssim_stats).
         
-        # Простая реализация LBP
-        height, width = gray.shape
-        lbp = np.zeros_like(gray)
-        
-        for i in range(1, height - 1):
-            for j in range(1, width - 1):
-                center = gray[i, j]
-                code = 0
-                
-                # 8 соседей вокруг центрального пикселя
-                code |= (gray[i-1, j-1] >= center) << 7
-                code |= (gray[i-1, j] >= center) << 6
-                code |= (gray[i-1, j+1] >= center) << 5
-                code |= (gray[i, j+1] >= center) << 4
-                code |= (gray[i+1, j+1] >= center) << 3
-                code |= (gray[i+1, j] >= center) << 2
-                code |= (gray[i+1, j-1] >= center) << 1
-                code |= (gray[i, j-1] >= center) << 0
-                
-                lbp[i, j] = code
-        
-        # Вычисляем гистограмму LBP
-        hist = cv2.calcHist([lbp], [0], None, [256], [0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
-        
-        return hist
+        Returns:
+            (mu, var) — карты float32 того же размера
+        """
+        return fast_ssim.ssim_stats(gray)
     
-    def compare_faces(self, face1: np.ndarray, face2: np.ndarray) -> float:
+    def build_template(self, face: np.ndarray) -> dict:
         """
-        Сравнивает два лица и возвращает процент совпадения.
+        Строит шаблон признаков лица: всё, что зависит только от одного
+        изображения, считается здесь один раз.
         
         Args:
-            face1: первое лицо (BGR)
-            face2: второе лицо (BGR)
+            face: область лица (BGR), результат extract_face
             
         Returns:
-            процент совпадения (0-100)
+            dict с ключами:
+              version  — версия алгоритма (TEMPLATE_VERSION)
+              face     — нормализованное лицо 128x128 (grayscale, uint8)
+              hist     — HSV гистограмма (110,)
+              lbp      — LBP гистограмма (256,)
+              orb      — ORB дескрипторы (K x 32, uint8) или None
+              ssim_mu, ssim_var — статистики SSIM (см. compute_ssim_stats)
+              phash, dhash — 64-битные перцептуальные хеши лица (int)
         """
-        # Предобработка
-        face1_proc = self.preprocess_face(face1)
-        face2_proc = self.preprocess_face(face2)
+        face_proc = self.preprocess_face(face)
+        gray = cv2.cvtColor(face_proc, cv2.COLOR_BGR2GRAY)
         
-        # === Метод 1: SSIM (структурное сходство) ===
-        gray1 = cv2.cvtColor(face1_proc, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(face2_proc, cv2.COLOR_BGR2GRAY)
+        orb = cv2.ORB_create(nfeatures=500)
+        _, descriptors = orb.detectAndCompute(gray, None)
+        
+        ssim_mu, ssim_var = self.compute_ssim_stats(gray)
+        phash, dhash = perceptual_hash.hash_face(gray)
+        
+        return {
+            "version": TEMPLATE_VERSION,
+            "face": gray,
+            "hist": self.compute_histogram(face_proc),
+            "lbp": self.compute_lbp_histogram(face_proc),
+            "orb": descriptors,
+            "ssim_mu": ssim_mu,
+            "ssim_var": ssim_var,
+            "phash": phash,
+            "dhash": dhash,
+        }
+    
+    def compute_feature_score(self, des1: Optional[np.ndarray], des2: Optional[np.ndarray]) -> float:
+        """
+        Оценка по ORB дескрипторам: доля взаимных совпадений (0-1).
+        """
+        if des1 is not None and des2 is not None and len(des1) > 0 and len(des2) > 0:
+            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+            matches = bf.match(des1, des2)
+            matches = sorted(matches, key=lambda x: x.distance)
+            
+            # Берем топ-30% лучших совпадений
+            good_matches = matches[:int(len(matches) * 0.3)]
+            
+            # Нормализуем количество совпадений (50 = хорошо)
+            return min(1.0, len(good_matches) / 50.0)
+        return 0.0
+    
+    def compare_templates(self, template1: dict, template2: dict) -> float:
+        """
+        Сравнивает два шаблона (см. build_template) и возвращает процент совпадения.
+        
+        Returns:
+            процент совпадения (0-100)
+        """
+        gray1 = template1["face"]
+        gray2 = template2["face"]
         
-        from skimage.metrics import structural_similarity
-        ssim_score = structural_similarity(gray1, gray2)
+        # === Метод 1: SSIM (структурное сходство, статистики лиц — из шаблонов) ===
+        ssim_score = fast_ssim.ssim(gray1, gray2, _ssim_stats(template1), _ssim_stats(template2))
         
         # === Метод 2: Гистограммы HSV ===
-        hist1 = self.compute_histogram(face1_proc)
-        hist2 = self.compute_histogram(face2_proc)
         hist_correlation = cv2.compareHist(
-            hist1.reshape(-1, 1),
-            hist2.reshape(-1, 1),
+            template1["hist"].reshape(-1, 1),
+            template2["hist"].reshape(-1, 1),
             cv2.HISTCMP_CORREL
         )
         
         # === Метод 3: LBP (Local Binary Patterns) ===
-        lbp1 = self.compute_lbp_histogram(face1_proc)
-        lbp2 = self.compute_lbp_histogram(face2_proc)
         lbp_correlation = cv2.compareHist(
-            lbp1.reshape(-1, 1),
-            lbp2.reshape(-1, 1),
+            template1["lbp"].reshape(-1, 1),
+            template2["lbp"].reshape(-1, 1),
             cv2.HISTCMP_CORREL
         )
         
@@ -192,39 +265,15 @@ class FaceRecognizer:
         template_score = result[0][0]
         
         # === Метод 5: ORB Feature Matching ===
-        orb = cv2.ORB_create(nfeatures=500)
-        kp1, des1 = orb.detectAndCompute(gray1, None)
-        kp2, des2 = orb.detectAndCompute(gray2, None)
-        
-        if des1 is not None and des2 is not None and len(des1) > 0 and len(des2) > 0:
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            matches = bf.match(des1, des2)
-            matches = sorted(matches, key=lambda x: x.distance)
-            
-            # Берем топ-30% лучших совпадений
-            good_matches = matches[:int(len(matches) * 0.3)]
-            
-            # Нормализуем количество совпадений (50 = хорошо)
-            feature_score = min(1.0, len(good_matches) / 50.0)
-        else:
-            feature_score = 0.0
+        feature_score = self.compute_feature_score(template1["orb"], template2["orb"])
         
         # === Взвешенная комбинация ===
-        # Оптимизированные веса для распознавания лиц
-        weights = {
-            'ssim': 0.30,           # Структурное сходство - самое важное
-            'hist': 0.15,           # Цветовое распределение
-            'lbp': 0.30,            # LBP - очень эффективен для лиц!
-            'template': 0.15,       # Template matching
-            'features': 0.10        # Feature matching
-        }
-        
         final_score = (
-            ssim_score * weights['ssim'] +
-            hist_correlation * weights['hist'] +
-            lbp_correlation * weights['lbp'] +
-            template_score * weights['template'] +
-            feature_score * weights['features']
+            ssim_score * WEIGHTS['ssim'] +
+            hist_correlation * WEIGHTS['hist'] +
+            lbp_correlation * WEIGHTS['lbp'] +
+            template_score * WEIGHTS['template'] +
+            feature_score * WEIGHTS['features']
         )
         
         # Конвертация в проценты
@@ -232,25 +281,403 @@ class FaceRecognizer:
         
         return float(percentage)
     
-    def match_face(self, query_image_path: str, reference_image_path: str) -> Tuple[bool, float]:
+    def compare_faces(self, face1: np.ndarray, face2: np.ndarray) -> float:
+        """
+        Сравнивает два лица и возвращает процент совпадения.
+        
+        Args:
+            face1: первое лицо (BGR)
+            face2: второе лицо (BGR)
+            
+        Returns:
+            процент совпадения (0-100)
+        """
+        return self.compare_templates(self.build_template(face1), self.build_template(face2))
+    
+    def stack_gallery(self, templates: List[Optional[dict]]) -> dict:
+        """
+        Собирает шаблоны в "галерею" — сложенные массивы для match_gallery.
+        
+        Args:
+            templates: список шаблонов (None — на эталонном фото нет лица)
+            
+        Returns:
+            dict:
+              faces — N x 128 x 128 (uint8)
+              hist  — N x 110 (float32)
+              lbp   — N x 256 (float32)
+              orb_desc  — M x 32 (uint8), ORB дескрипторы всех участников подряд
+              orb_count — N (int64), число дескрипторов каждого участника
+              ssim_mu, ssim_var — N x 128 x 128 (float32), статистики SSIM
+                      (только при config.SSIM_GALLERY_STATS)
+              phash, dhash — N (uint64), упакованные перцептуальные хеши
+              valid — N (bool), False для участников без шаблона
+        """
+        height, width = self.target_size[1], self.target_size[0]
+        n = len(templates)
+        
+        faces = np.zeros((n, height, width), dtype=np.uint8)
+        hist = np.zeros((n, HSV_BINS), dtype=np.float32)
+        lbp_hist = np.zeros((n, lbp.n_bins("classic")), dtype=np.float32)
+        phash = np.zeros(n, dtype=np.uint64)
+        dhash = np.zeros(n, dtype=np.uint64)
+        valid = np.zeros(n, dtype=bool)
+        
+        for i, template in enumerate(templates):
+            if template is None:
+                continue
+            faces[i] = template["face"]
+            hist[i] = template["hist"]
+            lbp_hist[i] = template["lbp"]
+            phash[i] = template["phash"]
+            dhash[i] = template["dhash"]
+            valid[i] = True
+        
+        orb_desc, orb_count = orb_index.stack_descriptors(
+            [t["orb"] if t is not None else None for t in templates]
+        )
+        
+        gallery = {
+            "faces": faces, "hist": hist, "lbp": lbp_hist,
+            "orb_desc": orb_desc, "orb_count": orb_count,
+            "phash": phash, "dhash": dhash, "valid": valid,
+        }
+        
+        if config.SSIM_GALLERY_STATS:
+            ssim_mu = np.zeros((n, height, width), dtype=np.float32)
+            ssim_var = np.zeros((n, height, width), dtype=np.float32)
+            for i, template in enumerate(templates):
+                if template is not None:
+                    ssim_mu[i], ssim_var[i] = _ssim_stats(template)
+            gallery["ssim_mu"] = ssim_mu
+            gallery["ssim_var"] = ssim_var
+        
+        return gallery
+    
+    def select_candidates(self, query_face, gallery: dict, top_k: int) -> np.ndarray:
+        """
+        Грубый этап поиска: ранжирует галерею по сумме расстояний Хэмминга
+        pHash + dHash (векторизованный popcount) и возвращает top_k индексов.
+        
+        Args:
+            query_face: область лица (BGR) или шаблон (dict)
+            gallery: результат stack_gallery
+            top_k: сколько кандидатов оставить
+            
+        Returns:
+            индексы кандидатов по возрастанию расстояния
+        """
+        query = query_face if isinstance(query_face, dict) else self.build_template(query_face)
+        idx = np.flatnonzero(gallery["valid"])
+        
+        distance = (
+            perceptual_hash.hamming(query["phash"], gallery["phash"][idx]) +
+            perceptual_hash.hamming(query["dhash"], gallery["dhash"][idx])
+        )
+        
+        if top_k < len(idx):
+            nearest = np.argpartition(distance, top_k - 1)[:top_k]
+        else:
+            nearest = np.arange(len(idx))
+        nearest = nearest[np.argsort(distance[nearest], kind="stable")]
+        return idx[nearest]
+    
+    def match_gallery(
+        self,
+        query_face,
+        gallery: dict,
+        candidates: Optional[np.ndarray] = None,
+        prune_below: Optional[float] = None,
+        prune_counts: Optional[dict] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Сравнивает лицо со всей галереей за один векторизованный проход (1:N).
+        
+        Корреляции гистограмм, template matching и SSIM считаются матричными
+        операциями NumPy по всем N сразу; формула и веса — как в compare_templates.
+        
+        С prune_below метрики считаются по возрастанию стоимости: сначала
+        гистограммы и template matching, затем SSIM, последним ORB. После каждого
+        этапа верхняя граница итоговой оценки (несчитанные метрики = 1) сравнивается
+        с max(prune_below, лучшая уже гарантированная оценка); участники, которые
+        не могут ни пройти порог, ни победить, дальше не считаются и получают NaN.
+        Победитель и его оценка не меняются, если она >= prune_below.
+        
+        Args:
+            query_face: область лица (BGR) или уже готовый шаблон (dict)
+            gallery: результат stack_gallery
+            candidates: индексы галереи для полного сравнения (см. select_candidates);
+                        None — сравнивать со всеми
+            prune_below: порог совпадения, %, для отсечения (см. выше); None — без отсечения
+            prune_counts: если задан, счётчики отсечения (candidates, ssim_skipped,
+                          orb_skipped) прибавляются к нему, а не записываются как
+                          отдельный запрос — вызывающий, который считает один запрос
+                          несколькими вызовами, записывает сумму через record_pruning
+            
+        Returns:
+            (order, scores): scores — проценты совпадения (N,) в порядке галереи,
+            order — индексы галереи по убыванию score.
+            Участники вне candidates (с найденным лицом) и отсечённые получают NaN
+            и оказываются в конце order.
+        """
+        query = query_face if isinstance(query_face, dict) else self.build_template(query_face)
+        valid = gallery["valid"]
+        n = len(valid)
+        scores = np.zeros(n, dtype=np.float64)
+        
+        idx = np.flatnonzero(valid)
+        if candidates is not None:
+            scores[valid] = np.nan
+            scores[np.asarray(candidates, dtype=np.intp)] = 0.0
+            idx = np.intersect1d(idx, candidates)
+        if len(idx) > 0:
+            if prune_below is None:
+                scores[idx] = self._score_all(query, gallery, idx)
+            else:
+                scores[idx] = np.nan
+                scored_idx, scored = self._score_pruned(
+                    query, gallery, idx, prune_below / 100, counts=prune_counts
+                )
+                scores[scored_idx] = scored
+        
+        # Стабильная сортировка: при равенстве побеждает первый, как max()
+        order = np.argsort(-scores, kind="stable")
+        return order, scores
+    
+    def match_gallery_many(
+        self,
+        queries: List[dict],
+        gallery: dict,
+        prune_below: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Сравнивает несколько лиц (например, все лица группового фото) со всей
+        галереей: матрица оценок запросы x участники.
+
+        Гистограммы и template matching для всех запросов считаются одним
+        матричным произведением на галерею, ORB — одним проходом по индексу
+        галереи, SSIM — по строкам (с готовыми статистиками галереи). С отсечением
+        SSIM и ORB считаются по строкам только для оставшихся участников.
+        Каждая строка совпадает с match_gallery(query, gallery, prune_below=prune_below).
+
+        Args:
+            queries: шаблоны лиц (build_template)
+            gallery: результат stack_gallery
+            prune_below: порог для отсечения (см. match_gallery); None — без отсечения
+
+        Returns:
+            scores — Q x N, проценты совпадения (отсечённые — NaN)
+        """
+        valid = gallery["valid"]
+        scores = np.zeros((len(queries), len(valid)), dtype=np.float64)
+        idx = np.flatnonzero(valid)
+        if not queries or len(idx) == 0:
+            return scores
+
+        hist_correlation, lbp_correlation, template_scores = self._cheap_terms_many(queries, gallery, idx)
+        if prune_below is not None:
+            for q, query in enumerate(queries):
+                terms = (hist_correlation[q], lbp_correlation[q], template_scores[q])
+                scores[q, idx] = np.nan
+                scored_idx, scored = self._score_pruned(query, gallery, idx, prune_below / 100, terms)
+                scores[q, scored_idx] = scored
+            return scores
+
+        # ORB — один проход по индексу галереи для всех запросов
+        with metrics.timer("score_orb"):
+            feature_scores = orb_index.feature_scores_many(
+                [q["orb"] for q in queries], gallery["orb_desc"], gallery["orb_count"], idx)
+
+        for q, query in enumerate(queries):
+            scores[q, idx] = _combine(
+                self._ssim_scores(query, gallery, idx),
+                hist_correlation[q], lbp_correlation[q], template_scores[q], feature_scores[q],
+            )
+        return scores
+
+    def _cheap_terms_many(
+        self, queries: List[dict], gallery: dict, idx: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """_cheap_terms для нескольких запросов: три матрицы Q x len(idx)."""
+        with metrics.timer("score_hist"):
+            hist_correlation = _batch_correlation_many(
+                np.stack([q["hist"] for q in queries]), gallery["hist"][idx])
+
+        with metrics.timer("score_lbp"):
+            lbp_correlation = _batch_correlation_many(
+                np.stack([q["lbp"] for q in queries]), gallery["lbp"][idx])
+
+        with metrics.timer("score_template"):
+            template_scores = _batch_ccorr_normed_many(
+                np.stack([q["face"] for q in queries]), gallery["faces"], idx)
+
+        return hist_correlation, lbp_correlation, template_scores
+
+    def _cheap_terms(self, query: dict, gallery: dict, idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Дешёвые метрики для участников idx: (гистограммы HSV, LBP, template matching)."""
+        # === Метод 2: Гистограммы HSV ===
+        with metrics.timer("score_hist"):
+            hist_correlation = _batch_correlation(query["hist"], gallery["hist"][idx])
+        
+        # === Метод 3: LBP ===
+        with metrics.timer("score_lbp"):
+            lbp_correlation = _batch_correlation(query["lbp"], gallery["lbp"][idx])
+        
+        # === Метод 4: Template Matching (TM_CCORR_NORMED для лиц одного размера) ===
+        with metrics.timer("score_template"):
+            template_scores = _batch_ccorr_normed(query["face"], gallery["faces"][idx])
+        
+        return hist_correlation, lbp_correlation, template_scores
+    
+    def _ssim_scores(self, query: dict, gallery: dict, idx: np.ndarray) -> np.ndarray:
+        """SSIM для участников idx (у галереи — готовые статистики, если есть)."""
+        with metrics.timer("score_ssim"):
+            return fast_ssim.ssim_batch(
+                query["face"], gallery["faces"], _ssim_stats(query),
+                gallery.get("ssim_mu"), gallery.get("ssim_var"), idx,
+            )
+    
+    def _feature_scores(self, query: dict, gallery: dict, idx: np.ndarray) -> np.ndarray:
+        """ORB feature_score для участников idx (один поиск по индексу галереи)."""
+        with metrics.timer("score_orb"):
+            return orb_index.feature_scores(query["orb"], gallery["orb_desc"], gallery["orb_count"], idx)
+    
+    def _score_all(self, query: dict, gallery: dict, idx: np.ndarray, terms=None) -> np.ndarray:
+        """Полные оценки (%) для участников idx (terms — готовый результат _cheap_terms)."""
+        # === Метод 1: SSIM ===
+        ssim_scores = self._ssim_scores(query, gallery, idx)
+        
+        # === Методы 2-4: гистограммы HSV, LBP, Template Matching ===
+        if terms is None:
+            terms = self._cheap_terms(query, gallery, idx)
+        hist_correlation, lbp_correlation, template_scores = terms
+        
+        # === Метод 5: ORB Feature Matching ===
+        feature_scores = self._feature_scores(query, gallery, idx)
+        
+        return _combine(ssim_scores, hist_correlation, lbp_correlation, template_scores, feature_scores)
+    
+    def _score_pruned(
+        self, query: dict, gallery: dict, idx: np.ndarray, threshold: float, terms=None,
+        counts: Optional[dict] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Оценки с отсечением по верхней границе (см. match_gallery);
+        terms — готовый результат _cheap_terms; counts — куда прибавить
+        счётчики отсечения (None — записать их как отдельный запрос).
+        
+        Returns:
+            (scored_idx, scores) — участники, посчитанные полностью, и их оценки (%).
+            Участник с лучшей начальной границей считается всегда, поэтому
+            scores не пуст. Если порог не проходит никто, отсечение идёт по
+            порогу, и лучший из scores может уступать лучшему при полном
+            переборе — это лучший из посчитанных, а не по всей галерее
+        """
+        if terms is None:
+            terms = self._cheap_terms(query, gallery, idx)
+        hist_correlation, lbp_correlation, template_scores = terms
+        cheap = (
+            hist_correlation * WEIGHTS['hist'] +
+            lbp_correlation * WEIGHTS['lbp'] +
+            template_scores * WEIGHTS['template']
+        )
+        
+        # Гарантированная оценка: полностью считаем участника с лучшей границей
+        upper = cheap + WEIGHTS['ssim'] + WEIGHTS['features']
+        seed = int(np.argmax(upper))
+        seed_idx = idx[seed:seed + 1]
+        best = float(
+            cheap[seed] +
+            self._ssim_scores(query, gallery, seed_idx)[0] * WEIGHTS['ssim'] +
+            self._feature_scores(query, gallery, seed_idx)[0] * WEIGHTS['features']
+        )
+        bound = max(threshold, best) - PRUNE_MARGIN
+        
+        # === Этап SSIM: только те, кто ещё может пройти порог и победить ===
+        alive_mask = upper >= bound
+        alive_mask[seed] = True
+        alive = np.flatnonzero(alive_mask)
+        ssim_scores = self._ssim_scores(query, gallery, idx[alive])
+        partial = cheap[alive] + ssim_scores * WEIGHTS['ssim']
+        
+        # ORB >= 0, поэтому partial — нижняя граница итоговой оценки
+        bound = max(bound, float(partial.max()) - PRUNE_MARGIN)
+        
+        # === Этап ORB ===
+        keep = partial + WEIGHTS['features'] >= bound
+        keep[alive == seed] = True
+        scored = alive[keep]
+        feature_scores = self._feature_scores(query, gallery, idx[scored])
+        
+        pruned = {
+            "candidates": len(idx),
+            "ssim_skipped": len(idx) - len(alive),
+            "orb_skipped": len(idx) - len(scored),
+        }
+        if counts is None:
+            self.record_pruning(pruned)
+        else:
+            for key, value in pruned.items():
+                counts[key] = counts.get(key, 0) + value
+        return idx[scored], _combine(
+            ssim_scores[keep], hist_correlation[scored], lbp_correlation[scored],
+            template_scores[scored], feature_scores,
+        )
+    
+    def record_pruning(self, counts: dict):
+        """
+        Счётчики отсечения и строка в лог на один запрос.
+
+        counts — candidates, ssim_skipped, orb_skipped (orb_skipped включает
+        ssim_skipped), как в prune_stats; для запроса, посчитанного блоками,
+        — суммы по блокам (см. match_gallery с prune_counts).
+        """
+        total = counts["candidates"]
+        if total == 0:
+            return
+        with self._prune_lock:
+            self._prune_queries += 1
+            self._prune_candidates += total
+            self._prune_ssim_skipped += counts["ssim_skipped"]
+            self._prune_orb_skipped += counts["orb_skipped"]
+        logger.info(
+            "отсечение: кандидатов %d, без SSIM %d (%.0f%%), без ORB %d (%.0f%%)",
+            total, counts["ssim_skipped"], 100 * counts["ssim_skipped"] / total,
+            counts["orb_skipped"], 100 * counts["orb_skipped"] / total,
+        )
+    
+    def prune_stats(self) -> dict:
+        """Накопленные счётчики отсечения (match_gallery с prune_below)."""
+        with self._prune_lock:
+            total = self._prune_candidates
+            return {
+                "queries": self._prune_queries,
+                "candidates": total,
+                "ssim_skipped": self._prune_ssim_skipped,
+                "orb_skipped": self._prune_orb_skipped,
+                "ssim_skipped_rate": round(self._prune_ssim_skipped / total, 4) if total else 0.0,
+                "orb_skipped_rate": round(self._prune_orb_skipped / total, 4) if total else 0.0,
+            }
+    
+    def match_face(self, query_image: ImageSource, reference_image: ImageSource) -> Tuple[bool, float]:
         """
         Сравнивает лицо на query изображении с reference изображением.
         
         Args:
-            query_image_path: путь к фото для проверки
-            reference_image_path: путь к эталонному фото
+            query_image: фото для проверки (путь, bytes/буфер или массив)
+            reference_image: эталонное фото (путь, bytes/буфер или массив)
             
         Returns:
             (match: bool, score: float) - совпадение и процент схожести
         """
         # Извлекаем лица
-        face1 = self.extract_face(query_image_path)
-        face2 = self.extract_face(reference_image_path)
+        face1 = self.extract_face(query_image)
+        face2 = self.extract_face(reference_image)
         
         if face1 is None:
-            raise ValueError(f"Лицо не найдено на изображении: {query_image_path}")
+            raise ValueError(f"Лицо не найдено на изображении: {describe(query_image)}")
         if face2 is None:
-            raise ValueError(f"Лицо не найдено на изображении: {reference_image_path}")
+            raise ValueError(f"Лицо не найдено на изображении: {describe(reference_image)}")
         
         # Сравниваем
         score = self.compare_faces(face1, face2)
@@ -262,6 +689,113 @@ class FaceRecognizer:
         return match, score
 
 
+# === Векторизованные метрики для match_gallery ===
+
+def _combine(ssim_scores, hist_correlation, lbp_correlation, template_scores, feature_scores) -> np.ndarray:
+    """Взвешенная комбинация метрик в проценты (как в compare_templates)."""
+    final_scores = (
+        ssim_scores * WEIGHTS['ssim'] +
+        hist_correlation * WEIGHTS['hist'] +
+        lbp_correlation * WEIGHTS['lbp'] +
+        template_scores * WEIGHTS['template'] +
+        feature_scores * WEIGHTS['features']
+    )
+    return np.clip(final_scores * 100, 0, 100)
+
+
+def _batch_correlation(query: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+    """
+    Корреляция Пирсона вектора с каждой строкой матрицы
+    (та же формула, что cv2.compareHist(..., HISTCMP_CORREL)).
+    """
+    q = query.astype(np.float64).ravel()
+    g = gallery.astype(np.float64).reshape(len(gallery), -1)
+    scale = 1.0 / q.size
+    
+    s1 = q.sum()
+    s11 = q @ q
+    s2 = g.sum(axis=1)
+    s22 = np.einsum("ij,ij->i", g, g)
+    s12 = g @ q
+    
+    num = s12 - s1 * s2 * scale
+    denom2 = (s11 - s1 * s1 * scale) * (s22 - s2 * s2 * scale)
+    
+    result = np.ones(len(g), dtype=np.float64)
+    ok = np.abs(denom2) > np.finfo(np.float64).eps
+    result[ok] = num[ok] / np.sqrt(denom2[ok])
+    return result
+
+
+def _batch_ccorr_normed(query: np.ndarray, faces: np.ndarray) -> np.ndarray:
+    """
+    cv2.matchTemplate(..., TM_CCORR_NORMED) для изображений одного размера:
+    sum(a*b) / sqrt(sum(a^2) * sum(b^2)) для каждого лица галереи.
+    """
+    q = query.astype(np.float64).ravel()
+    g = faces.reshape(len(faces), -1).astype(np.float64)
+    
+    num = g @ q
+    denom = np.sqrt(np.einsum("ij,ij->i", g, g) * (q @ q))
+    
+    result = np.zeros(len(g), dtype=np.float64)
+    ok = denom > 0
+    result[ok] = num[ok] / denom[ok]
+    return result
+
+
+def _batch_correlation_many(queries: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+    """_batch_correlation для нескольких векторов: Q x N (одно матричное произведение)."""
+    q = queries.astype(np.float64).reshape(len(queries), -1)
+    g = gallery.astype(np.float64).reshape(len(gallery), -1)
+    scale = 1.0 / q.shape[1]
+
+    s1 = q.sum(axis=1)[:, None]
+    s11 = np.einsum("ij,ij->i", q, q)[:, None]
+    s2 = g.sum(axis=1)[None, :]
+    s22 = np.einsum("ij,ij->i", g, g)[None, :]
+    s12 = q @ g.T
+
+    num = s12 - s1 * s2 * scale
+    denom2 = (s11 - s1 * s1 * scale) * (s22 - s2 * s2 * scale)
+
+    result = np.ones(num.shape, dtype=np.float64)
+    ok = np.abs(denom2) > np.finfo(np.float64).eps
+    result[ok] = num[ok] / np.sqrt(denom2[ok])
+    return result
+
+
+# Сколько лиц галереи переводится во float64 за раз в _batch_ccorr_normed_many
+CCORR_BLOCK = 512
+
+
+def _batch_ccorr_normed_many(queries: np.ndarray, faces: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """_batch_ccorr_normed для нескольких лиц: Q x len(idx), галерея — блоками."""
+    q = queries.reshape(len(queries), -1).astype(np.float64)
+    q_norm = np.einsum("ij,ij->i", q, q)
+
+    result = np.zeros((len(q), len(idx)), dtype=np.float64)
+    for start in range(0, len(idx), CCORR_BLOCK):
+        part = idx[start:start + CCORR_BLOCK]
+        g = faces[part].reshape(len(part), -1).astype(np.float64)
+
+        num = q @ g.T
+        denom = np.sqrt(q_norm[:, None] * np.einsum("ij,ij->i", g, g)[None, :])
+
+        block = np.zeros_like(num)
+        ok = denom > 0
+        block[ok] = num[ok] / denom[ok]
+        result[:, start:start + len(part)] = block
+    return result
+
+
+def _ssim_stats(template: dict):
+    """(mu, var) SSIM из шаблона или None (шаблоны без статистик — посчитать заново)."""
+    if template.get("ssim_mu") is None or template.get("ssim_var") is None:
+        return fast_ssim.ssim_stats(template["face"])
+    return template["ssim_mu"], template["ssim_var"]
+
+
 # === Публичные функции для совместимости ===
 
 _recognizer = None
@@ -274,13 +808,13 @@ def get_recognizer() -> FaceRecognizer:
     return _recognizer
 
 
-def compare_faces_advanced(image_path1: str, image_path2: str) -> float:
+def compare_faces_advanced(image1: ImageSource, image2: ImageSource) -> float:
     """
     Сравнивает лица на двух фотографиях и возвращает процент совпадения.
     
     Args:
-        image_path1: путь к первому фото
-        image_path2: путь ко второму фото
+        image1: первое фото (путь, содержимое файла или массив numpy)
+        image2: второе фото (путь, содержимое файла или массив numpy)
         
     Returns:
         процент совпадения (0-100)
@@ -288,8 +822,8 @@ def compare_faces_advanced(image_path1: str, image_path2: str) -> float:
     recognizer = get_recognizer()
     
     # Извлекаем лица
-    face1 = recognizer.extract_face(image_path1)
-    face2 = recognizer.extract_face(image_path2)
+    face1 = recognizer.extract_face(image1)
+    face2 = recognizer.extract_face(image2)
     
     if face1 is None or face2 is None:
         # Если лиц нет, возвращаем минимальный score
@@ -0,0 +1,219 @@
+"""
+Хранение шаблонов признаков лиц участников.
+
+Шаблон (см. FaceRecognizer.build_template) считается один раз при добавлении
+участника и хранится в таблице face_templates рядом с participants.
+При смене TEMPLATE_VERSION шаблоны пересобираются командой:
+
+    python face_templates.py rebuild          # только устаревшие/отсутствующие
+    python face_templates.py rebuild --all    # все
+"""
+
+import io
+import sys
+import argparse
+from typing import Optional
+
+import numpy as np
+
+import db
+import duplicate_index
+import face_recognition_module
+from face_recognition_module import TEMPLATE_VERSION
+
+# Массивы шаблона, которые сохраняются в BLOB
+_ARRAY_KEYS = ("face", "hist", "lbp", "orb", "ssim_mu", "ssim_var")
+
+# 64-битные хеши (хранятся как uint64-скаляры)
+_HASH_KEYS = ("phash", "dhash")
+
+
+def serialize_template(template: dict) -> bytes:
+    """Упаковывает шаблон в bytes (формат .npz без сжатия)."""
+    arrays = {k: template[k] for k in _ARRAY_KEYS if template.get(k) is not None}
+    arrays.update({k: np.uint64(template[k]) for k in _HASH_KEYS})
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def deserialize_template(blob: bytes, version: int = TEMPLATE_VERSION) -> dict:
+    """Распаковывает шаблон из bytes."""
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        template = {k: (data[k] if k in data.files else None) for k in _ARRAY_KEYS}
+        template.update({k: int(data[k]) for k in _HASH_KEYS})
+    template["version"] = version
+    return template
+
+
+def extract_template(raw: bytes) -> Optional[dict]:
+    """
+    Строит шаблон по содержимому файла изображения.
+
+    Returns:
+        шаблон или None, если лицо не найдено
+    """
+    recognizer = face_recognition_module.get_recognizer()
+    face = recognizer.extract_face(raw)
+    if face is None:
+        return None
+    return recognizer.build_template(face)
+
+
+def save_template(participant_id: int, template: Optional[dict]):
+    """Сохраняет шаблон участника (None — лицо не найдено) и его хеши в индекс дубликатов."""
+    blob = serialize_template(template) if template is not None else None
+    db.execute(
+        "INSERT OR REPLACE INTO face_templates(participant_id, version, template) VALUES (?,?,?)",
+        (participant_id, TEMPLATE_VERSION, blob)
+    )
+    duplicate_index.add(participant_id, template)
+
+
+def find_duplicates(template: dict, radius: int) -> list:
+    """
+    Уже зарегистрированные участники с тем же лицом (повторная регистрация).
+
+    Кандидаты ищутся по индексу pHash (duplicate_index), для найденных
+    считается полный процент совпадения с их шаблонами.
+
+    Returns:
+        список dict: participant_id, login, name, phash_distance, dhash_distance, score
+    """
+    matches = duplicate_index.lookup(template["phash"], template["dhash"], radius)
+    if not matches:
+        return matches
+
+    ids = [m["participant_id"] for m in matches]
+    rows = db.read(
+        f"SELECT participant_id, template FROM face_templates "
+        f"WHERE participant_id IN ({','.join('?' * len(ids))}) AND template IS NOT NULL",
+        ids
+    )
+    blobs = {row["participant_id"]: row["template"] for row in rows}
+
+    recognizer = face_recognition_module.get_recognizer()
+    for match in matches:
+        blob = blobs.get(match["participant_id"])
+        score = recognizer.compare_templates(template, deserialize_template(blob)) if blob else 0.0
+        match["score"] = round(float(score), 1)
+    return matches
+
+
+def get_version() -> int:
+    """Текущая версия галереи (см. таблицу gallery_version)."""
+    row = db.read_one("SELECT version FROM gallery_version WHERE id = 1")
+    return row["version"] if row else 0
+
+
+def bump_version() -> int:
+    """Увеличивает версию галереи и возвращает новое значение."""
+    with db.transaction() as conn:
+        conn.execute("UPDATE gallery_version SET version = version + 1 WHERE id = 1")
+        version = conn.execute("SELECT version FROM gallery_version WHERE id = 1").fetchone()[0]
+    return version
+
+
+def load_gallery():
+    """
+    Загружает шаблоны всех участников.
+    Отсутствующие или устаревшие шаблоны строятся по photo_blob и сохраняются.
+
+    Returns:
+        список dict: participant_id, login, name, template (None — лицо не найдено)
+    """
+    rows = db.read("""
+        SELECT p.id, p.login, p.name, t.version, t.template
+        FROM participants p
+        LEFT JOIN face_templates t ON t.participant_id = p.id
+        ORDER BY p.id
+    """)
+
+    gallery = []
+    for row in rows:
+        if row["version"] == TEMPLATE_VERSION:
+            blob = row["template"]
+            template = deserialize_template(blob) if blob is not None else None
+        else:
+            template = rebuild_one(row["id"])
+
+        gallery.append({
+            "participant_id": row["id"],
+            "login": row["login"],
+            "name": row["name"],
+            "template": template,
+        })
+
+    # Индекс дубликатов для шаблонов, сохранённых до его появления
+    missing = set(duplicate_index.missing())
+    for entry in gallery:
+        if entry["participant_id"] in missing:
+            duplicate_index.add(entry["participant_id"], entry["template"])
+    return gallery
+
+
+def rebuild_one(participant_id: int) -> Optional[dict]:
+    """Пересобирает и сохраняет шаблон одного участника."""
+    row = db.read_one("SELECT photo_blob FROM participants WHERE id=?", (participant_id,))
+    if not row:
+        return None
+
+    try:
+        template = extract_template(row["photo_blob"])
+    except ValueError:
+        template = None
+
+    save_template(participant_id, template)
+    return template
+
+
+def rebuild(rebuild_all: bool = False) -> dict:
+    """
+    Пересобирает шаблоны.
+
+    Args:
+        rebuild_all: пересобрать все, а не только устаревшие/отсутствующие
+
+    Returns:
+        статистика: total, rebuilt, no_face
+    """
+    if rebuild_all:
+        rows = db.read("SELECT id FROM participants ORDER BY id")
+    else:
+        rows = db.read("""
+            SELECT p.id FROM participants p
+            LEFT JOIN face_templates t ON t.participant_id = p.id
+            WHERE t.version IS NULL OR t.version != ?
+            ORDER BY p.id
+        """, (TEMPLATE_VERSION,))
+
+    stats = {"total": len(rows), "rebuilt": 0, "no_face": 0}
+    for row in rows:
+        template = rebuild_one(row["id"])
+        stats["rebuilt"] += 1
+        if template is None:
+            stats["no_face"] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шаблоны признаков лиц участников")
+    sub = parser.add_subparsers(dest="command")
+    p_rebuild = sub.add_parser("rebuild", help="пересобрать шаблоны")
+    p_rebuild.add_argument("--all", action="store_true", help="пересобрать все шаблоны")
+    args = parser.parse_args()
+
+    if args.command != "rebuild":
+        parser.print_help()
+        sys.exit(1)
+
+    db.init_db(clear_events=False, clear_participants=False)
+    stats = rebuild(rebuild_all=args.all)
+    if stats["rebuilt"]:
+        bump_version()
+    print(f"Версия шаблонов: {TEMPLATE_VERSION}")
+    print(f"Пересобрано: {stats['rebuilt']} из {stats['total']} (без лица: {stats['no_face']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Быстрый SSIM для нормализованных лиц (uint8, одинакового размера).
+
+Те же формулы, что у skimage.metrics.structural_similarity по умолчанию
+(равномерное окно 7x7, data_range=255, несмещённая дисперсия, среднее по
+области без краёв шириной 3 пикселя), но:
+  - окно считается cv2.boxFilter (BORDER_REFLECT, как mode='reflect' в skimage);
+  - среднее и дисперсия каждого лица (mu, var) не зависят от второго лица:
+    они считаются один раз и хранятся в шаблоне (ssim_mu, ssim_var), при
+    сравнении фильтруется только перекрёстный член x * y;
+  - пакетный вариант фильтрует сразу несколько лиц: лица складываются в одно
+    "высокое" изображение. Окна на стыках лиц захватывают соседнее лицо, но
+    эти пиксели лежат в отбрасываемой краевой полосе, поэтому результат
+    совпадает с поштучным расчётом.
+"""
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Размер окна (как по умолчанию в skimage)
+WIN_SIZE = 7
+
+# Сколько лиц обрабатывать за раз в пакетном SSIM: небольшие пакеты
+# помещаются в кэш процессора и считаются быстрее больших
+BATCH_SIZE = 8
+
+_PAD = (WIN_SIZE - 1) // 2
+_COV_NORM = WIN_SIZE * WIN_SIZE / (WIN_SIZE * WIN_SIZE - 1)
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+Stats = Tuple[np.ndarray, np.ndarray]
+
+
+def _box(x: np.ndarray) -> np.ndarray:
+    """Среднее в окне WIN_SIZE x WIN_SIZE (float64)."""
+    return cv2.boxFilter(x, cv2.CV_64F, (WIN_SIZE, WIN_SIZE), normalize=True, borderType=cv2.BORDER_REFLECT)
+
+
+def ssim_stats(gray: np.ndarray) -> Stats:
+    """
+    Локальные статистики одного лица: среднее и дисперсия в окне.
+
+    Returns:
+        (mu, var) — карты float32 того же размера
+    """
+    x = gray.astype(np.float64)
+    mu = _box(x)
+    var = _COV_NORM * (_box(x * x) - mu * mu)
+    return mu.astype(np.float32), var.astype(np.float32)
+
+
+def _ssim_map(ux, vx, uy, vy, sxy):
+    """Карта SSIM по средним, дисперсиям и среднему произведению в окне."""
+    vxy = _COV_NORM * (sxy - ux * uy)
+    a1 = 2 * ux * uy + _C1
+    a2 = 2 * vxy + _C2
+    b1 = ux * ux + uy * uy + _C1
+    b2 = vx + vy + _C2
+    return (a1 * a2) / (b1 * b2)
+
+
+def ssim(x: np.ndarray, y: np.ndarray,
+         stats_x: Optional[Stats] = None, stats_y: Optional[Stats] = None) -> float:
+    """
+    SSIM двух лиц.
+
+    Args:
+        x, y: лица (uint8, одного размера)
+        stats_x, stats_y: готовые (mu, var) из шаблонов; None — посчитать
+    """
+    ux, vx = stats_x if stats_x is not None else ssim_stats(x)
+    uy, vy = stats_y if stats_y is not None else ssim_stats(y)
+    sxy = _box(x.astype(np.float64) * y)
+
+    s = _ssim_map(ux.astype(np.float64), vx.astype(np.float64),
+                  uy.astype(np.float64), vy.astype(np.float64), sxy)
+    return float(s[_PAD:-_PAD, _PAD:-_PAD].mean())
+
+
+def ssim_batch(
+    query: np.ndarray,
+    faces: np.ndarray,
+    query_stats: Optional[Stats] = None,
+    mu: Optional[np.ndarray] = None,
+    var: Optional[np.ndarray] = None,
+    idx: Optional[np.ndarray] = None,
+    batch_size: int = BATCH_SIZE,
+) -> np.ndarray:
+    """
+    SSIM запроса с каждым лицом галереи.
+
+    Пакет считается во float32 и только по внутренней области (без краёв):
+    сумма 49 произведений uint8 точно представима во float32, отклонение
+    от skimage — порядка 1e-7.
+
+    Args:
+        query: лицо запроса H x W (uint8)
+        faces: лица галереи N x H x W (uint8)
+        query_stats: (mu, var) запроса; None — посчитать
+        mu, var: статистики лиц галереи N x H x W (float32); None — считаются
+                 по faces на лету (медленнее: три фильтра на лицо вместо одного)
+        idx: индексы лиц галереи; None — все
+
+    Returns:
+        массив float64 длины len(idx) (или N)
+    """
+    idx = np.arange(len(faces)) if idx is None else np.asarray(idx, dtype=np.intp)
+    h, w = query.shape
+    inner = (slice(None), slice(_PAD, h - _PAD), slice(_PAD, w - _PAD))
+
+    ux, vx = query_stats if query_stats is not None else ssim_stats(query)
+    ux = ux[inner[1:]].astype(np.float32)
+    x = query.astype(np.float32)
+
+    # Слагаемые, зависящие только от запроса
+    ux_sq = ux * ux + np.float32(_C1)
+    vx_c2 = vx[inner[1:]].astype(np.float32) + np.float32(_C2)
+    c1 = np.float32(_C1)
+    c2 = np.float32(_C2)
+    cov2 = np.float32(2 * _COV_NORM)
+
+    result = np.empty(len(idx), dtype=np.float64)
+    for start in range(0, len(idx), batch_size):
+        part = idx[start:start + batch_size]
+        b = len(part)
+        y = faces[part]
+
+        if mu is not None and var is not None:
+            uy = mu[part][inner]
+            vy = var[part][inner]
+        else:
+            stats = [ssim_stats(face) for face in y]
+            uy = np.stack([m for m, _ in stats])[inner]
+            vy = np.stack([v for _, v in stats])[inner]
+
+        xy = (y.astype(np.float32) * x).reshape(b * h, w)
+        sxy = cv2.boxFilter(xy, cv2.CV_32F, (WIN_SIZE, WIN_SIZE), normalize=True,
+                            borderType=cv2.BORDER_REFLECT).reshape(b, h, w)[inner]
+
+        p = ux * uy
+        num = (2 * p + c1) * (cov2 * (sxy - p) + c2)
+        den = (ux_sq + uy * uy) * (vx_c2 + vy)
+        result[start:start + b] = (num / den).mean(axis=(1, 2), dtype=np.float64)
+
+    return result
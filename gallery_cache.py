@@ -0,0 +1,176 @@
+"""
+Кэш галереи участников в памяти процесса.
+
+Шаблоны всех участников загружаются из БД один раз (лениво, при первом
+обращении) и хранятся уже сложенными в массивы для match_gallery.
+При добавлении участника кэш дополняется инкрементально. Изменения,
+сделанные другими процессами, замечаются по таблице gallery_version:
+перед каждой выдачей кэш сверяет свою версию с версией в БД.
+"""
+
+import itertools
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import face_recognition_module
+import face_templates
+import metrics
+
+
+_origins = itertools.count(1)
+
+
+class Gallery(dict):
+    """
+    Галерея (dict из FaceRecognizer.stack_gallery) с меткой origin полной
+    загрузки. Галереи с одной меткой отличаются только строками, добавленными
+    в конец (GalleryCache.add): по ней parallel_match досылает исполнителям
+    только новые строки, а не всю галерею.
+    """
+
+    def __init__(self, arrays: dict, origin: int):
+        super().__init__(arrays)
+        self.origin = origin
+
+
+class GalleryCache:
+    """Галерея участников: метаданные + сложенные массивы шаблонов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._participants: Optional[List[dict]] = None
+        self._gallery: Optional[dict] = None
+        self._version: Optional[int] = None
+
+        self._hits = 0
+        self._misses = 0
+        self._stale_reloads = 0
+        self._incremental_adds = 0
+        self._invalidations = 0
+        self._last_load_ms = 0.0
+
+    def get(self) -> Tuple[List[dict], dict]:
+        """
+        Возвращает (participants, gallery).
+
+        participants — список dict: participant_id, login, name;
+        gallery — результат FaceRecognizer.stack_gallery в том же порядке.
+        Возвращённые объекты не изменяются кэшем, их можно использовать без блокировки.
+        """
+        version = face_templates.get_version()
+
+        with self._lock:
+            if self._gallery is not None and self._version == version:
+                self._hits += 1
+                return self._participants, self._gallery
+
+            if self._gallery is not None:
+                self._stale_reloads += 1
+            self._misses += 1
+            self._load(version)
+            return self._participants, self._gallery
+
+    def _load(self, version: int):
+        """Полная загрузка из БД (вызывается под блокировкой)."""
+        t0 = time.perf_counter()
+        rows = face_templates.load_gallery()
+
+        recognizer = face_recognition_module.get_recognizer()
+        self._gallery = Gallery(recognizer.stack_gallery([row["template"] for row in rows]), next(_origins))
+        self._participants = [
+            {"participant_id": row["participant_id"], "login": row["login"], "name": row["name"]}
+            for row in rows
+        ]
+        # Версия читается ДО загрузки: если кто-то изменит БД во время загрузки,
+        # следующая проверка увидит расхождение и перезагрузит галерею
+        self._version = version
+        elapsed = time.perf_counter() - t0
+        self._last_load_ms = elapsed * 1000
+        metrics.observe("gallery_load", elapsed)
+
+    def add(self, participant_id: int, login: str, name: Optional[str],
+            template: Optional[dict], version: int):
+        """
+        Инкрементально добавляет участника.
+
+        Args:
+            version: версия галереи после добавления (результат bump_version).
+                     Если кэш отстаёт больше чем на одно изменение (его меняли
+                     другие процессы), он просто сбрасывается.
+        """
+        with self._lock:
+            if self._gallery is None:
+                return
+            if self._version != version - 1:
+                self._invalidate()
+                return
+            if any(p["participant_id"] == participant_id for p in self._participants):
+                # Участник уже попал в кэш при параллельной перезагрузке
+                self._version = version
+                return
+
+            recognizer = face_recognition_module.get_recognizer()
+            addition = recognizer.stack_gallery([template])
+
+            gallery = Gallery({
+                key: np.concatenate([self._gallery[key], addition[key]])
+                for key in self._gallery
+            }, self._gallery.origin)
+            participants = self._participants + [
+                {"participant_id": participant_id, "login": login, "name": name}
+            ]
+
+            # Заменяем объекты целиком — ранее выданные снимки остаются валидными
+            self._gallery = gallery
+            self._participants = participants
+            self._version = version
+            self._incremental_adds += 1
+
+    def invalidate(self):
+        """Сбрасывает кэш; следующий get() загрузит галерею заново."""
+        with self._lock:
+            self._invalidate()
+
+    def _invalidate(self):
+        self._participants = None
+        self._gallery = None
+        self._version = None
+        self._invalidations += 1
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов и объём памяти."""
+        with self._lock:
+            size = len(self._participants) if self._participants is not None else 0
+            memory = 0
+            if self._gallery is not None:
+                memory = sum(value.nbytes for value in self._gallery.values())
+
+            return {
+                "loaded": self._gallery is not None,
+                "version": self._version,
+                "participants": size,
+                "memory_bytes": memory,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale_reloads": self._stale_reloads,
+                "incremental_adds": self._incremental_adds,
+                "invalidations": self._invalidations,
+                "last_load_ms": round(self._last_load_ms, 2),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_gallery_cache() -> GalleryCache:
+    """Получить глобальный кэш галереи (singleton на процесс)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GalleryCache()
+    return _cache
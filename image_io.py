@@ -0,0 +1,79 @@
+"""
+Загрузка изображений из памяти без временных файлов.
+
+Все точки входа (проверка фото, извлечение лица, сравнение) принимают
+"источник изображения" любого вида:
+  - путь к файлу (str / os.PathLike);
+  - содержимое файла: bytes, bytearray, memoryview или любой объект
+    с буферным протоколом (например, BLOB из sqlite3);
+  - уже декодированное изображение numpy (HxW или HxWxC, uint8);
+  - закодированный файл в одномерном массиве uint8.
+
+Байты не копируются: буфер оборачивается np.frombuffer и передаётся
+прямо в cv2.imdecode.
+"""
+
+import os
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, np.ndarray]
+
+
+def is_path(source) -> bool:
+    """Является ли источник путём к файлу."""
+    return isinstance(source, (str, os.PathLike))
+
+
+def describe(source) -> str:
+    """Короткое описание источника для сообщений об ошибках."""
+    if is_path(source):
+        return os.fspath(source)
+    if isinstance(source, np.ndarray):
+        return f"массив {source.shape}"
+    return f"{memoryview(source).nbytes} байт"
+
+
+def _to_color(img: np.ndarray) -> np.ndarray:
+    """Приводит декодированное изображение к BGR (как cv2.IMREAD_COLOR)."""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def load_image(source: ImageSource, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """
+    Декодирует изображение из любого источника.
+
+    Args:
+        source: путь, байты/буфер или массив numpy (см. описание модуля)
+        flags: флаги cv2.imdecode (IMREAD_COLOR или IMREAD_GRAYSCALE)
+
+    Returns:
+        изображение (BGR или grayscale) или None, если декодировать не удалось —
+        так же, как cv2.imread
+    """
+    if isinstance(source, np.ndarray) and source.ndim >= 2:
+        # Уже декодированное изображение
+        if flags == cv2.IMREAD_GRAYSCALE and source.ndim == 3:
+            return cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+        if flags == cv2.IMREAD_COLOR:
+            return _to_color(source)
+        return source
+
+    if is_path(source):
+        # np.fromfile вместо cv2.imread: работает и с кириллицей в путях на Windows
+        try:
+            buf = np.fromfile(os.fspath(source), dtype=np.uint8)
+        except OSError:
+            return None
+    else:
+        buf = np.frombuffer(source, dtype=np.uint8)
+
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, flags)
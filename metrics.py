@@ -0,0 +1,253 @@
+"""
+Метрики горячего пути в памяти процесса: гистограммы задержек по этапам
+и счётчики исходов, выдача в текстовом формате Prometheus (/admin/metrics).
+
+    with metrics.timer("decode"):
+        img = load_image(raw)
+
+    metrics.inc("register_requests", status="registered")
+
+Гистограммы — фиксированные корзины (как в Prometheus, для агрегации на
+стороне сервера) плюс последние RESERVOIR_SIZE замеров этапа, по которым
+считаются p50/p90/p99 прямо в процессе.
+
+Метрики у каждого процесса свои. Исполнители пула parallel_match
+(MATCH_EXECUTOR=process) после каждой задачи отдают накопленное
+(Registry.drain), и родитель добавляет это в свой реестр (Registry.merge).
+"""
+
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Префикс имён метрик
+NAMESPACE = "facereg"
+
+# Верхние границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Сколько последних замеров этапа хранится для квантилей
+RESERVOIR_SIZE = 1024
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма задержек одного этапа."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS, reservoir: int = RESERVOIR_SIZE):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=reservoir)
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+            self._count += 1
+            self._recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        """count, sum, накопленные корзины и квантили последних замеров."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+            recent = sorted(self._recent)
+
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            running += n
+            cumulative.append((bound, running))
+
+        quantiles = {}
+        if recent:
+            for q in QUANTILES:
+                quantiles[q] = recent[min(len(recent) - 1, int(q * len(recent)))]
+        return {"count": count, "sum": total, "buckets": cumulative, "quantiles": quantiles}
+
+    def state(self) -> tuple:
+        """Сырое состояние (корзины, сумма, число, последние замеры) для merge."""
+        with self._lock:
+            return list(self._counts), self._sum, self._count, list(self._recent)
+
+    def merge(self, state: tuple):
+        """Добавляет состояние другой гистограммы с теми же корзинами (state())."""
+        counts, total, count, recent = state
+        with self._lock:
+            self._counts = [a + b for a, b in zip(self._counts, counts)]
+            self._sum += total
+            self._count += count
+            self._recent.extend(recent)
+
+
+class Registry:
+    """Набор гистограмм этапов и счётчиков с метками."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+
+    def histogram(self, stage: str) -> Histogram:
+        hist = self._stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(stage, Histogram())
+        return hist
+
+    def observe(self, stage: str, seconds: float):
+        """Добавляет замер длительности этапа, секунды."""
+        self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Замеряет длительность блока with (замер пишется и при исключении)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличивает счётчик name с метками labels."""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def stages(self) -> Dict[str, dict]:
+        """Сводка по этапам: count, sum_ms и p50/p90/p99 последних замеров, мс."""
+        with self._lock:
+            stages = dict(self._stages)
+
+        result = {}
+        for stage, hist in sorted(stages.items()):
+            snap = hist.snapshot()
+            summary = {"count": snap["count"], "sum_ms": round(snap["sum"] * 1000, 3)}
+            for q, value in snap["quantiles"].items():
+                summary[f"p{int(q * 100)}_ms"] = round(value * 1000, 3)
+            result[stage] = summary
+        return result
+
+    def render(self, extra: Optional[Dict[str, dict]] = None) -> str:
+        """
+        Текстовый формат Prometheus.
+
+        Args:
+            extra: дополнительные группы значений {группа: stats()} — например,
+                   счётчики кэша галереи; каждое числовое поле выдаётся как gauge
+                   <NAMESPACE>_<группа>_<поле>
+        """
+        lines: List[str] = []
+        with self._lock:
+            stages = dict(self._stages)
+            counters = {name: dict(series) for name, series in self._counters.items()}
+
+        name = f"{NAMESPACE}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Длительность этапов обработки запроса.")
+        lines.append(f"# TYPE {name} histogram")
+        snapshots = {stage: hist.snapshot() for stage, hist in sorted(stages.items())}
+        for stage, snap in snapshots.items():
+            for bound, count in snap["buckets"]:
+                le = "+Inf" if math.isinf(bound) else _format_value(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {_format_value(snap["sum"])}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {snap["count"]}')
+
+        name = f"{NAMESPACE}_stage_duration_recent_seconds"
+        lines.append(f"# HELP {name} Квантили длительности этапов по последним {RESERVOIR_SIZE} замерам.")
+        lines.append(f"# TYPE {name} gauge")
+        for stage, snap in snapshots.items():
+            for q, value in snap["quantiles"].items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {_format_value(value)}')
+
+        for counter, series in sorted(counters.items()):
+            name = f"{NAMESPACE}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for group, stats in (extra or {}).items():
+            for field, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{NAMESPACE}_{group}_{field}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> dict:
+        """Забирает накопленные метрики (для merge в другом процессе) и сбрасывает реестр."""
+        with self._lock:
+            stages, self._stages = self._stages, {}
+            counters, self._counters = self._counters, {}
+        return {
+            "stages": {stage: hist.state() for stage, hist in stages.items()},
+            "counters": counters,
+        }
+
+    def merge(self, drained: dict):
+        """Добавляет метрики, забранные drain() в другом процессе."""
+        for stage, state in drained["stages"].items():
+            self.histogram(stage).merge(state)
+        with self._lock:
+            for name, series in drained["counters"].items():
+                target = self._counters.setdefault(name, {})
+                for labels, value in series.items():
+                    target[labels] = target.get(labels, 0) + value
+
+    def reset(self):
+        """Сбрасывает все метрики (для тестовых прогонов и бенчмарков)."""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+_registry = Registry()
+
+
+def get_registry() -> Registry:
+    """Глобальный реестр метрик процесса."""
+    return _registry
+
+
+def timer(stage: str):
+    """metrics.timer("decode") — см. Registry.timer."""
+    return _registry.timer(stage)
+
+
+def observe(stage: str, seconds: float):
+    _registry.observe(stage, seconds)
+
+
+def inc(name: str, value: float = 1, **labels):
+    _registry.inc(name, value, **labels)
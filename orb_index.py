@@ -0,0 +1,184 @@
+"""
+Индекс ORB-дескрипторов галереи: все дескрипторы участников сложены в одну
+матрицу (M x 32, uint8) + число дескрипторов каждого участника.
+
+Вместо N сопоставлений BFMatcher(crossCheck=True) "запрос — участник" расстояния
+Хэмминга от запроса до всей галереи считаются блоками одним матричным
+произведением (биты как ±1, float32 — BLAS):
+
+    hamming(a, b) = (256 - <a, b>) / 2
+
+По матрице расстояний находятся взаимные ближайшие соседи — ровно то, что
+оставляет BFMatcher с crossCheck: для дескриптора запроса i ближайший у
+участника — j, и для j ближайший среди дескрипторов запроса — i.
+При равных расстояниях, как и в OpenCV, выбирается первый по порядку.
+Число таких пар на участника даёт тот же feature_score, что и попарное сравнение.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Длина ORB-дескриптора в битах (32 байта)
+ORB_BITS = 256
+
+# Сколько дескрипторов галереи обрабатывается за один блок
+# (ограничивает память: блок x запрос float32; ключ 256 * блок
+# должен точно помещаться в float32, т.е. быть меньше 2^24)
+CHUNK_ROWS = 16384
+
+# Доля лучших совпадений и нормировка — как в FaceRecognizer.compute_feature_score
+GOOD_FRACTION = 0.3
+GOOD_MATCHES_FULL_SCORE = 50.0
+
+
+def stack_descriptors(descriptors: List[Optional[np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Складывает дескрипторы участников в одну матрицу.
+
+    Args:
+        descriptors: по одному массиву K x 32 (uint8) на участника или None
+
+    Returns:
+        (desc, counts): desc — M x 32 (uint8), counts — N (int64),
+        дескрипторы участника i — строки desc[offsets[i]:offsets[i] + counts[i]]
+    """
+    counts = np.array([len(d) if d is not None else 0 for d in descriptors], dtype=np.int64)
+    parts = [d for d in descriptors if d is not None and len(d) > 0]
+    if parts:
+        desc = np.ascontiguousarray(np.concatenate(parts), dtype=np.uint8)
+    else:
+        desc = np.zeros((0, ORB_BITS // 8), dtype=np.uint8)
+    return desc, counts
+
+
+def _signed_bits(desc: np.ndarray) -> np.ndarray:
+    """Биты дескрипторов как ±1 (float32): скалярное произведение = 256 - 2 * Хэмминг."""
+    bits = np.unpackbits(desc, axis=1).astype(np.float32)
+    bits *= 2
+    bits -= 1
+    return bits
+
+
+def _mutual_counts_block(query_bits: np.ndarray, block_bits: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Число взаимных ближайших соседей для участников одного блока (counts > 0)."""
+    n_query = len(query_bits)
+    height = len(block_bits)
+
+    # Строки — дескрипторы блока, столбцы — дескрипторы запроса.
+    # Максимум скалярного произведения = минимум расстояния Хэмминга
+    dot = block_bits @ query_bits.T
+
+    # Обратное направление: ближайший дескриптор запроса для каждой строки
+    best_query = np.argmax(dot, axis=1)
+
+    # Прямое направление: ближайшая строка в пределах каждого участника.
+    # Ключ dot * height - строка (на месте): максимум даёт и расстояние,
+    # и ПЕРВУЮ строку с ним
+    dot *= height
+    dot -= np.arange(height, dtype=np.float32)[:, None]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    best_key = np.maximum.reduceat(dot, starts, axis=0)
+    best_row = np.mod(-best_key, height).astype(np.intp)
+
+    mutual = best_query[best_row] == np.arange(n_query)[None, :]
+    return mutual.sum(axis=1)
+
+
+def mutual_match_counts(
+    query: Optional[np.ndarray],
+    desc: np.ndarray,
+    counts: np.ndarray,
+    idx: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Число взаимных совпадений (как BFMatcher crossCheck) запроса с участниками.
+
+    Args:
+        query: дескрипторы запроса K x 32 (uint8) или None
+        desc, counts: результат stack_descriptors
+        idx: индексы участников; None — все
+
+    Returns:
+        массив int64 длины len(idx) (или N)
+    """
+    return mutual_match_counts_many([query], desc, counts, idx)[0]
+
+
+def mutual_match_counts_many(
+    queries: List[Optional[np.ndarray]],
+    desc: np.ndarray,
+    counts: np.ndarray,
+    idx: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    mutual_match_counts для нескольких запросов: биты дескрипторов галереи
+    распаковываются один раз на блок и используются всеми запросами.
+
+    Returns:
+        массив int64 Q x len(idx) (или Q x N)
+    """
+    idx = np.arange(len(counts)) if idx is None else np.asarray(idx, dtype=np.intp)
+    result = np.zeros((len(queries), len(idx)), dtype=np.int64)
+    active = [q for q, query in enumerate(queries) if query is not None and len(query) > 0]
+    if not active or len(idx) == 0:
+        return result
+
+    # Дескрипторы выбранных участников подряд (без копии, если выбраны все)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    sel_counts = counts[idx]
+    if len(idx) == len(counts) and np.array_equal(idx, np.arange(len(counts))):
+        sel_desc = desc
+    else:
+        total = int(sel_counts.sum())
+        shift = np.repeat(offsets[idx] - np.concatenate([[0], np.cumsum(sel_counts)[:-1]]), sel_counts)
+        sel_desc = desc[shift + np.arange(total)]
+
+    query_bits = {q: _signed_bits(np.ascontiguousarray(queries[q], dtype=np.uint8)) for q in active}
+    nonempty = np.flatnonzero(sel_counts > 0)
+    sel_offsets = np.concatenate([[0], np.cumsum(sel_counts)])
+
+    # Блоки по границам участников: участник целиком попадает в один блок
+    i = 0
+    while i < len(nonempty):
+        first = nonempty[i]
+        limit = sel_offsets[first] + CHUNK_ROWS
+        j = i + 1
+        while j < len(nonempty) and sel_offsets[nonempty[j] + 1] <= limit:
+            j += 1
+
+        members = nonempty[i:j]
+        lo, hi = sel_offsets[members[0]], sel_offsets[members[-1] + 1]
+        block_bits = _signed_bits(sel_desc[lo:hi])
+        for q in active:
+            result[q, members] = _mutual_counts_block(query_bits[q], block_bits, sel_counts[members])
+        i = j
+
+    return result
+
+
+def feature_scores(
+    query: Optional[np.ndarray],
+    desc: np.ndarray,
+    counts: np.ndarray,
+    idx: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    ORB feature_score (0-1) запроса для участников idx — то же значение,
+    что FaceRecognizer.compute_feature_score для каждой пары.
+    """
+    matches = mutual_match_counts(query, desc, counts, idx)
+    good = np.floor(matches * GOOD_FRACTION)
+    return np.minimum(1.0, good / GOOD_MATCHES_FULL_SCORE)
+
+
+def feature_scores_many(
+    queries: List[Optional[np.ndarray]],
+    desc: np.ndarray,
+    counts: np.ndarray,
+    idx: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """feature_scores для нескольких запросов: Q x len(idx) (см. mutual_match_counts_many)."""
+    matches = mutual_match_counts_many(queries, desc, counts, idx)
+    good = np.floor(matches * GOOD_FRACTION)
+    return np.minimum(1.0, good / GOOD_MATCHES_FULL_SCORE)
@@ -0,0 +1,325 @@
+"""
+Параллельное сравнение с большой галереей.
+
+Галерея делится на блоки по MATCH_CHUNK_SIZE участников, блоки считаются
+в постоянном пуле исполнителей:
+  - "process" — ProcessPoolExecutor; каждый процесс при старте получает
+    галерею и создаёт свой FaceRecognizer (каскад загружается один раз);
+  - "thread"  — ThreadPoolExecutor; галерея общая, выигрыш за счёт того,
+    что OpenCV/NumPy/SciPy отпускают GIL в тяжёлых операциях.
+
+Каждый блок считается тем же FaceRecognizer.match_gallery, что и в
+последовательном режиме, поэтому результаты совпадают.
+
+Процессы пула живут, пока галерея только растёт: после добавления участника
+(gallery_cache.Gallery с той же меткой origin) задачи несут только новые
+строки — от самого отстающего исполнителя (каждый ответ сообщает, сколько
+строк у процесса). Пул пересоздаётся при полной перезагрузке галереи или
+когда новых строк больше REBASE_ROWS. Старый пул закрывается, только когда
+завершатся все match, которые успели его взять.
+
+Метрики этапов из процессов пула возвращаются с каждым ответом и
+добавляются в реестр родителя. Счётчики отсечения блоков (и потоков, и
+процессов) возвращаются вместе с оценками, складываются и записываются
+в распознаватель родителя как один запрос.
+"""
+
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import config
+import face_recognition_module
+import metrics
+
+# Сколько добавленных участников досылается задачами, прежде чем пул
+# процессов пересоздаётся с полной галереей
+REBASE_ROWS = 64
+
+# Галерея, загруженная в процесс-исполнитель (см. _init_worker)
+_worker_gallery = None
+
+
+def _rows(gallery: dict) -> Dict[str, int]:
+    """Число строк каждого массива галереи."""
+    return {key: value.shape[0] for key, value in gallery.items()}
+
+
+def _init_worker(gallery: dict):
+    """Инициализация процесса пула: галерея + прогрев распознавателя."""
+    global _worker_gallery
+    _worker_gallery = gallery
+    face_recognition_module.get_recognizer()
+
+
+def _warmup(_=None) -> bool:
+    """Пустая задача: заставляет пул запустить процесс (и его инициализацию)."""
+    return _worker_gallery is not None
+
+
+def _extend_worker(delta: Optional[tuple]):
+    """
+    Дописывает в галерею процесса недостающие строки.
+
+    delta — (start, tail): tail[key] — строки массива key, начиная со строки
+    start[key] (не дальше, чем у любого исполнителя пула).
+    """
+    global _worker_gallery
+    if delta is None:
+        return
+    start, tail = delta
+    have = _rows(_worker_gallery)
+    if all(have[key] >= start[key] + len(tail[key]) for key in tail):
+        return
+    _worker_gallery = {
+        key: np.concatenate([value, tail[key][have[key] - start[key]:]])
+        for key, value in _worker_gallery.items()
+    }
+
+
+def _score_chunk(
+    query: dict,
+    chunk: np.ndarray,
+    gallery: Optional[dict] = None,
+    prune_below: Optional[float] = None,
+) -> Tuple[np.ndarray, dict]:
+    """
+    Оценки для блока индексов галереи (отсечённые — NaN) и счётчики отсечения
+    блока: запрос записывается один раз, по сумме блоков (ParallelMatcher.match).
+    """
+    gallery = gallery if gallery is not None else _worker_gallery
+    recognizer = face_recognition_module.get_recognizer()
+    counts = {}
+    _, scores = recognizer.match_gallery(
+        query, gallery, candidates=chunk, prune_below=prune_below, prune_counts=counts
+    )
+    return scores[chunk], counts
+
+
+def _score_chunk_in_worker(
+    query: dict,
+    chunk: np.ndarray,
+    prune_below: Optional[float],
+    delta: Optional[tuple],
+) -> Tuple[np.ndarray, dict]:
+    """
+    Задача процесса пула: _score_chunk по галерее процесса.
+
+    Returns:
+        (оценки, отчёт): pid, rows — строки галереи процесса, metrics —
+        Registry.drain(), prune — счётчики отсечения блока
+    """
+    _extend_worker(delta)
+    scores, counts = _score_chunk(query, chunk, None, prune_below)
+    return scores, {
+        "pid": os.getpid(),
+        "rows": _rows(_worker_gallery),
+        "metrics": metrics.get_registry().drain(),
+        "prune": counts,
+    }
+
+
+class _ProcessPool:
+    """Пул процессов, созданный на базовой галерее, и что известно о его исполнителях."""
+
+    def __init__(self, workers: int, gallery: dict):
+        self.workers = workers
+        self.origin = getattr(gallery, "origin", None)
+        self.base_rows = _rows(gallery)
+        # pid -> строки галереи процесса (по последнему ответу)
+        self.worker_rows: Dict[int, Dict[str, int]] = {}
+        # match, которые сейчас используют пул
+        self.users = 0
+        self.retired = False
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(dict(gallery),),
+        )
+        # Прогрев: запускаем все процессы сразу, а не при первом запросе
+        list(self.executor.map(_warmup, range(workers)))
+
+    def min_rows(self) -> Dict[str, int]:
+        """Строки самого отстающего исполнителя (не отвечавшие — с базовой галереей)."""
+        known = list(self.worker_rows.values())
+        if len(known) < self.workers:
+            known.append(self.base_rows)
+        return {key: min(rows[key] for rows in known) for key in self.base_rows}
+
+    def delta(self, gallery: dict) -> Optional[tuple]:
+        """Строки gallery, которых может не быть у исполнителей (None — есть у всех)."""
+        start = self.min_rows()
+        if all(gallery[key].shape[0] <= start[key] for key in start):
+            return None
+        return start, {key: gallery[key][start[key]:] for key in start}
+
+    def extends_to(self, gallery: dict) -> bool:
+        """gallery — та же галерея с добавленными строками, и их не слишком много."""
+        if self.origin is None or getattr(gallery, "origin", None) != self.origin:
+            return False
+        if set(gallery) != set(self.base_rows):
+            return False
+        return len(gallery["valid"]) - self.min_rows()["valid"] <= REBASE_ROWS
+
+
+class ParallelMatcher:
+    """Постоянный пул для 1:N сравнения блоками."""
+
+    def __init__(self, workers: int, chunk_size: int = 256, executor: str = "process"):
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Неизвестный тип исполнителя: {executor}")
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.executor = executor
+
+        self._lock = threading.Lock()
+        # "thread": один пул на всё время; "process": текущий _ProcessPool
+        self._threads: Optional[Executor] = None
+        self._pool: Optional[_ProcessPool] = None
+        self._pool_gallery = None
+        self._rebuilds = 0
+
+    def _acquire(self, gallery: dict) -> Tuple[_ProcessPool, Optional[tuple]]:
+        """Пул процессов для gallery (занят до _release) и строки, которые нужно дослать."""
+        with self._lock:
+            pool = self._pool
+            if pool is None or (gallery is not self._pool_gallery and not pool.extends_to(gallery)):
+                if pool is not None:
+                    self._retire(pool)
+                pool = self._pool = _ProcessPool(self.workers, gallery)
+                self._rebuilds += 1
+            self._pool_gallery = gallery
+            pool.users += 1
+            return pool, pool.delta(gallery)
+
+    def _release(self, pool: _ProcessPool, reports):
+        with self._lock:
+            for report in reports:
+                rows = pool.worker_rows.get(report["pid"])
+                if rows is None or rows["valid"] < report["rows"]["valid"]:
+                    pool.worker_rows[report["pid"]] = report["rows"]
+            pool.users -= 1
+            if pool.retired and pool.users == 0:
+                pool.executor.shutdown(wait=False)
+
+    def _retire(self, pool: _ProcessPool):
+        """Пул больше не выдаётся; закрывается, когда его освободит последний match (под блокировкой)."""
+        pool.retired = True
+        if pool.users == 0:
+            pool.executor.shutdown(wait=False)
+
+    def _thread_pool(self) -> Executor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.workers)
+            return self._threads
+
+    def match(
+        self,
+        query: dict,
+        gallery: dict,
+        candidates: Optional[np.ndarray] = None,
+        prune_below: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        То же, что FaceRecognizer.match_gallery(query, gallery, candidates, prune_below),
+        но блоки галереи считаются параллельно.
+
+        При отсечении каждый блок сравнивает границы со своей лучшей оценкой:
+        отсекается меньше, чем в одном проходе, но победитель тот же.
+        Счётчики отсечения блоков складываются и записываются как один запрос.
+        """
+        valid = gallery["valid"]
+        n = len(valid)
+        scores = np.zeros(n, dtype=np.float64)
+
+        if candidates is None:
+            work = np.arange(n)
+        else:
+            work = np.asarray(candidates, dtype=np.intp)
+            scores[valid] = np.nan
+
+        chunks = [work[i:i + self.chunk_size] for i in range(0, len(work), self.chunk_size)]
+        pruned = []
+        if chunks and self.executor == "thread":
+            pool = self._thread_pool()
+            futures = [pool.submit(_score_chunk, query, chunk, gallery, prune_below) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                scores[chunk], counts = future.result()
+                pruned.append(counts)
+        elif chunks:
+            pool, delta = self._acquire(gallery)
+            reports = []
+            try:
+                futures = [
+                    pool.executor.submit(_score_chunk_in_worker, query, chunk, prune_below, delta)
+                    for chunk in chunks
+                ]
+                for chunk, future in zip(chunks, futures):
+                    scores[chunk], report = future.result()
+                    reports.append(report)
+            finally:
+                self._release(pool, reports)
+
+            # Метрики процессов — в родительский процесс
+            for report in reports:
+                metrics.get_registry().merge(report["metrics"])
+                pruned.append(report["prune"])
+
+        if prune_below is not None:
+            totals = {
+                key: sum(counts.get(key, 0) for counts in pruned)
+                for key in ("candidates", "ssim_skipped", "orb_skipped")
+            }
+            face_recognition_module.get_recognizer().record_pruning(totals)
+
+        order = np.argsort(-scores, kind="stable")
+        return order, scores
+
+    def stats(self) -> dict:
+        """Сколько раз создавался пул процессов и сколько строк галереи у исполнителей."""
+        with self._lock:
+            pool = self._pool
+            return {
+                "executor": self.executor,
+                "workers": self.workers,
+                "pool_rebuilds": self._rebuilds,
+                "base_rows": pool.base_rows["valid"] if pool is not None else 0,
+                "min_worker_rows": pool.min_rows()["valid"] if pool is not None else 0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool, self._pool_gallery = self._pool, None, None
+            threads, self._threads = self._threads, None
+        if pool is not None:
+            pool.executor.shutdown(wait=True)
+        if threads is not None:
+            threads.shutdown(wait=True)
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher() -> Optional[ParallelMatcher]:
+    """
+    Глобальный параллельный сопоставитель по настройкам config.
+    None — параллельный режим выключен (MATCH_WORKERS = 0).
+    """
+    global _matcher
+    if config.MATCH_WORKERS <= 0:
+        return None
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = ParallelMatcher(
+                    workers=config.MATCH_WORKERS,
+                    chunk_size=config.MATCH_CHUNK_SIZE,
+                    executor=config.MATCH_EXECUTOR,
+                )
+    return _matcher
@@ -0,0 +1,51 @@
+"""
+64-битные перцептуальные хеши (pHash/dHash) нормализованных лиц
+и векторизованное расстояние Хэмминга по упакованным массивам uint64.
+
+Используется для грубого этапа поиска: все участники ранжируются по
+расстоянию Хэмминга одним проходом, дорогое сравнение (SSIM/LBP/ORB)
+выполняется только для top-K кандидатов.
+"""
+
+from typing import Tuple
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+# Таблица popcount для байтов (запасной вариант, если нет np.bitwise_count)
+_POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def pack_hash(image_hash: imagehash.ImageHash) -> int:
+    """Упаковывает хеш 8x8 в одно 64-битное число (первый бит — старший)."""
+    bits = np.packbits(image_hash.hash.ravel())
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hash_face(gray: np.ndarray) -> Tuple[int, int]:
+    """
+    pHash и dHash нормализованного лица.
+
+    Args:
+        gray: лицо в оттенках серого (uint8)
+
+    Returns:
+        (phash, dhash) — 64-битные числа
+    """
+    image = Image.fromarray(gray)
+    return pack_hash(imagehash.phash(image)), pack_hash(imagehash.dhash(image))
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Количество единичных битов в каждом элементе массива uint64."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    as_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_8[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def hamming(query: int, packed: np.ndarray) -> np.ndarray:
+    """Расстояния Хэмминга от query до каждого хеша массива uint64."""
+    return popcount64(np.bitwise_xor(packed, np.uint64(query)))
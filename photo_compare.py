@@ -1,3 +1,11 @@
+import os
+import sys
+import csv
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
 import cv2
 import numpy as np
 from skimage.metrics import structural_similarity as ssim
@@ -5,30 +13,128 @@ from scipy.spatial import distance
 import imagehash
 from PIL import Image
 
+import db
+import perceptual_hash
+from image_io import ImageSource, load_image
+
+# Функции перцептуального хеширования (imagehash)
+HASH_FUNCTIONS = {
+    'average': imagehash.average_hash,
+    'perceptual': imagehash.phash,
+    'difference': imagehash.dhash,
+    'wavelet': imagehash.whash
+}
+
+
+class PreparedImage:
+    """
+    Декодированное изображение и производные от него представления.
+
+    Каждое представление (grayscale, уменьшенные копии, гистограмма, хеши,
+    ключевые точки) считается один раз — при первом обращении — и дальше
+    берётся из кэша. Один PreparedImage можно передавать в любое число
+    ImageComparator: изображение не будет ни декодироваться, ни
+    обрабатываться повторно.
+    """
+
+    def __init__(self, source: ImageSource):
+        """
+        Args:
+            source: путь, содержимое файла (bytes/буфер) или массив numpy (BGR)
+        """
+        self.bgr = load_image(source)
+        if self.bgr is None:
+            raise ValueError("Не удалось загрузить изображение")
+        self._hashes = {}
+        self._features = {}
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def bgr_300(self) -> np.ndarray:
+        """BGR 300x300 (MSE, гистограммы)."""
+        return cv2.resize(self.bgr, (300, 300))
+
+    @cached_property
+    def gray_300(self) -> np.ndarray:
+        """Grayscale 300x300 (SSIM)."""
+        return cv2.resize(self.gray, (300, 300))
+
+    @cached_property
+    def bgr_100(self) -> np.ndarray:
+        """BGR 100x100 (косинусное сходство пикселей)."""
+        return cv2.resize(self.bgr, (100, 100))
+
+    @cached_property
+    def color_hist(self) -> np.ndarray:
+        """Нормализованная цветовая гистограмма 8x8x8 по bgr_300."""
+        hist = cv2.calcHist([self.bgr_300], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
+        return cv2.normalize(hist, hist).flatten()
+
+    @cached_property
+    def pil(self) -> Image.Image:
+        """PIL-версия (для перцептуального хеширования) из уже декодированного массива."""
+        return Image.fromarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    def image_hash(self, hash_type: str = 'average') -> imagehash.ImageHash:
+        """Перцептуальный хеш ('average', 'perceptual', 'difference', 'wavelet')."""
+        if hash_type not in HASH_FUNCTIONS:
+            hash_type = 'average'
+        if hash_type not in self._hashes:
+            self._hashes[hash_type] = HASH_FUNCTIONS[hash_type](self.pil)
+        return self._hashes[hash_type]
+
+    def features(self, method: str = 'orb'):
+        """Ключевые точки и дескрипторы ('orb' или 'sift')."""
+        if method not in self._features:
+            if method == 'sift':
+                try:
+                    detector = cv2.SIFT_create()
+                except AttributeError:
+                    # Если SIFT недоступен, используем ORB
+                    detector = cv2.ORB_create()
+            else:
+                detector = cv2.ORB_create()
+            self._features[method] = detector.detectAndCompute(self.gray, None)
+        return self._features[method]
+
+
+def prepare_image(image) -> PreparedImage:
+    """PreparedImage для источника изображения (уже подготовленное возвращается как есть)."""
+    return image if isinstance(image, PreparedImage) else PreparedImage(image)
+
+
 class ImageComparator:
     """Класс для сравнения двух изображений различными методами."""
     
-    def __init__(self, image_path1, image_path2):
+    def __init__(self, image1, image2):
         """
         Инициализация сравнителя изображений.
         
         Args:
-            image_path1: путь к первому изображению
-            image_path2: путь ко второму изображению
+            image1: первое изображение — путь, содержимое файла (bytes/буфер),
+                    массив numpy (BGR) или PreparedImage
+            image2: второе изображение (то же)
         """
-        self.image_path1 = image_path1
-        self.image_path2 = image_path2
-        
-        # Загрузка изображений
-        self.img1_cv = cv2.imread(image_path1)
-        self.img2_cv = cv2.imread(image_path2)
-        
-        if self.img1_cv is None or self.img2_cv is None:
+        # Загрузка изображений (каждое декодируется один раз)
+        try:
+            self.img1 = prepare_image(image1)
+            self.img2 = prepare_image(image2)
+        except ValueError:
             raise ValueError("Не удалось загрузить одно или оба изображения")
         
-        # Для PIL (нужно для перцептуального хеширования)
-        self.img1_pil = Image.open(image_path1)
-        self.img2_pil = Image.open(image_path2)
+        self.img1_cv = self.img1.bgr
+        self.img2_cv = self.img2.bgr
+    
+    @property
+    def img1_pil(self) -> Image.Image:
+        return self.img1.pil
+    
+    @property
+    def img2_pil(self) -> Image.Image:
+        return self.img2.pil
     
     def mse_comparison(self):
         """
@@ -40,8 +146,8 @@ class ImageComparator:
             float: значение MSE
         """
         # Приведение к одинаковому размеру
-        img1_resized = cv2.resize(self.img1_cv, (300, 300))
-        img2_resized = cv2.resize(self.img2_cv, (300, 300))
+        img1_resized = self.img1.bgr_300
+        img2_resized = self.img2.bgr_300
         
         # Вычисление MSE
         mse = np.mean((img1_resized.astype(float) - img2_resized.astype(float)) ** 2)
@@ -56,14 +162,11 @@ class ImageComparator:
             float: индекс структурного сходства
         """
         # Приведение к одинаковому размеру и grayscale
-        img1_gray = cv2.cvtColor(self.img1_cv, cv2.COLOR_BGR2GRAY)
-        img2_gray = cv2.cvtColor(self.img2_cv, cv2.COLOR_BGR2GRAY)
-        
-        img1_resized = cv2.resize(img1_gray, (300, 300))
-        img2_resized = cv2.resize(img2_gray, (300, 300))
+        img1_resized = self.img1.gray_300
+        img2_resized = self.img2.gray_300
         
         # Вычисление SSIM
-        similarity_index, _ = ssim(img1_resized, img2_resized, full=True)
+        similarity_index = ssim(img1_resized, img2_resized)
         return similarity_index
     
     def histogram_comparison(self, method='correlation'):
@@ -76,17 +179,9 @@ class ImageComparator:
         Returns:
             float: мера сходства (зависит от метода)
         """
-        # Приведение к одинаковому размеру
-        img1_resized = cv2.resize(self.img1_cv, (300, 300))
-        img2_resized = cv2.resize(self.img2_cv, (300, 300))
-        
-        # Вычисление гистограмм для каждого канала
-        hist1 = cv2.calcHist([img1_resized], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
-        hist2 = cv2.calcHist([img2_resized], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
-        
-        # Нормализация
-        hist1 = cv2.normalize(hist1, hist1).flatten()
-        hist2 = cv2.normalize(hist2, hist2).flatten()
+        # Нормализованные гистограммы 8x8x8 по копиям 300x300 (из кэша)
+        hist1 = self.img1.color_hist
+        hist2 = self.img2.color_hist
         
         # Сравнение гистограмм
         method_map = {
@@ -113,17 +208,8 @@ class ImageComparator:
         Returns:
             int: расстояние Хэмминга
         """
-        hash_functions = {
-            'average': imagehash.average_hash,
-            'perceptual': imagehash.phash,
-            'difference': imagehash.dhash,
-            'wavelet': imagehash.whash
-        }
-        
-        hash_func = hash_functions.get(hash_type, imagehash.average_hash)
-        
-        hash1 = hash_func(self.img1_pil)
-        hash2 = hash_func(self.img2_pil)
+        hash1 = self.img1.image_hash(hash_type)
+        hash2 = self.img2.image_hash(hash_type)
         
         return hash1 - hash2  # Расстояние Хэмминга
     
@@ -138,23 +224,9 @@ class ImageComparator:
         Returns:
             int: количество хороших совпадений
         """
-        # Конвертация в grayscale
-        img1_gray = cv2.cvtColor(self.img1_cv, cv2.COLOR_BGR2GRAY)
-        img2_gray = cv2.cvtColor(self.img2_cv, cv2.COLOR_BGR2GRAY)
-        
-        # Выбор детектора признаков
-        if method == 'sift':
-            try:
-                detector = cv2.SIFT_create()
-            except AttributeError:
-                # Если SIFT недоступен, используем ORB
-                detector = cv2.ORB_create()
-        else:
-            detector = cv2.ORB_create()
-        
-        # Поиск ключевых точек и дескрипторов
-        kp1, des1 = detector.detectAndCompute(img1_gray, None)
-        kp2, des2 = detector.detectAndCompute(img2_gray, None)
+        # Ключевые точки и дескрипторы (grayscale и детектор — из кэша изображения)
+        kp1, des1 = self.img1.features(method)
+        kp2, des2 = self.img2.features(method)
         
         if des1 is None or des2 is None:
             return 0
@@ -187,8 +259,8 @@ class ImageComparator:
             float: косинусное сходство
         """
         # Приведение к одинаковому размеру
-        img1_resized = cv2.resize(self.img1_cv, (100, 100))
-        img2_resized = cv2.resize(self.img2_cv, (100, 100))
+        img1_resized = self.img1.bgr_100
+        img2_resized = self.img2.bgr_100
         
         # Преобразование в векторы
         vec1 = img1_resized.flatten()
@@ -249,32 +321,34 @@ class ImageComparator:
         return similarity_percentage
 
 
-def compare(image_path1: str, image_path2: str, threshold: float = 70.0):
+def compare(image1, image2, threshold: float = 70.0):
     """
     Устаревшая функция для обратной совместимости.
+    Принимает пути, содержимое файлов, массивы numpy или PreparedImage.
     Возвращает:
       match: bool (True если score >= threshold)
       score: float (0..100)
     """
-    comparator = ImageComparator(image_path1, image_path2)
+    comparator = ImageComparator(image1, image2)
     score = float(comparator.get_similarity_percentage())
     match = score >= float(threshold)
     return match, score
 
 
-def compare_faces(face_path1: str, face_path2: str) -> float:
+def compare_faces(face1, face2) -> float:
     """
     Улучшенное сравнение лиц с акцентом на точность.
     Использует комбинацию нескольких методов с оптимизированными весами.
     
     Args:
-        face_path1: путь к первому фото лица
-        face_path2: путь ко второму фото лица
+        face1: первое фото лица (путь, содержимое файла, массив numpy
+               или PreparedImage — тогда оно не обрабатывается повторно)
+        face2: второе фото лица (то же)
     
     Returns:
         float: процент схожести (0-100)
     """
-    comparator = ImageComparator(face_path1, face_path2)
+    comparator = ImageComparator(face1, face2)
     
     # Получаем метрики
     ssim_score = comparator.ssim_comparison()  # 0-1
@@ -313,4 +387,292 @@ def compare_faces(face_path1: str, face_path2: str) -> float:
     # Конвертируем в проценты
     similarity_percentage = max(0, min(100, weighted_score * 100))
     
-    return float(similarity_percentage)
\ No newline at end of file
+    return float(similarity_percentage)
+
+# === Матрица попарного сходства (аудит галереи: дубликаты, перепутанные фото) ===
+
+# Метрики матрицы: True — больше значит похожее, False — меньше значит похожее.
+# Это быстрые приближения, а не оценка compare_faces: SSIM и ORB во все пары
+# не входят (они не сводятся к матричным операциям), а cosine и mse считаются
+# по копиям 100x100, тогда как mse_comparison — по 300x300. Для отобранных
+# пар точную оценку даёт compare_faces / ImageComparator.
+MATRIX_METRICS = {
+    'hist': True,      # корреляция цветовых гистограмм 8x8x8 (как histogram_comparison)
+    'cosine': True,    # косинусное сходство пикселей 100x100 (в float64, без переполнения uint8)
+    'phash': False,    # расстояние Хэмминга pHash (0-64)
+    'dhash': False,    # расстояние Хэмминга dHash (0-64)
+    'mse': False,      # MSE пикселей 100x100 (не равно mse_comparison, там 300x300)
+}
+
+# Размер блока строк матрицы (одна задача пула)
+MATRIX_BLOCK = 256
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# Признаки, загруженные в процесс-исполнитель (см. _init_matrix_worker)
+_worker_features = None
+
+
+def image_features(image) -> dict:
+    """
+    Признаки одного изображения для similarity_matrix (считаются один раз).
+
+    Returns:
+        dict: hist (512, float32), pixels (30000, uint8), phash, dhash (int)
+    """
+    prepared = prepare_image(image)
+    return {
+        'hist': prepared.color_hist,
+        'pixels': prepared.bgr_100.reshape(-1),
+        'phash': perceptual_hash.pack_hash(prepared.image_hash('perceptual')),
+        'dhash': perceptual_hash.pack_hash(prepared.image_hash('difference')),
+    }
+
+
+def _safe_features(image):
+    """image_features или None, если изображение не декодируется."""
+    try:
+        return image_features(image)
+    except ValueError:
+        return None
+
+
+def stack_features(features: list) -> dict:
+    """Складывает признаки изображений в массивы для блочного расчёта."""
+    hist = np.stack([f['hist'] for f in features]).astype(np.float64)
+    hist -= hist.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(hist, axis=1, keepdims=True)
+    hist /= np.where(norms > 0, norms, 1)
+
+    pixels = np.stack([f['pixels'] for f in features])
+    sq_norm = np.einsum('ij,ij->i', pixels.astype(np.float64), pixels.astype(np.float64))
+    return {
+        'hist': hist,
+        'pixels': pixels,
+        'sq_norm': sq_norm,
+        'phash': np.array([f['phash'] for f in features], dtype=np.uint64),
+        'dhash': np.array([f['dhash'] for f in features], dtype=np.uint64),
+    }
+
+
+def _matrix_block(start: int, stop: int, metrics, features: dict = None,
+                  tile: int = MATRIX_BLOCK) -> dict:
+    """
+    Строки [start, stop) матрицы по всем метрикам — только столбцы j >= start
+    (остальное восстанавливается симметрией).
+
+    Столбцы идут плитками по tile: в float64 переводятся только строки блока
+    и одна плитка столбцов, а не все оставшиеся изображения.
+    """
+    features = features if features is not None else _worker_features
+    rows = slice(start, stop)
+    n = len(features['phash'])
+    block = {name: np.empty((stop - start, n - start), dtype=np.float32) for name in metrics}
+
+    if 'cosine' in metrics or 'mse' in metrics:
+        a = features['pixels'][rows].astype(np.float64)
+        sq_a = features['sq_norm'][rows][:, None]
+
+    for col in range(start, n, tile):
+        cols = slice(col, min(col + tile, n))
+        out = slice(col - start, cols.stop - start)
+
+        if 'hist' in metrics:
+            # Корреляция Пирсона = скалярное произведение центрированных нормированных векторов
+            block['hist'][:, out] = features['hist'][rows] @ features['hist'][cols].T
+
+        if 'cosine' in metrics or 'mse' in metrics:
+            gram = a @ features['pixels'][cols].astype(np.float64).T
+            sq_b = features['sq_norm'][cols][None, :]
+            if 'cosine' in metrics:
+                denom = np.sqrt(sq_a * sq_b)
+                block['cosine'][:, out] = np.divide(gram, denom, out=np.zeros_like(gram), where=denom > 0)
+            if 'mse' in metrics:
+                block['mse'][:, out] = np.maximum(sq_a + sq_b - 2 * gram, 0) / a.shape[1]
+
+        for name in ('phash', 'dhash'):
+            if name in metrics:
+                xor = np.bitwise_xor(features[name][rows][:, None], features[name][cols][None, :])
+                block[name][:, out] = perceptual_hash.popcount64(xor)
+
+    return block
+
+
+def _init_matrix_worker(features: dict):
+    global _worker_features
+    _worker_features = features
+
+
+def similarity_matrix(images, metrics=tuple(MATRIX_METRICS), workers: int = 0,
+                      block_size: int = MATRIX_BLOCK) -> dict:
+    """
+    Матрицы попарного сходства N x N.
+
+    Каждое изображение декодируется и обрабатывается один раз; матрица
+    считается блоками строк матричными операциями (по верхнему треугольнику,
+    нижний — симметрией).
+
+    Значения — метрики MATRIX_METRICS, а не compare_faces: без SSIM и ORB,
+    cosine и mse — по 100x100 (mse_comparison — по 300x300).
+
+    Args:
+        images: пути, содержимое файлов, массивы numpy или PreparedImage;
+                либо уже готовые признаки (результат image_features)
+        metrics: имена из MATRIX_METRICS
+        workers: число процессов для извлечения признаков и блоков (0 — в текущем)
+        block_size: строк матрицы на одну задачу
+
+    Returns:
+        dict: метрика -> матрица N x N (float32)
+    """
+    metrics = tuple(metrics)
+    unknown = [m for m in metrics if m not in MATRIX_METRICS]
+    if unknown:
+        raise ValueError(f"Неизвестные метрики: {', '.join(unknown)}")
+
+    images = list(images)
+    n = len(images)
+    result = {m: np.zeros((n, n), dtype=np.float32) for m in metrics}
+    if n == 0:
+        return result
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    try:
+        if all(isinstance(image, dict) for image in images):
+            features = images
+        elif pool is not None:
+            features = list(pool.map(image_features, images, chunksize=16))
+        else:
+            features = [image_features(image) for image in images]
+        stacked = stack_features(features)
+
+        starts = range(0, n, block_size)
+        if pool is not None:
+            pool.shutdown(wait=True)
+            pool = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_matrix_worker, initargs=(stacked,)
+            )
+            futures = [pool.submit(_matrix_block, s, min(s + block_size, n), metrics) for s in starts]
+            blocks = (future.result() for future in futures)
+        else:
+            blocks = (_matrix_block(s, min(s + block_size, n), metrics, stacked) for s in starts)
+
+        for start, block in zip(starts, blocks):
+            stop = min(start + block_size, n)
+            for name, values in block.items():
+                result[name][start:stop, start:] = values
+                result[name][start:, start:stop] = values.T
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    return result
+
+
+def top_pairs(matrix: np.ndarray, metric: str, k: int = 20):
+    """
+    k самых похожих пар (i < j) по матрице метрики.
+
+    Returns:
+        список (i, j, value), от самой подозрительной пары
+    """
+    n = len(matrix)
+    i, j = np.triu_indices(n, k=1)
+    values = matrix[i, j]
+    if MATRIX_METRICS[metric]:
+        values = -values
+    k = min(k, len(values))
+    if k == 0:
+        return []
+    best = np.argpartition(values, k - 1)[:k]
+    best = best[np.argsort(values[best], kind='stable')]
+    return [(int(i[b]), int(j[b]), float(matrix[i[b], j[b]])) for b in best]
+
+
+def _load_directory(path: str):
+    """(метки, пути) изображений каталога."""
+    names = sorted(
+        name for name in os.listdir(path)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    return names, [os.path.join(path, name) for name in names]
+
+
+def _load_participants(db_path: str):
+    """(логины, фото) участников из таблицы participants."""
+    db.DB = db_path
+    rows = db.read("SELECT login, photo_blob FROM participants ORDER BY id")
+    return [row['login'] for row in rows], [bytes(row['photo_blob']) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Матрица попарного сходства фото (поиск дубликатов и перепутанных участников)"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="каталог с фото")
+    source.add_argument("--db", help="БД SQLite: фото из таблицы participants")
+    parser.add_argument("--out", default="similarity", help="каталог для результатов")
+    parser.add_argument("--metrics", nargs="+", default=list(MATRIX_METRICS), choices=list(MATRIX_METRICS))
+    parser.add_argument("--rank", default="phash", choices=list(MATRIX_METRICS),
+                        help="метрика для списка подозрительных пар")
+    parser.add_argument("--top", type=int, default=20, help="сколько пар вывести")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов (0 — без пула)")
+    parser.add_argument("--csv", action="store_true", help="также сохранить матрицы в CSV")
+    args = parser.parse_args()
+
+    if args.rank not in args.metrics:
+        args.metrics.append(args.rank)
+
+    labels, images = _load_directory(args.dir) if args.dir else _load_participants(args.db)
+    if len(labels) < 2:
+        print("Нужно хотя бы два изображения")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    features = list(map(_safe_features, images)) if args.workers <= 0 else None
+    if features is None:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            features = list(pool.map(_safe_features, images, chunksize=16))
+
+    broken = [label for label, f in zip(labels, features) if f is None]
+    if broken:
+        print(f"Не удалось прочитать ({len(broken)}): {', '.join(broken)}")
+    labels = [label for label, f in zip(labels, features) if f is not None]
+    features = [f for f in features if f is not None]
+    t1 = time.perf_counter()
+
+    matrices = similarity_matrix(features, metrics=args.metrics, workers=args.workers)
+    t2 = time.perf_counter()
+
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, "labels.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(labels) + "\n")
+    for name, matrix in matrices.items():
+        np.save(os.path.join(args.out, f"{name}.npy"), matrix)
+        if args.csv:
+            with open(os.path.join(args.out, f"{name}.csv"), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([""] + labels)
+                for label, row in zip(labels, matrix):
+                    writer.writerow([label] + [f"{v:.6g}" for v in row])
+
+    pairs = top_pairs(matrices[args.rank], args.rank, args.top)
+    names = list(matrices)
+    with open(os.path.join(args.out, "top_pairs.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["a", "b"] + names)
+        for i, j, _ in pairs:
+            writer.writerow([labels[i], labels[j]] + [f"{matrices[m][i, j]:.6g}" for m in names])
+
+    print(f"Изображений: {len(labels)}, признаки: {t1 - t0:.1f} с, матрица: {t2 - t1:.1f} с")
+    print("Метрики матрицы — быстрые приближения, не compare_faces: SSIM и ORB не считаются, "
+          "cosine и mse — по 100x100 (mse_comparison — по 300x300)")
+    print(f"Результаты: {os.path.abspath(args.out)}")
+    print(f"\nСамые похожие пары ({args.rank}):")
+    for i, j, value in pairs:
+        print(f"  {labels[i]:<30} {labels[j]:<30} {value:.4g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-function addParticipant() {
+function addParticipant(force = false) {
   const login = document.getElementById("p_login").value.trim();
   const name = document.getElementById("p_name").value.trim();
   const fileInput = document.getElementById("p_photo");
@@ -16,6 +16,7 @@ function addParticipant() {
   fd.append("login", login);
   fd.append("name", name);
   fd.append("photo", fileInput.files[0]);
+  if (force) fd.append("force", "1");
 
   fetch("/admin/add_participant", { method: "POST", body: fd })
     .then(async (r) => {
@@ -41,7 +42,20 @@ function addParticipant() {
           hint.style.display = "block";
         }
       } else {
-        if (d.code === "NO_FACE") {
+        if (d.code === "DUPLICATE_FACE") {
+          const list = (d.matches || [])
+            .map((m) => `• ${m.login}${m.name ? " (" + m.name + ")" : ""} — ${m.score}%`)
+            .join("\n");
+          if (
+            confirm(
+              "Похоже, этот человек уже зарегистрирован:\n\n" +
+                list +
+                "\n\nВсё равно добавить участника?",
+            )
+          ) {
+            addParticipant(true);
+          }
+        } else if (d.code === "NO_FACE") {
           alert(
             "Ошибка: на фото не обнаружено лицо человека.\n\n" + (d.msg || ""),
           );
@@ -52,6 +66,42 @@ function addParticipant() {
     });
 }
 
+function bulkEnroll() {
+  const csvInput = document.getElementById("bulk_csv");
+  const archiveInput = document.getElementById("bulk_archive");
+  if (!csvInput.files.length || !archiveInput.files.length) {
+    alert("Нужны CSV и ZIP с фото");
+    return;
+  }
+
+  const fd = new FormData();
+  fd.append("csv", csvInput.files[0]);
+  fd.append("archive", archiveInput.files[0]);
+  if (document.getElementById("bulk_force").checked) fd.append("force", "1");
+  if (document.getElementById("bulk_dry_run").checked) fd.append("dry_run", "1");
+
+  const out = document.getElementById("bulk_report");
+  out.innerText = "Обработка...";
+  fetch("/admin/bulk_enroll", { method: "POST", body: fd })
+    .then((r) => r.json())
+    .then((d) => {
+      if (d.status !== "ok") {
+        out.innerText = "Ошибка: " + (d.msg || "unknown");
+        return;
+      }
+      const errors = d.rows
+        .filter((row) => row.status === "error")
+        .map((row) => `строка ${row.row}: ${row.login || "-"} — ${row.code}: ${row.msg}`);
+      const done = d.dry_run ? `Проверено: ${d.total - d.failed}` : `Добавлено: ${d.added}`;
+      out.innerText =
+        `${done} из ${d.total}, ошибок: ${d.failed} (${d.elapsed_s} с, ${d.photos_per_min} фото/мин)` +
+        (errors.length ? "\n\n" + errors.join("\n") : "");
+    })
+    .catch((e) => {
+      out.innerText = "Ошибка: " + e;
+    });
+}
+
 function addEvent() {
   fetch("/admin/add_event", {
     method: "POST",
@@ -69,11 +119,45 @@ function addEvent() {
     });
 }
 
-function loadAttendance() {
-  fetch("/admin/get_attendance")
+// Журнал читается страницами: next_after_id — начало следующей
+let attendanceRecords = [];
+let attendanceAfterId = null;
+
+function loadAttendance(more = false) {
+  if (!more) {
+    attendanceRecords = [];
+    attendanceAfterId = null;
+  }
+  const params = new URLSearchParams();
+  if (attendanceAfterId !== null) params.append("after_id", attendanceAfterId);
+
+  fetch(`/admin/get_attendance?${params.toString()}`)
+    .then((r) => r.json())
+    .then((data) => {
+      if (data.status !== "ok") {
+        alert("Ошибка: " + (data.msg || "unknown"));
+        return;
+      }
+      attendanceRecords = attendanceRecords.concat(data.records);
+      attendanceAfterId = data.next_after_id;
+      document.getElementById("log").innerText = JSON.stringify(attendanceRecords, null, 2);
+      document.getElementById("log_more").style.display = attendanceAfterId === null ? "none" : "inline-block";
+    });
+}
+
+function loadGalleryStats() {
+  fetch("/admin/gallery_stats")
     .then((r) => r.json())
     .then((data) => {
-      document.getElementById("log").innerText = JSON.stringify(data, null, 2);
+      document.getElementById("gallery_stats").innerText = JSON.stringify(data, null, 2);
+    });
+}
+
+function loadDetectorStats() {
+  fetch("/admin/detector_stats")
+    .then((r) => r.json())
+    .then((data) => {
+      document.getElementById("detector_stats").innerText = JSON.stringify(data, null, 2);
     });
 }
 
@@ -89,6 +173,15 @@ function exportAttendance() {
   if (dateFrom) params.append("date_from", dateFrom);
   if (dateTo) params.append("date_to", dateTo);
 
+  // NDJSON/CSV сервер отдаёт потоком как вложение — браузер сразу начинает загрузку
+  const format = document.getElementById("export_format").value;
+  if (format !== "json") {
+    params.append("format", format);
+    if (document.getElementById("export_gzip").checked) params.append("gzip", "1");
+    window.location.href = `/admin/export_attendance?${params.toString()}`;
+    return;
+  }
+
   fetch(`/admin/export_attendance?${params.toString()}`)
     .then((r) => r.json())
     .then((data) => {
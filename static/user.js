@@ -177,44 +177,102 @@ async function register() {
       body: formData,
     });
 
-    const data = await response.json();
+    let data = await response.json();
 
-    // Обработка результата
-    if (data.status === "registered") {
-      resultDiv.innerHTML = `
-        <span class="success">✅ Успешно зарегистрированы!</span><br>
-        <strong>Логин:</strong> ${data.login}<br>
-        <strong>Имя:</strong> ${data.name || "не указано"}<br>
-        <strong>Совпадение:</strong> ${Math.round(data.score)}%
-      `;
-    } else if (data.status === "already_registered") {
-      resultDiv.innerHTML = `
-        <span class="warning">⚠️ Вы уже зарегистрированы на это мероприятие</span><br>
-        <strong>Логин:</strong> ${data.login}<br>
-        <strong>Совпадение:</strong> ${Math.round(data.score)}%
-      `;
-    } else if (data.status === "not_found") {
-      const msg = data.best_candidate
-        ? `Ближайший кандидат: ${data.best_candidate} (${Math.round(data.best_score)}%)`
-        : "В базе нет участников";
-      resultDiv.innerHTML = `
-        <span class="error">❌ Вас нет в базе участников</span><br>
-        ${msg}<br>
-        <em>Обратитесь к администратору для добавления в систему</em>
-      `;
-    } else if (data.status === "bad_photo") {
-      resultDiv.innerHTML = `
-        <span class="error">❌ Фото не подходит</span><br>
-        ${data.msg || "На фото должно быть ровно одно лицо"}
-      `;
-    } else {
-      resultDiv.innerHTML = `
-        <span class="error">❌ Ошибка: ${data.msg || "Неизвестная ошибка"}</span>
-      `;
+    // Асинхронный режим: фото в очереди, ждём результат задачи
+    if (data.status === "queued") {
+      resultDiv.innerHTML =
+        '<span class="info">⏳ Фото в очереди на проверку...</span>';
+      data = await waitForJob(data);
     }
+
+    showResult(data);
   } catch (err) {
     resultDiv.innerHTML = `
       <span class="error">❌ Ошибка сети: ${err.message}</span>
     `;
   }
 }
+
+// Ожидание результата асинхронной регистрации: SSE, при ошибке — опрос статуса
+function waitForJob(job) {
+  return new Promise((resolve, reject) => {
+    if (window.EventSource) {
+      const source = new EventSource(job.events_url);
+      const resultDiv = document.getElementById("result");
+
+      source.addEventListener("status", (e) => {
+        const data = JSON.parse(e.data);
+        if (data.status === "running") {
+          resultDiv.innerHTML =
+            '<span class="info">⏳ Идет проверка и регистрация...</span>';
+        }
+      });
+      source.addEventListener("result", (e) => {
+        source.close();
+        resolve(JSON.parse(e.data));
+      });
+      source.onerror = () => {
+        source.close();
+        pollJob(job.status_url).then(resolve, reject);
+      };
+    } else {
+      pollJob(job.status_url).then(resolve, reject);
+    }
+  });
+}
+
+// Опрос статуса задачи, пока она в очереди или выполняется
+async function pollJob(statusUrl, intervalMs = 700, maxAttempts = 120) {
+  for (let i = 0; i < maxAttempts; i++) {
+    const response = await fetch(statusUrl);
+    const data = await response.json();
+    if (data.status !== "queued" && data.status !== "running") {
+      return data;
+    }
+    await new Promise((r) => setTimeout(r, intervalMs));
+  }
+  return { status: "error", msg: "Превышено время ожидания результата" };
+}
+
+// Отображение результата регистрации
+function showResult(data) {
+  const resultDiv = document.getElementById("result");
+
+  if (data.status === "registered") {
+    resultDiv.innerHTML = `
+      <span class="success">✅ Успешно зарегистрированы!</span><br>
+      <strong>Логин:</strong> ${data.login}<br>
+      <strong>Имя:</strong> ${data.name || "не указано"}<br>
+      <strong>Совпадение:</strong> ${Math.round(data.score)}%
+    `;
+  } else if (data.status === "already_registered") {
+    resultDiv.innerHTML = `
+      <span class="warning">⚠️ Вы уже зарегистрированы на это мероприятие</span><br>
+      <strong>Логин:</strong> ${data.login}<br>
+      <strong>Совпадение:</strong> ${Math.round(data.score)}%
+    `;
+  } else if (data.status === "not_found") {
+    const msg = data.best_candidate
+      ? `Ближайший кандидат: ${data.best_candidate} (${Math.round(data.best_score)}%)`
+      : "В базе нет участников";
+    resultDiv.innerHTML = `
+      <span class="error">❌ Вас нет в базе участников</span><br>
+      ${msg}<br>
+      <em>Обратитесь к администратору для добавления в систему</em>
+    `;
+  } else if (data.status === "bad_photo") {
+    resultDiv.innerHTML = `
+      <span class="error">❌ Фото не подходит</span><br>
+      ${data.msg || "На фото должно быть ровно одно лицо"}
+    `;
+  } else if (data.status === "busy" || data.status === "expired") {
+    resultDiv.innerHTML = `
+      <span class="warning">⚠️ Сервер занят, попробуйте еще раз через несколько секунд</span>
+    `;
+  } else {
+    resultDiv.innerHTML = `
+      <span class="error">❌ Ошибка: ${data.msg || "Неизвестная ошибка"}</span>
+    `;
+  }
+}
@@ -0,0 +1,381 @@
+"""
+Регистрация по видеопотоку камеры на входе (check-in без отдельных фото).
+
+Поток — последовательность JPEG-кадров: MJPEG (multipart/x-mixed-replace),
+multipart/form-data или просто JPEG подряд (chunked). Кадры выделяются по
+маркерам начала и конца JPEG (SOI FFD8 / EOI FFD9), всё между кадрами
+(границы и заголовки multipart) пропускается. Внутри сжатых данных JPEG
+байт FF всегда экранирован, поэтому EOI встречается только в конце кадра
+(кадры с EXIF-миниатюрой камеры MJPEG не присылают).
+
+На каждом кадре:
+  - детекция Хаара — только каждый STREAM_DETECT_EVERY-й кадр или сразу
+    после того, как слежение потеряло лицо;
+  - между детекциями бокс лица ведётся по маленькому образцу лица
+    (нормированная корреляция в окрестности прежнего бокса);
+  - детекции сопоставляются с треками по IoU;
+  - трек, подтверждённый STREAM_MIN_HITS детекциями, сравнивается с
+    галереей ОДИН раз — в фоновом потоке, чтобы не задерживать кадры.
+
+Один человек в кадре стоит одного 1:N сравнения, а не одного на кадр.
+Присутствие записывается один раз на участника и мероприятие: повторно
+узнанный в том же потоке участник получает статус duplicate без записи,
+отмеченный раньше (другим потоком или через /register) — already_registered.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+import attendance
+import checkin
+import config
+import face_recognition_module
+import gallery_cache
+import metrics
+from face_detection import Box, FaceDetection
+
+logger = logging.getLogger(__name__)
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+# Сколько байт читать из потока за раз
+CHUNK_SIZE = 64 * 1024
+
+# Кадр длиннее этого без маркера конца считается битым и отбрасывается
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+
+# Сторона образца лица для слежения между детекциями, px
+TRACK_PATCH = 32
+
+# Окрестность прежнего бокса, в которой ищется лицо (доля от стороны)
+TRACK_SEARCH = 0.5
+
+# Минимальная корреляция с образцом: ниже — лицо потеряно
+TRACK_MIN_SCORE = 0.5
+
+
+def iter_jpeg_frames(
+    read: Callable[[int], bytes],
+    chunk_size: int = CHUNK_SIZE,
+    max_frame_bytes: int = MAX_FRAME_BYTES,
+) -> Iterator[bytes]:
+    """
+    Выделяет JPEG-кадры из потока байт.
+
+    Args:
+        read: функция чтения (например, request.stream.read); b"" — конец потока
+    """
+    buf = bytearray()
+    start = -1  # начало текущего кадра в buf
+    scan = 0    # откуда продолжать поиск маркера
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+
+        while True:
+            if start < 0:
+                start = buf.find(JPEG_SOI, scan)
+                if start < 0:
+                    # Между кадрами; последний байт может оказаться началом маркера
+                    del buf[:-1]
+                    scan = 0
+                    break
+                scan = start + 2
+
+            end = buf.find(JPEG_EOI, scan)
+            if end < 0:
+                if len(buf) - start > max_frame_bytes:
+                    logger.warning("stream: кадр длиннее %d байт без конца JPEG, отброшен", max_frame_bytes)
+                    buf.clear()
+                    start, scan = -1, 0
+                else:
+                    scan = max(start + 2, len(buf) - 1)
+                break
+
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+            start, scan = -1, 0
+
+
+def iou(a: Box, b: Box) -> float:
+    """Отношение площади пересечения боксов (x, y, w, h) к площади объединения."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class Track:
+    """Лицо, которое ведётся от кадра к кадру."""
+
+    def __init__(self, track_id: int, box: Box, gray: np.ndarray, frame: int):
+        self.id = track_id
+        self.box = box
+        self.hits = 1        # сколько детекций подтвердили трек
+        self.misses = 0      # детекций подряд, где трек не нашёлся
+        self.first_frame = frame
+        self.last_frame = frame
+        self.matched = False  # отправлен на 1:N сравнение
+        self.patch = _patch(gray, box)
+
+    def hit(self, box: Box, gray: np.ndarray, frame: int):
+        """Трек подтверждён детекцией: новый бокс и образец лица."""
+        self.box = box
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame
+        self.patch = _patch(gray, box)
+
+    def follow(self, gray: np.ndarray) -> bool:
+        """
+        Сдвигает бокс к месту, где образец лица коррелирует лучше всего.
+
+        Returns:
+            False, если лицо потеряно (бокс не меняется)
+        """
+        x, y, w, h = self.box
+        scale = TRACK_PATCH / float(w)
+        margin = int(TRACK_SEARCH * w)
+        x1, y1 = max(0, x - margin), max(0, y - margin)
+        x2, y2 = min(gray.shape[1], x + w + margin), min(gray.shape[0], y + h + margin)
+
+        size = (int(round((x2 - x1) * scale)), int(round((y2 - y1) * scale)))
+        if size[0] < self.patch.shape[1] or size[1] < self.patch.shape[0]:
+            return False
+        window = cv2.resize(gray[y1:y2, x1:x2], size, interpolation=cv2.INTER_AREA)
+
+        result = cv2.matchTemplate(window, self.patch, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (px, py) = cv2.minMaxLoc(result)
+        if score < TRACK_MIN_SCORE:
+            return False
+
+        self.box = (x1 + int(round(px / scale)), y1 + int(round(py / scale)), w, h)
+        return True
+
+
+def _patch(gray: np.ndarray, box: Box) -> np.ndarray:
+    """Уменьшенный образец лица для слежения."""
+    x, y, w, h = box
+    size = (TRACK_PATCH, max(1, int(round(h * TRACK_PATCH / float(w)))))
+    return cv2.resize(gray[y:y + h, x:x + w], size, interpolation=cv2.INTER_AREA)
+
+
+class StreamSession:
+    """
+    Состояние одного потока: треки, фоновые 1:N сравнения и уже узнанные
+    участники. Кадры подаются по одному (process), в конце — close().
+    """
+
+    def __init__(
+        self,
+        event_id: int,
+        detect_every: Optional[int] = None,
+        min_hits: Optional[int] = None,
+        max_misses: Optional[int] = None,
+        min_iou: Optional[float] = None,
+    ):
+        self.event_id = event_id
+        self.detect_every = max(1, detect_every or config.STREAM_DETECT_EVERY)
+        self.min_hits = max(1, min_hits or config.STREAM_MIN_HITS)
+        self.max_misses = config.STREAM_MAX_MISSES if max_misses is None else max_misses
+        self.min_iou = config.STREAM_MIN_IOU if min_iou is None else min_iou
+
+        self.recognizer = face_recognition_module.get_recognizer()
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._lost = False  # слежение потеряло лицо — детекция на следующем кадре
+
+        # 1:N сравнения — в одном фоновом потоке, по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-match")
+        self._pending: List[Future] = []
+        self._seen_lock = threading.Lock()
+        self._seen = set()  # participant_id, уже узнанные в этом потоке
+
+        self._started = time.perf_counter()
+        self._frames = 0
+        self._bad_frames = 0
+        self._detections = 0
+        self._tracks_total = 0
+        self._matches = 0
+        self._frame_seconds = 0.0
+
+    def process(self, jpeg: bytes) -> List[dict]:
+        """
+        Обрабатывает один кадр.
+
+        Returns:
+            результаты 1:N сравнений, завершившихся к этому моменту
+        """
+        t0 = time.perf_counter()
+        with metrics.timer("stream_frame"):
+            with metrics.timer("decode"):
+                image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                self._bad_frames += 1
+            else:
+                self._track(image, self._frames)
+            self._frames += 1
+        self._frame_seconds += time.perf_counter() - t0
+        return self._collect(wait=False)
+
+    def _track(self, image: np.ndarray, frame: int):
+        if self._lost or not self.tracks or frame % self.detect_every == 0:
+            detection = self.recognizer.detect_image(image)
+            self._detections += 1
+            self._lost = False
+            self._update(detection, frame)
+            return
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        for track in self.tracks:
+            if not track.follow(gray):
+                self._lost = True
+
+    def _update(self, detection: FaceDetection, frame: int):
+        """Сопоставляет детекции с треками (жадно по IoU) и запускает сравнения."""
+        pairs = sorted(
+            ((iou(track.box, box), t, d)
+             for t, track in enumerate(self.tracks)
+             for d, box in enumerate(detection.faces)),
+            reverse=True,
+        )
+        used_tracks, used_boxes = set(), set()
+        for overlap, t, d in pairs:
+            if overlap < self.min_iou:
+                break
+            if t in used_tracks or d in used_boxes:
+                continue
+            used_tracks.add(t)
+            used_boxes.add(d)
+            self.tracks[t].hit(detection.faces[d], detection.gray, frame)
+
+        alive = []
+        for t, track in enumerate(self.tracks):
+            if t not in used_tracks:
+                track.misses += 1
+            if track.misses <= self.max_misses:
+                alive.append(track)
+        self.tracks = alive
+
+        for d, box in enumerate(detection.faces):
+            if d not in used_boxes:
+                self.tracks.append(Track(self._next_id, box, detection.gray, frame))
+                self._next_id += 1
+                self._tracks_total += 1
+
+        for track in self.tracks:
+            if not track.matched and track.misses == 0 and track.hits >= self.min_hits:
+                track.matched = True
+                self._matches += 1
+                face = detection.face_roi(track.box).copy()
+                self._pending.append(self._executor.submit(self._match, track.id, track.box, frame, face))
+
+    def _match(self, track_id: int, box: Box, frame: int, face: np.ndarray) -> dict:
+        """1:N сравнение лица трека и запись присутствия (фоновый поток)."""
+        result = {"track": track_id, "frame": frame, "box": [int(v) for v in box]}
+
+        with metrics.timer("template"):
+            template = self.recognizer.build_template(face)
+        with metrics.timer("gallery"):
+            participants, gallery = gallery_cache.get_gallery_cache().get()
+
+        if not participants:
+            result.update({"status": "not_found", "msg": "no participants in db"})
+            metrics.inc("stream_faces", status=result["status"])
+            return result
+
+        order, scores = checkin.match_template(template, participants, gallery)
+        found = checkin.best_candidate(participants, order, scores)
+        if found is None:
+            result.update({"status": "not_found", "best_candidate": None, "best_score": None})
+            metrics.inc("stream_faces", status=result["status"])
+            return result
+        best, score = found
+        if score < checkin.THRESHOLD:
+            result.update({"status": "not_found", "best_candidate": best["login"], "best_score": score})
+            metrics.inc("stream_faces", status=result["status"])
+            return result
+
+        result.update({"login": best["login"], "name": best["name"], "score": score})
+        participant_id = best["participant_id"]
+        with self._seen_lock:
+            duplicate = participant_id in self._seen
+            self._seen.add(participant_id)
+
+        if duplicate:
+            result["status"] = "duplicate"
+        else:
+            row = (participant_id, self.event_id, *attendance.stamp(), score)
+            with metrics.timer("db_write"):
+                existing = checkin.record_attendance(self.event_id, [row])
+            result["status"] = "already_registered" if participant_id in existing else "registered"
+
+        metrics.inc("stream_faces", status=result["status"])
+        return result
+
+    def _collect(self, wait: bool) -> List[dict]:
+        """Результаты завершившихся сравнений (wait — дождаться всех)."""
+        results, pending = [], []
+        for future in self._pending:
+            if wait or future.done():
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.exception("stream: сравнение трека упало")
+                    results.append({"status": "error", "msg": f"match failed: {e}"})
+            else:
+                pending.append(future)
+        self._pending = pending
+        return results
+
+    def close(self) -> List[dict]:
+        """Дожидается оставшихся сравнений и освобождает фоновый поток."""
+        results = self._collect(wait=True)
+        self._executor.shutdown(wait=True)
+        return results
+
+    def stats(self) -> dict:
+        """Счётчики потока: кадры, детекции, треки, сравнения и скорость обработки."""
+        elapsed = time.perf_counter() - self._started
+        return {
+            "frames": self._frames,
+            "bad_frames": self._bad_frames,
+            "detections": self._detections,
+            "tracks": self._tracks_total,
+            "matches": self._matches,
+            "recognized": len(self._seen),
+            "elapsed_s": round(elapsed, 3),
+            # Скорость обработки кадров (без ожидания данных от камеры)
+            "fps": round(self._frames / self._frame_seconds, 1) if self._frame_seconds else 0.0,
+        }
+
+
+def run_stream(event_id: int, read: Callable[[int], bytes]) -> Iterator[dict]:
+    """
+    Обрабатывает поток кадров целиком: результаты сравнений по мере
+    готовности, последним — {"status": "done", ...stats}.
+    """
+    session = StreamSession(event_id)
+    try:
+        for jpeg in iter_jpeg_frames(read):
+            yield from session.process(jpeg)
+    finally:
+        # И при обрыве соединения: фоновые сравнения дописывают присутствие
+        results = session.close()
+    yield from results
+    stats = session.stats()
+    logger.info("stream: мероприятие %d, %s", event_id, stats)
+    yield {"status": "done", **stats}